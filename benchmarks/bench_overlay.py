@@ -0,0 +1,201 @@
+"""
+Stage-level benchmark for overlay.process_image.
+
+Times each stage of the pipeline separately on a deterministic synthetic
+corpus at real sensor resolutions and writes machine-readable JSON, so
+results can be compared across commits on a plain Linux box:
+
+    python benchmarks/bench_overlay.py --output before.json
+    git checkout <other commit>
+    python benchmarks/bench_overlay.py --output after.json --compare before.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Run from a checkout without installing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL
+from PIL import Image, ImageOps
+from capturesync import numpy_engine, overlay
+
+from corpus import SENSORS, generate_corpus
+
+DEFAULT_CORPUS_DIR = os.path.join(tempfile.gettempdir(), "capturesync_bench_corpus")
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def run_stages(image_path, landscape_overlay, portrait_overlay):
+    """
+    One pass through the same steps overlay.process_image takes, timed separately.
+    Returns {stage: seconds}.
+    """
+    timings = {}
+
+    def open_image():
+        img = Image.open(image_path)
+        img.load()
+        return img
+    img, timings["open"] = _timed(open_image)
+
+    img, timings["exif_transpose"] = _timed(lambda: ImageOps.exif_transpose(img))
+
+    width, height = img.size
+    overlay_path = landscape_overlay if width >= height else portrait_overlay
+
+    def resize_overlay():
+        with Image.open(overlay_path) as ov:
+            return ov.resize((width, height), Image.Resampling.LANCZOS)
+    overlay_resized, timings["overlay_resize"] = _timed(resize_overlay)
+
+    def rgba_convert():
+        return img.convert("RGBA"), overlay_resized.convert("RGBA")
+    (img_rgba, overlay_rgba), timings["rgba_convert"] = _timed(rgba_convert)
+
+    _, timings["alpha_composite"] = _timed(lambda: img_rgba.alpha_composite(overlay_rgba))
+
+    final_img, timings["rgb_convert"] = _timed(lambda: img_rgba.convert("RGB"))
+
+    # Region path used by process_image: only the non-transparent parts of
+    # the overlay are blended, straight into the RGB photo
+    prepared, timings["region_prepare"] = _timed(lambda: overlay.PreparedOverlay(overlay_rgba))
+    img_rgb = img if img.mode == "RGB" else img.convert("RGB")
+    _, timings["region_composite"] = _timed(lambda: prepared.composite_onto(img_rgb))
+
+    if numpy_engine.available():
+        numpy_engine.for_prepared(prepared)
+        _, timings["numpy_composite"] = _timed(lambda: numpy_engine.composite(img_rgb, prepared))
+        # Per-frame cost when four same-size burst frames are blended together
+        burst = [img_rgb.copy() for _ in range(4)]
+        _, seconds = _timed(lambda: numpy_engine.composite_batch(burst, prepared))
+        timings["numpy_batch4_per_frame"] = seconds / len(burst)
+
+    def save():
+        buf = io.BytesIO()
+        final_img.save(buf, "JPEG", quality=90, optimize=True)
+        return buf
+    _, timings["save_optimize"] = _timed(save)
+
+    return timings
+
+def run_end_to_end(image_path, landscape_overlay, portrait_overlay, output_folder, **kwargs):
+    """
+    The real process_image call with a warm overlay cache.
+    """
+    def call():
+        return overlay.process_image(image_path, landscape_overlay, portrait_overlay, output_folder, **kwargs)
+    call()
+    _, seconds = _timed(call)
+    return seconds
+
+def summarize(samples):
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.mean(samples),
+        "runs": len(samples),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def compare(current, baseline_path):
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    old = {r["image"]: r for r in baseline["results"]}
+
+    print(f"\nvs {baseline_path} ({baseline['meta'].get('commit')})")
+    for result in current["results"]:
+        before = old.get(result["image"])
+        if not before:
+            continue
+        parts = []
+        for stage, stats in result["stages"].items():
+            if stage in before["stages"]:
+                ratio = stats["median"] / max(before["stages"][stage]["median"], 1e-9)
+                parts.append(f"{stage} x{ratio:.2f}")
+        print(f"  {result['image']}: " + ", ".join(parts))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sensors", default="24mp,45mp,61mp", help=f"Comma separated, from {', '.join(SENSORS)}")
+    parser.add_argument("--variants", default="landscape,portrait,square,exif_rotated")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per image")
+    parser.add_argument("--corpus-dir", default=DEFAULT_CORPUS_DIR, help="Generated once and reused")
+    parser.add_argument("--max-long-edge", type=int, help="Also time process_image with this output size cap")
+    parser.add_argument("--output", help="Write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="Earlier JSON results to print per-stage ratios against")
+    args = parser.parse_args(argv)
+
+    paths, landscape_overlay, portrait_overlay = generate_corpus(
+        args.corpus_dir, sensors=args.sensors.split(","), variants=args.variants.split(","))
+
+    results = []
+    with tempfile.TemporaryDirectory() as output_folder:
+        for path in paths:
+            stage_samples = {}
+            for _ in range(args.repeat):
+                for stage, seconds in run_stages(path, landscape_overlay, portrait_overlay).items():
+                    stage_samples.setdefault(stage, []).append(seconds)
+            stage_samples["process_image"] = [
+                run_end_to_end(path, landscape_overlay, portrait_overlay, output_folder)
+                for _ in range(args.repeat)
+            ]
+            if args.max_long_edge:
+                stage_samples["process_image_capped"] = [
+                    run_end_to_end(path, landscape_overlay, portrait_overlay, output_folder,
+                                   max_long_edge=args.max_long_edge)
+                    for _ in range(args.repeat)
+                ]
+
+            with Image.open(path) as img:
+                megapixels = img.width * img.height / 1e6
+            results.append({
+                "image": os.path.basename(path),
+                "megapixels": round(megapixels, 1),
+                "stages": {stage: summarize(samples) for stage, samples in stage_samples.items()},
+            })
+            print(f"{os.path.basename(path)}: process_image "
+                  f"{results[-1]['stages']['process_image']['median'] * 1000:.0f} ms", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "max_long_edge": args.max_long_edge,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        compare(report, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Deterministic synthetic camera corpus for the benchmarks.
+
+Images are generated from a seeded RNG (no camera or sample files needed),
+so the same command produces the same pixels on every machine/commit.
+"""
+import io
+import os
+import random
+from PIL import Image, ImageDraw
+
+# Real sensor resolutions (landscape, pixels). 2mp is only for quick smoke runs.
+SENSORS = {
+    "2mp": (1800, 1200),
+    "24mp": (6000, 4000),
+    "45mp": (8256, 5504),
+    "61mp": (9504, 6336),
+}
+
+# EXIF Orientation tag
+ORIENTATION_TAG = 0x0112
+
+def _randbytes(rng, n):
+    # random.Random.randbytes is 3.9+
+    return rng.getrandbits(n * 8).to_bytes(n, "little")
+
+def _texture(rng, size):
+    """
+    Smooth low-frequency colour field plus tiled fine noise.
+    Roughly what a real photo costs to JPEG-encode (pure noise is far worse,
+    flat colour far better).
+    """
+    width, height = size
+    coarse_size = (max(1, width // 64), max(1, height // 64))
+    coarse = Image.frombytes("RGB", coarse_size, _randbytes(rng, coarse_size[0] * coarse_size[1] * 3))
+    img = coarse.resize(size, Image.Resampling.BICUBIC)
+
+    tile = Image.frombytes("RGB", (256, 256), _randbytes(rng, 256 * 256 * 3))
+    noise = Image.new("RGB", size)
+    for y in range(0, height, 256):
+        for x in range(0, width, 256):
+            noise.paste(tile, (x, y))
+    return Image.blend(img, noise, 0.12)
+
+def make_photo(sensor, variant, seed=0):
+    """
+    variant: landscape | portrait | square | exif_rotated
+    exif_rotated is stored landscape with Orientation=6, i.e. a portrait shot
+    that exif_transpose has to rotate.
+    Returns (PIL image, exif bytes or None).
+    """
+    width, height = SENSORS[sensor]
+    rng = random.Random(f"{sensor}:{variant}:{seed}")
+    exif = None
+
+    if variant == "landscape":
+        size = (width, height)
+    elif variant == "portrait":
+        size = (height, width)
+    elif variant == "square":
+        size = (height, height)
+    elif variant == "exif_rotated":
+        size = (width, height)
+        tags = Image.Exif()
+        tags[ORIENTATION_TAG] = 6
+        exif = tags.tobytes()
+    else:
+        raise ValueError(f"Unknown variant: {variant}")
+
+    return _texture(rng, size), exif
+
+def make_frame_overlay(size, border=0.04, logo=0.18):
+    """
+    Frame-style branding overlay: opaque border, a semi-transparent corner
+    logo block, and a fully transparent middle (like real event frames).
+    """
+    width, height = size
+    overlay = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    b = int(min(width, height) * border)
+    draw.rectangle((0, 0, width - 1, b), fill=(255, 255, 255, 255))
+    draw.rectangle((0, height - b, width - 1, height - 1), fill=(255, 255, 255, 255))
+    draw.rectangle((0, 0, b, height - 1), fill=(255, 255, 255, 255))
+    draw.rectangle((width - b, 0, width - 1, height - 1), fill=(255, 255, 255, 255))
+    l = int(min(width, height) * logo)
+    draw.ellipse((width - b - l, height - b - l, width - b, height - b), fill=(20, 60, 200, 180))
+    return overlay
+
+def encode_jpeg(img, exif=None, quality=92):
+    buf = io.BytesIO()
+    kwargs = {"quality": quality}
+    if exif:
+        kwargs["exif"] = exif
+    img.save(buf, "JPEG", **kwargs)
+    return buf.getvalue()
+
+def generate_corpus(folder, sensors=("24mp", "45mp", "61mp"),
+                    variants=("landscape", "portrait", "square", "exif_rotated"), seed=0):
+    """
+    Writes the corpus (and two overlays) into folder, skipping files that
+    already exist. Returns (list of image paths, landscape overlay, portrait overlay).
+    """
+    os.makedirs(folder, exist_ok=True)
+
+    landscape_overlay = os.path.join(folder, "overlay_landscape.png")
+    portrait_overlay = os.path.join(folder, "overlay_portrait.png")
+    if not os.path.exists(landscape_overlay):
+        make_frame_overlay((6240, 4160)).save(landscape_overlay)
+    if not os.path.exists(portrait_overlay):
+        make_frame_overlay((4160, 6240)).save(portrait_overlay)
+
+    paths = []
+    for sensor in sensors:
+        for variant in variants:
+            path = os.path.join(folder, f"{sensor}_{variant}_{seed}.jpg")
+            if not os.path.exists(path):
+                img, exif = make_photo(sensor, variant, seed)
+                with open(path, "wb") as f:
+                    f.write(encode_jpeg(img, exif))
+            paths.append(path)
+    return paths, landscape_overlay, portrait_overlay
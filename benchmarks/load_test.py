@@ -0,0 +1,280 @@
+"""
+End-to-end latency load test: a simulated tethered camera against the real
+watcher + pipeline + processor path.
+
+Writes JPEGs into a temporary source folder the way cameras and tether
+software do (in chunks, some slowly, some under a temp name renamed into
+place), at a set rate and burst pattern, and measures the time from the
+file being complete in the source folder to the branded JPEG being in the
+output folder. Runs on a plain Linux box, no camera or Drive needed:
+
+    python benchmarks/load_test.py --shots-per-second 3 --duration 30
+    python benchmarks/load_test.py --burst 8 --burst-fps 10 --slow-writers 0.3 --output load.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+# Run from a checkout without installing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL
+from capturesync import events as ev
+from capturesync.engine import Engine
+
+from corpus import SENSORS, encode_jpeg, make_frame_overlay, make_photo
+
+# A few distinct payloads are enough; every shot still gets its own file name
+PAYLOAD_VARIANTS = ("landscape", "portrait", "exif_rotated", "square")
+CHUNK_SIZE = 64 * 1024
+# Temp suffix of writers that rename into place (ignored by the watcher)
+PART_SUFFIX = ".part"
+
+def make_payloads(sensor, count=len(PAYLOAD_VARIANTS)):
+    return [encode_jpeg(*make_photo(sensor, PAYLOAD_VARIANTS[i % len(PAYLOAD_VARIANTS)], seed=i))
+            for i in range(count)]
+
+def shot_schedule(shots_per_second, duration, burst=1, burst_fps=10.0):
+    """
+    Start offsets (seconds) of every shot: bursts of `burst` frames at
+    burst_fps, spaced so the average rate is shots_per_second.
+    """
+    offsets = []
+    burst_period = burst / shots_per_second
+    start = 0.0
+    while start < duration:
+        for i in range(burst):
+            offsets.append(start + i / burst_fps)
+        start += burst_period
+    return [t for t in offsets if t < duration]
+
+class Shot:
+    __slots__ = ("path", "kind", "started", "completed")
+
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+        self.started = None
+        self.completed = None
+
+def write_shot(shot, data, slow_seconds=0.0):
+    """
+    Writes data in chunks; a slow writer spreads them over slow_seconds.
+    "rename" shots are written under a temp name and moved into place.
+    shot.completed is when the finished file appears under its real name.
+    """
+    shot.started = time.time()
+    target = shot.path + PART_SUFFIX if shot.kind == "rename" else shot.path
+    chunks = [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+    pause = slow_seconds / len(chunks) if shot.kind == "slow" else 0.0
+    with open(target, "wb") as f:
+        for i, chunk in enumerate(chunks):
+            if pause and i:
+                time.sleep(pause)
+            f.write(chunk)
+            f.flush()
+    if shot.kind == "rename":
+        os.replace(target, shot.path)
+    shot.completed = time.time()
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of a sorted list.
+    """
+    if not samples:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(samples) + 0.5 - 1e-9)))
+    return samples[min(rank, len(samples)) - 1]
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="capturesync_load_")
+    source = os.path.join(workdir, "source")
+    output = os.path.join(workdir, "output")
+    os.makedirs(source)
+    os.makedirs(output)
+
+    width, height = SENSORS[args.sensor]
+    landscape_overlay = os.path.join(workdir, "overlay_landscape.png")
+    portrait_overlay = os.path.join(workdir, "overlay_portrait.png")
+    make_frame_overlay((width, height)).save(landscape_overlay)
+    make_frame_overlay((height, width)).save(portrait_overlay)
+    payloads = make_payloads(args.sensor)
+
+    config = {
+        "source_folder": source,
+        "output_folder": output,
+        "landscape_overlay": landscape_overlay,
+        "portrait_overlay": portrait_overlay,
+        "max_workers": args.workers,
+        "max_long_edge": args.max_long_edge,
+        # Everything the engine keeps on disk stays in the temp folder
+        "ledger_path": os.path.join(workdir, "ledger.db"),
+        "thumbnail_cache": os.path.join(workdir, "thumbnails"),
+        "overlay_store": os.path.join(workdir, "overlays"),
+    }
+    if args.watch_mode:
+        config["watch_mode"] = args.watch_mode
+
+    offsets = shot_schedule(args.shots_per_second, args.duration, args.burst, args.burst_fps)
+    # Deterministic mix of writer kinds
+    shots = []
+    slow_every = round(1 / args.slow_writers) if args.slow_writers else 0
+    rename_every = round(1 / args.renames) if args.renames else 0
+    for i in range(len(offsets)):
+        kind = "fast"
+        if slow_every and i % slow_every == slow_every - 1:
+            kind = "slow"
+        elif rename_every and i % rename_every == rename_every // 2:
+            kind = "rename"
+        shots.append(Shot(os.path.join(source, f"DSC_{i:05d}.jpg"), kind))
+    by_path = {shot.path: shot for shot in shots}
+
+    bus = ev.EventBus()
+    engine = Engine(config, log_callback=lambda message: None, events=bus).start()
+    # Let the observer settle before the first shot
+    time.sleep(0.5)
+
+    print(f"{len(shots)} shots over {args.duration:.0f} s "
+          f"({args.shots_per_second}/s, bursts of {args.burst} at {args.burst_fps} fps, {args.sensor})", file=sys.stderr)
+    writers = []
+    t0 = time.monotonic()
+    for i, (offset, shot) in enumerate(zip(offsets, shots)):
+        delay = t0 + offset - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        writer = threading.Thread(target=write_shot, args=(shot, payloads[i % len(payloads)], args.slow_seconds))
+        writer.start()
+        writers.append(writer)
+    for writer in writers:
+        writer.join()
+
+    # Wait for the pipeline to account for every shot (or give up)
+    finished = {}
+    failed = {}
+    deadline = time.monotonic() + args.drain_timeout
+    while time.monotonic() < deadline:
+        for event in bus.drain():
+            if event.kind == ev.FINISHED:
+                finished.setdefault(event.path, []).append(event.time)
+            elif event.kind == ev.FAILED:
+                failed.setdefault(event.path, []).append(event.time)
+        if all(path in finished or path in failed for path in by_path):
+            # A little longer, so late duplicates are caught too
+            time.sleep(1.0)
+            for event in bus.drain():
+                if event.kind == ev.FINISHED:
+                    finished.setdefault(event.path, []).append(event.time)
+            break
+        time.sleep(0.05)
+    engine.stop(wait=True)
+
+    latencies = sorted(times[0] - by_path[path].completed for path, times in finished.items() if path in by_path)
+    by_kind = {}
+    for path, times in finished.items():
+        if path in by_path:
+            by_kind.setdefault(by_path[path].kind, []).append(times[0] - by_path[path].completed)
+    dropped = [os.path.basename(path) for path in by_path if path not in finished and path not in failed]
+    duplicated = [os.path.basename(path) for path, times in finished.items() if len(times) > 1]
+    unexpected = [path for path in finished if path not in by_path]
+    outputs = [name for name in os.listdir(output) if name.lower().endswith(".jpg")]
+
+    first_shot = min(shot.started for shot in shots) if shots else 0
+    last_output = max(times[-1] for times in finished.values()) if finished else first_shot
+    span = max(last_output - first_shot, 1e-9)
+
+    def stats(samples):
+        samples = sorted(samples)
+        return {
+            "p50": percentile(samples, 50),
+            "p95": percentile(samples, 95),
+            "p99": percentile(samples, 99),
+            "max": samples[-1] if samples else None,
+            "count": len(samples),
+        }
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "sensor": args.sensor,
+            "workers": args.workers,
+            "shots_per_second": args.shots_per_second,
+            "burst": args.burst,
+            "burst_fps": args.burst_fps,
+            "duration": args.duration,
+            "slow_writers": args.slow_writers,
+            "slow_seconds": args.slow_seconds,
+            "renames": args.renames,
+            "max_long_edge": args.max_long_edge,
+            "watch_mode": args.watch_mode or "native",
+        },
+        "shots": len(shots),
+        "processed": len(latencies),
+        "failed": len(failed),
+        "dropped": len(dropped),
+        "duplicated": len(duplicated),
+        "unexpected": len(unexpected),
+        "output_files": len(outputs),
+        "throughput_per_minute": len(latencies) / span * 60,
+        "latency": stats(latencies),
+        "latency_by_writer": {kind: stats(samples) for kind, samples in by_kind.items()},
+        "dropped_files": dropped[:50],
+        "duplicated_files": duplicated[:50],
+    }
+
+    if args.keep:
+        print(f"Kept {workdir}", file=sys.stderr)
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+def format_report(report):
+    def ms(value):
+        return f"{value * 1000:.0f} ms" if value is not None else "-"
+    latency = report["latency"]
+    lines = [
+        f"shots {report['shots']}   processed {report['processed']}   failed {report['failed']}   "
+        f"dropped {report['dropped']}   duplicated {report['duplicated']}",
+        f"latency p50 {ms(latency['p50'])}   p95 {ms(latency['p95'])}   p99 {ms(latency['p99'])}   max {ms(latency['max'])}",
+        f"throughput {report['throughput_per_minute']:.1f} images/min",
+    ]
+    for kind, stats in sorted(report["latency_by_writer"].items()):
+        lines.append(f"  {kind:<7} p50 {ms(stats['p50'])}   p95 {ms(stats['p95'])}   ({stats['count']} shots)")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shots-per-second", type=float, default=2.0, help="Average shooting rate")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of shooting")
+    parser.add_argument("--burst", type=int, default=1, help="Frames per burst (1 = evenly spaced shots)")
+    parser.add_argument("--burst-fps", type=float, default=10.0, help="Frame rate within a burst")
+    parser.add_argument("--sensor", default="2mp", choices=sorted(SENSORS), help="Resolution of the generated JPEGs")
+    parser.add_argument("--slow-writers", type=float, default=0.2, help="Fraction of shots written slowly (card reader / Wi-Fi)")
+    parser.add_argument("--slow-seconds", type=float, default=2.0, help="How long a slow write takes")
+    parser.add_argument("--renames", type=float, default=0.2, help=f"Fraction of shots written as *{PART_SUFFIX} and renamed into place")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count - 1)")
+    parser.add_argument("--max-long-edge", type=int, help="Output size cap, as in the app")
+    parser.add_argument("--watch-mode", choices=("native", "polling"), help="Watcher to test")
+    parser.add_argument("--drain-timeout", type=float, default=60.0, help="Seconds to wait for the backlog after the last shot")
+    parser.add_argument("--keep", action="store_true", help="Keep the temp source/output folders")
+    parser.add_argument("--output", help="Also write the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    # Non-zero when files went missing or were processed twice
+    return 1 if report["dropped"] or report["duplicated"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
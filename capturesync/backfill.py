@@ -0,0 +1,199 @@
+import heapq
+import json
+import os
+import threading
+import time
+from collections import deque
+from . import events as ev
+from . import ledger
+from . import processor
+from .upload_queue import PRIORITY_BACKFILL
+
+# Where the scan got to last time, next to the ledger (working directory)
+CHECKPOINT_FILE = "capturesync_backfill.json"
+# Seconds between checkpoint writes while scanning
+CHECKPOINT_INTERVAL = 5.0
+
+_checkpoint_lock = threading.Lock()
+
+def load_checkpoint(path, source, version):
+    """
+    (mtime_ns, name, saved_at) reached last time for source, or None.
+    A checkpoint taken with other overlays doesn't count.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f).get(os.path.abspath(source))
+    except (OSError, ValueError):
+        return None
+    if not entry or entry.get("version") != version:
+        return None
+    return entry["mtime_ns"], entry["name"], entry["saved_at"]
+
+def save_checkpoint(path, source, version, mtime_ns, name, saved_at):
+    with _checkpoint_lock:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data[os.path.abspath(source)] = {
+            "mtime_ns": mtime_ns, "name": name, "version": version, "saved_at": saved_at
+        }
+        # Written aside and renamed, so a crash never leaves half a file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+def scan(profile, sources):
+    """
+    Yields (mtime_ns, relative_path, ctime) for the images of one source
+    profile, oldest first. One os.scandir pass per folder (the stat comes with
+    the directory entry on Windows), into subfolders when the profile is
+    recursive; only these small tuples are kept, everything else happens
+    lazily per file. sources is the sources.SourceRouter doing the filtering.
+    """
+    root = profile["source_folder"]
+    entries = []
+    folders = [root]
+    while folders:
+        folder = folders.pop()
+        try:
+            it = os.scandir(folder)
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if profile["recursive"] and not sources.is_ignored_dir(entry.path, profile):
+                            folders.append(entry.path)
+                        continue
+                    # Files of a source nested in this one are that source's job
+                    if not entry.is_file() or sources.accepts(entry.path) is not profile:
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    # Deleted while we were looking
+                    continue
+                entries.append((stat.st_mtime_ns, os.path.relpath(entry.path, root), stat.st_ctime))
+    heapq.heapify(entries)
+    while entries:
+        yield heapq.heappop(entries)
+
+class BackfillScanner:
+    """
+    Feeds the files already in one source (a profile from sources.py) to the
+    pipeline's backfill lane, oldest first, so live captures always go ahead
+    of the backlog.
+
+    Progress is checkpointed as an (mtime, name) watermark: everything at or
+    below it was processed, so a restart skips it without touching the ledger.
+    The watermark only moves past files that left the pipeline with a ledger
+    entry; a failed file holds it, and the next run retries from there.
+    """
+    def __init__(self, config, pipeline, log_callback=None, events=None, resume=None, is_running=None):
+        self.config = config
+        self.pipeline = pipeline
+        self.sources = pipeline.sources
+        self.log_callback = log_callback or print
+        self.events = events
+        # threading.Event that is cleared while paused
+        self.resume = resume
+        self.is_running = is_running or (lambda: True)
+        self.checkpoint_path = config.get("backfill_checkpoint", CHECKPOINT_FILE)
+        self.version = ledger.output_version(config)
+
+        # Scan keys submitted but not yet known to be done, in scan order
+        self._submitted = deque()
+        self._watermark = None
+        self._saved = None
+        self._held = False
+        # Files that show up after the listing aren't covered by the watermark
+        self._scanned_at = None
+
+    def run(self):
+        source = self.config.get("source_folder")
+        checkpoint = None
+        if self.checkpoint_path:
+            checkpoint = load_checkpoint(self.checkpoint_path, source, self.version)
+        last_save = time.monotonic()
+        submitted = skipped = 0
+        self._scanned_at = time.time()
+
+        for mtime_ns, name, ctime in scan(self.config, self.sources):
+            if self.resume:
+                self.resume.wait()
+            if not self.is_running():
+                break
+
+            # Behind the watermark, unless it only arrived after the checkpoint
+            # (copied-in files keep their original mtime)
+            if checkpoint and (mtime_ns, name) <= checkpoint[:2] and ctime <= checkpoint[2]:
+                skipped += 1
+                continue
+
+            file_path = os.path.join(source, name)
+            # Ledger check is just a stat; finished files never reach the queue
+            if processor.already_processed(file_path, self.config):
+                self.log_callback(f"Already processed, skipping: {file_path}")
+                if self.events:
+                    # Still part of this session's total
+                    self.events.publish(ev.DETECTED, file_path)
+                    self.events.publish(ev.SKIPPED, file_path)
+                self._submitted.append((mtime_ns, name))
+            # Blocks while the backfill lane is full
+            elif self.pipeline.submit(file_path, priority=PRIORITY_BACKFILL):
+                self._submitted.append((mtime_ns, name))
+                submitted += 1
+            elif not self.is_running() or self.pipeline.is_stopping():
+                break
+            else:
+                # Already queued or running (the watcher got to it first);
+                # the watermark still waits for it to leave the pipeline
+                self._submitted.append((mtime_ns, name))
+
+            if time.monotonic() - last_save >= CHECKPOINT_INTERVAL:
+                self.save()
+                last_save = time.monotonic()
+
+        if skipped:
+            self.log_callback(f"Backfill: {skipped} file(s) in {source} already done at last checkpoint.")
+        self.log_callback(f"Backfill: {submitted} existing file(s) queued from {source}.")
+        self._wait_and_save()
+
+    def _advance(self):
+        """
+        Moves the watermark past the files at the head of the scan order that
+        are no longer in the pipeline.
+        """
+        source = self.config.get("source_folder")
+        while self._submitted and not self._held:
+            key = self._submitted[0]
+            file_path = os.path.join(source, key[1])
+            if self.pipeline.is_pending(file_path):
+                return
+            if not processor.already_processed(file_path, self.config):
+                # Failed (or ledger is off): the next run has to start here
+                self._held = True
+                return
+            self._watermark = self._submitted.popleft()
+
+    def save(self):
+        self._advance()
+        if self.checkpoint_path and self._watermark and self._watermark != self._saved:
+            self._saved = self._watermark
+            try:
+                save_checkpoint(self.checkpoint_path, self.config.get("source_folder"), self.version,
+                                *self._watermark, self._scanned_at)
+            except OSError as e:
+                self.log_callback(f"Could not save backfill checkpoint: {e}")
+
+    def _wait_and_save(self):
+        # Keep checkpointing until the queued backlog has drained (or we stop)
+        while self._submitted and not self._held and self.is_running():
+            self.save()
+            if self._submitted:
+                time.sleep(0.5)
+        self.save()
@@ -0,0 +1,33 @@
+import threading
+
+class MemoryBudget:
+    """
+    Pixel-memory ceiling shared by every job in flight. The dispatcher
+    reserves a job's estimated peak (processor.estimate_memory) before a
+    worker gets it and releases it when the job is done, so several large
+    images running in parallel never add up to more than capacity bytes.
+
+    A job bigger than the whole budget still runs, but only on its own.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.in_use = 0
+        self._cond = threading.Condition()
+
+    def _fits(self, nbytes):
+        return self.in_use + nbytes <= self.capacity or self.in_use == 0
+
+    def reserve(self, nbytes, timeout=None):
+        """
+        Blocks until nbytes fit. Returns False if timeout ran out first.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._fits(nbytes), timeout):
+                return False
+            self.in_use += nbytes
+            return True
+
+    def release(self, nbytes):
+        with self._cond:
+            self.in_use = max(0, self.in_use - nbytes)
+            self._cond.notify_all()
@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+
+# Keep imports at module level to the standard library: the engine (and with
+# it Pillow / watchdog) is only imported once we know we're actually running,
+# so `--help` and config errors return instantly on the ingest box.
+
+DEFAULT_CONFIG_FILE = "gui_config.json"
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="capturesync",
+        description="Automated Image Overlay & Cloud Sync Tool",
+    )
+    parser.add_argument("--headless", action="store_true", help="Run without the GUI (never imports customtkinter)")
+    parser.add_argument("--config", help=f"JSON config file (default: {DEFAULT_CONFIG_FILE} if present)")
+    parser.add_argument("--source", dest="source_folder", help="Folder to watch for new images")
+    parser.add_argument("--recursive", action="store_true", default=None, help="Also watch subfolders of the source (e.g. a card reader's DCIM tree)")
+    parser.add_argument("--watch-mode", dest="watch_mode", choices=("native", "polling"), help="polling for network shares (SMB/NFS) that send no change events")
+    parser.add_argument("--output", dest="output_folder", help="Destination folder")
+    parser.add_argument("--landscape", dest="landscape_overlay", help="Landscape / square overlay PNG")
+    parser.add_argument("--portrait", dest="portrait_overlay", help="Portrait overlay PNG")
+    parser.add_argument("--prefix", dest="file_prefix", help="Optional prefix for output files")
+    parser.add_argument("--layout", dest="output_layout", choices=("flat", "session", "session_hour"), help="Output subfolders per session (and per hour), with a manifest per session")
+    parser.add_argument("--session", dest="session_name", help="Session folder name (default: start date and time)")
+    parser.add_argument("--max-long-edge", dest="max_long_edge", type=int, help="Cap output size, e.g. 2560 (decodes at reduced size)")
+    parser.add_argument("--engine", dest="composite_engine", choices=("pillow", "numpy"), help="Compositing engine (numpy needs NumPy installed)")
+    parser.add_argument("--batch-size", dest="composite_batch_size", type=int, help="Blend up to this many queued same-size frames together")
+    parser.add_argument("--upload-url", dest="upload_url", help="Also PUT every output to this HTTP endpoint")
+    parser.add_argument("--upload-bandwidth", dest="upload_bandwidth_mbps", type=float, help="Cap remote upload bandwidth, in Mbit/s")
+    parser.add_argument("--workers", dest="max_workers", type=int, help="Number of worker processes")
+    parser.add_argument("--memory-budget", dest="memory_budget_mb", type=float, help="RAM ceiling in MB for all images in flight together")
+    parser.add_argument("--process-existing", action="store_true", help="Also process files already in the source folder")
+    parser.add_argument("--stats-interval", type=float, default=60, help="Seconds between throughput summaries (0 to disable)")
+    parser.add_argument("--stats-file", dest="stats_file", help="Periodically write metrics here (.json, otherwise Prometheus text format)")
+    return parser
+
+def load_config(args):
+    """
+    Config file first, then any command line options on top.
+    """
+    config = {}
+    config_file = args.config or (DEFAULT_CONFIG_FILE if os.path.exists(DEFAULT_CONFIG_FILE) else None)
+    if config_file:
+        with open(config_file, 'r') as f:
+            config.update(json.load(f))
+
+    for key in ("source_folder", "recursive", "watch_mode", "output_folder", "landscape_overlay", "portrait_overlay", "file_prefix", "output_layout", "session_name", "max_long_edge", "composite_engine", "composite_batch_size", "upload_url", "upload_bandwidth_mbps", "max_workers", "memory_budget_mb", "stats_file"):
+        value = getattr(args, key)
+        if value is not None:
+            config[key] = value
+    if args.upload_url and not config.get("upload_backend"):
+        config["upload_backend"] = "http"
+    return config
+
+def format_summary(metrics):
+    snap = metrics.snapshot()
+    parts = [
+        f"[stats] {snap['images_processed']} processed, {snap['images_failed']} failed",
+        f"{snap['images_per_minute']:.1f} images/min",
+        f"queue {snap['queue_depth']}",
+        f"uploads pending {snap['upload_queue_depth']}",
+        f"{snap['bytes_written'] / 1e6:.1f} MB written",
+    ]
+    # Mean time per stage, only for stages that have seen work
+    stages = [f"{stage} {h['mean'] * 1000:.0f}ms" for stage, h in snap["stages"].items() if h["count"]]
+    if stages:
+        parts.append("mean " + " ".join(stages))
+    return ", ".join(parts)
+
+def run(config, process_existing=False, stats_interval=60):
+    """
+    Blocking headless run. Returns when SIGINT / SIGTERM is received.
+    """
+    from .engine import Engine
+
+    # Thumbnails only feed the GUI's Gallery; headless nobody would see them
+    config = dict(config, thumbnail_cache="")
+
+    stop_event = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"Received signal {signum}, shutting down...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, request_stop)
+
+    engine = Engine(config, log_callback=print).start(process_existing=process_existing)
+
+    # Event.wait with a timeout keeps the main thread responsive to signals
+    interval = stats_interval if stats_interval and stats_interval > 0 else None
+    while not stop_event.wait(interval or 1):
+        if interval:
+            print(format_summary(engine.pipeline.metrics))
+
+    # Let in-flight images finish so nothing is left half-written
+    engine.stop(wait=True)
+    print(format_summary(engine.pipeline.metrics))
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        config = load_config(args)
+    except (OSError, ValueError) as e:
+        print(f"Could not read config: {e}")
+        return 2
+
+    # Every source needs these, either its own or the shared ones (see sources.py)
+    profiles = [dict(config, **(entry if isinstance(entry, dict) else {"source_folder": entry}))
+                for entry in config.get("sources") or [{}]]
+    missing = [key for key in ("source_folder", "output_folder") if not all(p.get(key) for p in profiles)]
+    if missing:
+        print(f"Missing required setting(s): {', '.join(missing)}")
+        return 2
+    if any(not p.get("landscape_overlay") and not p.get("portrait_overlay") for p in profiles):
+        print("Configuration missing overlay. Please provide at least one.")
+        return 2
+
+    run(config, process_existing=args.process_existing, stats_interval=args.stats_interval)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
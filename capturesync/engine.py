@@ -0,0 +1,88 @@
+import threading
+from . import backfill, watcher
+from .metrics import StatsFileWriter
+from .pipeline import Pipeline
+
+class Engine:
+    """
+    Everything between the source folder(s) and the output folder(s): watcher,
+    readiness tracking, worker pool and the "process existing files" backfill.
+    Front-ends (the GUI, the headless daemon) only start/pause/stop it.
+    """
+    def __init__(self, config, log_callback=None, events=None):
+        self.config = config
+        self.log_callback = log_callback or print
+        # Optional events.EventBus, passed on to the pipeline
+        self.events = events
+        self.pipeline = None
+        self.observer = None
+        self.stats_writer = None
+        self.running = False
+        self._resume = threading.Event()
+        self._resume.set()
+
+    @property
+    def paused(self):
+        return not self._resume.is_set()
+
+    def start(self, process_existing=False):
+        self.running = True
+        self._resume.set()
+        # Worker pool survives pause/resume; only the observer is restarted
+        self.pipeline = Pipeline(self.config, log_callback=self.log_callback, events=self.events).start()
+
+        # Lets the headless box be monitored without the GUI
+        if self.config.get("stats_file"):
+            self.stats_writer = StatsFileWriter(self.pipeline.metrics, self.config["stats_file"],
+                                                self.config.get("stats_file_interval", 10)).start()
+
+        if process_existing:
+            threading.Thread(target=self.process_existing_files, name="capturesync-backfill", daemon=True).start()
+
+        self.observer = watcher.start_watcher(self.pipeline.sources, self.pipeline, log_callback=self.log_callback)
+        return self
+
+    def pause(self):
+        self._resume.clear()
+        if self.observer:
+            self.observer.stop()
+            self.observer = None
+
+    def resume(self):
+        self._resume.set()
+        if self.running and self.observer is None:
+            self.observer = watcher.start_watcher(self.pipeline.sources, self.pipeline, log_callback=self.log_callback)
+
+    def stop(self, wait=True):
+        self.running = False
+        # Wake a paused backfill so it can see running=False and exit
+        self._resume.set()
+        if self.observer:
+            self.observer.stop()
+            self.observer = None
+        if self.pipeline:
+            self.pipeline.stop(wait=wait)
+        if self.stats_writer:
+            self.stats_writer.stop()
+            self.stats_writer = None
+
+    def process_existing_files(self):
+        # One scanner thread per source, all feeding the same backfill lane
+        # (submit is thread-safe), so a source doesn't wait for the one
+        # before it to drain and checkpoint
+        threads = [threading.Thread(target=self._scan_existing, args=(profile,), daemon=True,
+                                    name=f"capturesync-backfill-{i}")
+                   for i, profile in enumerate(self.pipeline.sources.profiles)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _scan_existing(self, profile):
+        if not self.running:
+            return
+        try:
+            backfill.BackfillScanner(profile, self.pipeline, log_callback=self.log_callback, events=self.events,
+                                     resume=self._resume, is_running=lambda: self.running).run()
+        except Exception as e:
+            self.log_callback(f"Error scanning existing files in {profile['source_folder']}: {e}")
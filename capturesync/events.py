@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+# Event kinds, in the order a file goes through them
+DETECTED = "detected"    # counted for this session (queued, or found already processed)
+STARTED = "started"      # handed to a worker
+FINISHED = "finished"    # output written (output_path, thumbnail, timings)
+FAILED = "failed"        # attempted but no output
+SKIPPED = "skipped"      # already processed / not an image; nothing to do
+LOG = "log"              # a human-readable message for the activity log
+
+Event = namedtuple("Event", "kind path output_path thumbnail timings message time")
+Event.__new__.__defaults__ = (None, None, None, None, None, None)
+
+# Events kept for a front-end that isn't draining (e.g. a GUI stuck in a
+# modal dialog); beyond this the oldest are dropped
+MAX_QUEUED = 10000
+
+class EventBus:
+    """
+    Thread-safe queue of pipeline events for front-ends.
+    Producers (pipeline threads, worker callbacks) never block and never
+    touch the UI; the GUI drains it in batches on its own timer.
+
+    At most max_events wait to be drained; when it is full the oldest one is
+    dropped. Every event is counted per kind when it is published, dropped
+    or not, so progress read from counts() stays exact.
+    """
+    def __init__(self, max_events=MAX_QUEUED):
+        self.max_events = max_events
+        self._events = deque()
+        self._lock = threading.Lock()
+        self._published = {}
+        self._dropped = {}
+
+    def publish(self, kind, path=None, **fields):
+        event = Event(kind, path, time=time.time(), **fields)
+        with self._lock:
+            self._published[kind] = self._published.get(kind, 0) + 1
+            if len(self._events) >= self.max_events:
+                old = self._events.popleft()
+                self._dropped[old.kind] = self._dropped.get(old.kind, 0) + 1
+            self._events.append(event)
+
+    def log(self, message):
+        """
+        Usable as a log_callback.
+        """
+        self.publish(LOG, message=message)
+
+    def drain(self, max_events=None):
+        """
+        Everything queued so far (at most max_events), oldest first. Never blocks.
+        """
+        with self._lock:
+            count = len(self._events) if max_events is None else min(max_events, len(self._events))
+            return [self._events.popleft() for _ in range(count)]
+
+    def counts(self):
+        """
+        Events published per kind since the last reset().
+        """
+        with self._lock:
+            return dict(self._published)
+
+    def dropped(self):
+        """
+        Events dropped per kind (queue full) since the last reset().
+        """
+        with self._lock:
+            return dict(self._dropped)
+
+    def reset(self):
+        """
+        Forgets queued events and zeroes the counters (a new run starts).
+        """
+        with self._lock:
+            self._events.clear()
+            self._published.clear()
+            self._dropped.clear()
@@ -0,0 +1,271 @@
+import queue
+import threading
+import tkinter as tk
+from collections import OrderedDict
+import customtkinter as ctk
+from PIL import Image
+
+# Thumbnail box, pixels
+THUMB_SIZE = 250
+CELL_PADDING = 10
+# Rows kept alive above and below the viewport so scrolling doesn't show blanks
+MARGIN_ROWS = 2
+# Decoded thumbnails kept around; must cover at least the widget pool
+THUMB_CACHE_SIZE = 120
+# How often the Tk thread picks up thumbnails from the loader, ms
+POLL_INTERVAL = 30
+
+class LRUCache:
+    """
+    Small least-recently-used map; get() refreshes an entry.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+def load_thumbnail(path, size=THUMB_SIZE):
+    """
+    Opens a ready-made thumbnail from the pipeline's cache, or as a fallback
+    decodes a full output at reduced size (JPEG draft mode).
+    """
+    with Image.open(path) as img:
+        img.draft("RGB", (size, size))
+        img = img.convert("RGB")
+        img.thumbnail((size, size))
+        return img
+
+class ThumbnailLoader:
+    """
+    Background thread that decodes thumbnails, newest request first, so
+    the Tk thread never touches a full-size JPEG. Results are collected with
+    drain() from the Tk thread. Requests for cells that scrolled away before
+    their turn are dropped (is_wanted).
+    """
+    def __init__(self, size=THUMB_SIZE, is_wanted=None):
+        self.size = size
+        self.is_wanted = is_wanted
+        self._requests = queue.LifoQueue()
+        self._results = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name="capturesync-thumbnails", daemon=True)
+        self._thread.start()
+
+    def request(self, path, source=None):
+        """
+        Loads the thumbnail for path from source (a cached thumbnail), or from path itself.
+        """
+        with self._lock:
+            if path in self._pending:
+                return
+            self._pending.add(path)
+        self._requests.put((path, source or path))
+
+    def _loop(self):
+        while True:
+            path, source = self._requests.get()
+            if self.is_wanted and not self.is_wanted(path):
+                with self._lock:
+                    self._pending.discard(path)
+                continue
+            try:
+                img = load_thumbnail(source, self.size)
+            except Exception as e:
+                print(f"Gallery error: {e}")
+                img = None
+            self._results.put((path, img))
+
+    def drain(self):
+        results = []
+        while True:
+            try:
+                path, img = self._results.get_nowait()
+            except queue.Empty:
+                return results
+            with self._lock:
+                self._pending.discard(path)
+            results.append((path, img))
+
+class VirtualGallery(ctk.CTkFrame):
+    """
+    Scrollable thumbnail grid whose cost doesn't grow with the session.
+
+    Only the visible rows (plus MARGIN_ROWS either side) have widgets, taken
+    from a fixed pool of labels on a canvas and moved as the view scrolls.
+    Thumbnails (normally the small JPEGs the workers write, see thumbnails.py)
+    are loaded lazily by a ThumbnailLoader when their cell comes into view and
+    kept in an LRU cache; everything else is just a path.
+    """
+    def __init__(self, master, thumb_size=THUMB_SIZE, padding=CELL_PADDING, cache_size=THUMB_CACHE_SIZE, bg="#121212", **kwargs):
+        super().__init__(master, **kwargs)
+        self.thumb_size = thumb_size
+        self.cell = thumb_size + 2 * padding
+        self.padding = padding
+        self.columns = 1
+
+        self.paths = []
+        # Output path -> cached thumbnail file
+        self.sources = {}
+        self.cache = LRUCache(cache_size)
+        # Paths currently assigned to pooled labels; replaced (never mutated) from the Tk thread
+        self._wanted = frozenset()
+        self.loader = ThumbnailLoader(thumb_size, is_wanted=lambda path: path in self._wanted)
+        # Pool of (label, canvas window id); label.path is the path it shows
+        self.pool = []
+
+        self.placeholder = ctk.CTkImage(Image.new("RGB", (thumb_size, thumb_size), "#242424"), size=(thumb_size, thumb_size))
+
+        self.canvas = tk.Canvas(self, highlightthickness=0, bd=0, bg=bg, yscrollincrement=self.cell // 4)
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.canvas.bind("<Configure>", lambda e: self._relayout())
+        # Wheel only scrolls the gallery while the pointer is over it
+        self.canvas.bind("<Enter>", self._bind_wheel)
+        self.canvas.bind("<Leave>", self._unbind_wheel)
+
+        self.after(POLL_INTERVAL, self._poll_loader)
+
+    # --- model ---
+    def add(self, path, thumbnail=None):
+        self.paths.append(path)
+        if thumbnail:
+            self.sources[path] = thumbnail
+        self._update_scrollregion()
+        row = (len(self.paths) - 1) // self.columns
+        first, last = self._visible_rows()
+        if first <= row <= last:
+            self._refresh()
+
+    def add_many(self, items):
+        """
+        Bulk add of (path, thumbnail) pairs, e.g. the previous session on startup.
+        """
+        for path, thumbnail in items:
+            self.paths.append(path)
+            if thumbnail:
+                self.sources[path] = thumbnail
+        self._update_scrollregion()
+        self._refresh()
+
+    def clear(self):
+        self.paths = []
+        self.sources = {}
+        self._update_scrollregion()
+        self._refresh()
+
+    # --- layout ---
+    def _visible_rows(self):
+        top = self.canvas.canvasy(0)
+        height = max(self.canvas.winfo_height(), self.cell)
+        first = max(0, int(top // self.cell) - MARGIN_ROWS)
+        last = int((top + height) // self.cell) + MARGIN_ROWS
+        return first, last
+
+    def _update_scrollregion(self):
+        rows = (len(self.paths) + self.columns - 1) // self.columns
+        self.canvas.configure(scrollregion=(0, 0, self.columns * self.cell, max(rows * self.cell, 1)))
+
+    def _relayout(self):
+        self.columns = max(1, self.canvas.winfo_width() // self.cell)
+        rows_needed = self.canvas.winfo_height() // self.cell + 2 + 2 * MARGIN_ROWS
+        pool_size = rows_needed * self.columns
+        # The pool only grows with the window size, never with the image count
+        while len(self.pool) < pool_size:
+            label = ctk.CTkLabel(self.canvas, image=self.placeholder, text="")
+            label.path = None
+            window = self.canvas.create_window(0, 0, window=label, anchor="nw", state="hidden")
+            self.pool.append((label, window))
+        # Never evict what is on screen
+        self.cache.max_entries = max(self.cache.max_entries, 2 * len(self.pool))
+        self._update_scrollregion()
+        self._refresh()
+
+    def _refresh(self):
+        """
+        Points every pooled label at the cell it should show now.
+        """
+        first, _ = self._visible_rows()
+        start = first * self.columns
+        missing = []
+        for i, (label, window) in enumerate(self.pool):
+            index = start + i
+            if index >= len(self.paths):
+                self.canvas.itemconfigure(window, state="hidden")
+                label.path = None
+                continue
+            row, col = divmod(index, self.columns)
+            self.canvas.coords(window, col * self.cell + self.padding, row * self.cell + self.padding)
+            self.canvas.itemconfigure(window, state="normal")
+            path = self.paths[index]
+            if label.path != path:
+                label.path = path
+                image = self.cache.get(path)
+                if image is None:
+                    missing.append(path)
+                    image = self.placeholder
+                label.configure(image=image)
+        # Update before requesting, so the loader doesn't drop the new ones
+        self._wanted = frozenset(label.path for label, _ in self.pool if label.path)
+        for path in missing:
+            self.loader.request(path, self.sources.get(path))
+
+    def _poll_loader(self):
+        loaded = set()
+        for path, img in self.loader.drain():
+            if img is not None:
+                self.cache.put(path, ctk.CTkImage(light_image=img, dark_image=img, size=img.size))
+                loaded.add(path)
+        if loaded:
+            for label, _ in self.pool:
+                if label.path in loaded:
+                    label.configure(image=self.cache.get(label.path))
+        self.after(POLL_INTERVAL, self._poll_loader)
+
+    # --- scrolling ---
+    def _on_scrollbar(self, *args):
+        self.canvas.yview(*args)
+        self._refresh()
+
+    def _on_wheel(self, event):
+        if getattr(event, "num", None) == 4:
+            step = -1
+        elif getattr(event, "num", None) == 5:
+            step = 1
+        else:
+            step = -1 if event.delta > 0 else 1
+        self.canvas.yview_scroll(step, "units")
+        self._refresh()
+
+    def _bind_wheel(self, event=None):
+        self.canvas.bind_all("<MouseWheel>", self._on_wheel)
+        self.canvas.bind_all("<Button-4>", self._on_wheel)
+        self.canvas.bind_all("<Button-5>", self._on_wheel)
+
+    def _unbind_wheel(self, event=None):
+        # Moving onto a thumbnail label (a child of the canvas) is a Leave too
+        if event is not None and getattr(event, "detail", None) == "NotifyInferior":
+            return
+        self.canvas.unbind_all("<MouseWheel>")
+        self.canvas.unbind_all("<Button-4>")
+        self.canvas.unbind_all("<Button-5>")
@@ -1,16 +1,21 @@
 import os
 import sys
 import json
-import threading
 import webbrowser
+from collections import deque
 import customtkinter as ctk
 from PIL import Image, ImageDraw, ImageOps
 
 try:
-    from . import processor, watcher
+    from .engine import Engine
+    from .gallery import VirtualGallery
+    from . import thumbnails
+    from . import events as ev
 except ImportError:
-    import processor
-    import watcher
+    from engine import Engine
+    from gallery import VirtualGallery
+    import thumbnails
+    import events as ev
 
 # Theme Settings
 ctk.set_appearance_mode("Dark")
@@ -19,6 +24,13 @@ ctk.set_default_color_theme("blue")
 CONFIG_FILE = "gui_config.json"
 VERSION = "5.0"
 
+# Pipeline events are applied to the UI in one batch this often (ms)
+EVENT_REFRESH_MS = 100
+# Events handled per refresh; the rest wait for the next tick
+MAX_EVENTS_PER_REFRESH = 5000
+# Lines kept in Recent Activity
+ACTIVITY_LINES = 500
+
 # Minimalist Pro Palette
 THEME = {
     "bg": "#121212",           # Main Background
@@ -54,18 +66,27 @@ class CaptureSyncApp(ctk.CTk):
         self.portrait_var = ctk.StringVar()
         self.output_var = ctk.StringVar()
         self.prefix_var = ctk.StringVar(value="fujifilm_x100v_")
+        # Settings with no widget (renditions, max_long_edge, ...) pass through from the config file
+        self.extra_config = {}
         
         self.process_existing_var = ctk.BooleanVar(value=False)
         
         # Runtime State
-        self.observer = None
+        self.engine = None
         self.running = False
         self.total_files = 0
         self.processed_count = 0
-        self.gallery_images = [] 
+        # Pending refresh_stats timer, cancelled on stop so restarts don't stack loops
+        self.stats_after_id = None
+        # Structured updates from the engine, drained on a timer (see drain_events)
+        self.events = ev.EventBus()
+        self.activity = deque(maxlen=ACTIVITY_LINES)
+        self.activity_dirty = False
 
         self.load_config()
         self.create_layout()
+        self.restore_gallery()
+        self.after(EVENT_REFRESH_MS, self.drain_events)
         
         # Start at Dashboard
         self.select_frame("dashboard")
@@ -237,8 +258,10 @@ class CaptureSyncApp(ctk.CTk):
         self.total_label = ctk.CTkLabel(stats_card, text="/ 0 Files", font=ctk.CTkFont(size=14), text_color="gray")
         self.total_label.pack(anchor="w", padx=22, pady=(0, 20))
         self.progress_bar = ctk.CTkProgressBar(stats_card, progress_color=THEME["accent"], fg_color=THEME["bg"], height=8)
-        self.progress_bar.pack(fill="x", padx=20, pady=(0, 25))
+        self.progress_bar.pack(fill="x", padx=20, pady=(0, 10))
         self.progress_bar.set(0)
+        self.stats_detail_label = ctk.CTkLabel(stats_card, text="", font=ctk.CTkFont(size=11), text_color="gray", anchor="w", justify="left")
+        self.stats_detail_label.pack(fill="x", padx=20, pady=(0, 20))
 
         # Recent Log (Mini Gallery removed from here to reduce clutter, moved to Log)
         ctk.CTkLabel(right_panel, text="Recent Activity", font=ctk.CTkFont(size=14, weight="bold"), text_color="white", anchor="w").pack(fill="x", pady=(10, 10))
@@ -251,12 +274,9 @@ class CaptureSyncApp(ctk.CTk):
         
         ctk.CTkLabel(self.gallery_frame, text="Gallery", font=ctk.CTkFont(size=26, weight="bold"), text_color="white", anchor="w").pack(fill="x", padx=40, pady=(40, 20))
         
-        self.gallery_scroll = ctk.CTkScrollableFrame(self.gallery_frame, fg_color="transparent")
-        self.gallery_scroll.pack(fill="both", expand=True, padx=40, pady=(0, 40))
-        
-        self.gallery_row = 0
-        self.gallery_col = 0
-        self.MAX_GALLERY_COLS = 3
+        # Virtualized: a fixed pool of widgets, thumbnails loaded lazily on scroll
+        self.gallery = VirtualGallery(self.gallery_frame, fg_color="transparent", bg=THEME["bg"])
+        self.gallery.pack(fill="both", expand=True, padx=40, pady=(0, 40))
 
     def create_config_card(self, parent, title, subtitle, var, cmd, is_overlay_group=False):
         card = ctk.CTkFrame(parent, fg_color=THEME["card_bg"], corner_radius=10, height=80)
@@ -303,13 +323,15 @@ class CaptureSyncApp(ctk.CTk):
 
     def browse_file(self, var):
         f = ctk.filedialog.askopenfilename(filetypes=[("Images", "*.png;*.jpg;*.jpeg")])
-        if f: var.set(f); self.save_config()
+        if f:
+            var.set(f); self.save_config()
 
     def load_config(self):
         if os.path.exists(CONFIG_FILE):
             try:
                 with open(CONFIG_FILE, 'r') as f:
                     data = json.load(f)
+                    self.extra_config = data
                     self.source_var.set(data.get("source_folder", ""))
                     self.output_var.set(data.get("output_folder", ""))
                     self.landscape_var.set(data.get("landscape_overlay", ""))
@@ -318,31 +340,55 @@ class CaptureSyncApp(ctk.CTk):
             except Exception: pass
 
     def save_config(self):
-        data = {
+        data = dict(self.extra_config)
+        data.update({
             "source_folder": self.source_var.get(),
             "output_folder": self.output_var.get(),
             "landscape_overlay": self.landscape_var.get(),
             "portrait_overlay": self.portrait_var.get(),
             "file_prefix": self.prefix_var.get()
-        }
+        })
         with open(CONFIG_FILE, 'w') as f: json.dump(data, f)
             
     def log(self, message):
+        # Shown on the next refresh; old lines fall off the end
+        self.activity.append(message)
+        self.activity_dirty = True
+
+    def drain_events(self):
+        """
+        Applies everything the engine reported since the last tick in one go,
+        so a 500-file burst costs a few redraws instead of thousands of callbacks.
+        """
+        for event in self.events.drain(MAX_EVENTS_PER_REFRESH):
+            if event.kind == ev.LOG:
+                self.log(event.message)
+            elif event.kind == ev.FINISHED:
+                self.add_to_gallery(event.output_path, event.thumbnail)
+
+        # Progress comes from the bus counters, which stay exact even if
+        # events were dropped while we weren't draining. Skipped files count
+        # toward progress, but have no new output to show.
+        counts = self.events.counts()
+        total_files = counts.get(ev.DETECTED, 0)
+        processed_count = counts.get(ev.FINISHED, 0) + counts.get(ev.SKIPPED, 0)
+        if (total_files, processed_count) != (self.total_files, self.processed_count):
+            self.total_files, self.processed_count = total_files, processed_count
+            self.update_progress_ui()
+        if self.activity_dirty:
+            self.render_activity()
+        self.after(EVENT_REFRESH_MS, self.drain_events)
+
+    def render_activity(self):
+        self.activity_dirty = False
+        message = self.activity[-1] if self.activity else ""
         self.status_label.configure(text=message[:50] + "..." if len(message)>50 else message)
         self.log_box.configure(state="normal")
-        self.log_box.insert("0.0", message + "\n") # Insert at top
+        self.log_box.delete("0.0", "end")
+        # Newest at the top
+        self.log_box.insert("0.0", "\n".join(reversed(self.activity)))
         self.log_box.configure(state="disabled")
 
-        if message.startswith("Detected new file:"):
-             self.total_files += 1
-             self.update_progress_ui()
-
-        if message.startswith("Successfully processed: "):
-            path = message.replace("Successfully processed: ", "").strip()
-            self.processed_count += 1
-            self.update_progress_ui()
-            self.add_to_gallery(path)
-
     def update_progress_ui(self):
         self.processed_label.configure(text=str(self.processed_count))
         self.total_label.configure(text=f"/ {self.total_files} Files")
@@ -352,30 +398,48 @@ class CaptureSyncApp(ctk.CTk):
         else:
             self.progress_bar.set(0)
 
-    def add_to_gallery(self, image_path):
-        if not os.path.exists(image_path): return
+    def refresh_stats(self):
+        """
+        Pulls pipeline metrics into the Session Stats card once a second.
+        """
+        self.stats_after_id = None
+        if not self.engine:
+            return
+        snap = self.engine.pipeline.metrics.snapshot()
+        stages = snap["stages"]
+
+        def ms(stage):
+            mean = stages[stage]["mean"]
+            return f"{mean * 1000:.0f} ms" if mean is not None else "-"
+
+        self.stats_detail_label.configure(text=(
+            f"{snap['images_per_minute']:.1f} img/min   queue {snap['queue_depth']}   "
+            f"{snap['bytes_written'] / 1e6:.1f} MB\n"
+            f"detect {ms('detect')}   ready {ms('ready')}   decode {ms('decode')}\n"
+            f"composite {ms('composite')}   encode {ms('encode')}   sync {ms('sync')}"
+            + (f"\nuploads pending {snap['upload_queue_depth']}   upload {ms('upload')}" if self.engine.pipeline.uploads else "")
+        ))
+        self.stats_after_id = self.after(1000, self.refresh_stats)
+
+    def restore_gallery(self):
+        """
+        Refills the Gallery from the thumbnail cache on startup; nothing is decoded
+        until it scrolls into view, and then only the small cached thumbnail.
+        """
+        thumbnail_dir = self.extra_config.get("thumbnail_cache", thumbnails.CACHE_DIR)
+        output_folder = self.output_var.get()
+        if not thumbnail_dir or not output_folder:
+            return
         try:
-            img = Image.open(image_path)
-            img.thumbnail((250, 250)) 
-            ctk_img = ctk.CTkImage(light_image=img, dark_image=img, size=img.size)
-            lbl = ctk.CTkLabel(self.gallery_scroll, image=ctk_img, text="")
-            lbl.grid(row=self.gallery_row, column=self.gallery_col, padx=10, pady=10)
-            self.gallery_images.append(ctk_img)
-            self.gallery_col += 1
-            if self.gallery_col >= self.MAX_GALLERY_COLS:
-                self.gallery_col = 0
-                self.gallery_row += 1
+            self.gallery.add_many(thumbnails.ThumbnailIndex(thumbnail_dir).entries(output_folder))
         except Exception as e: print(f"Gallery error: {e}")
 
-    def count_initial_files(self, folder):
-        try:
-            exts = {".jpg", ".jpeg", ".png"}
-            count = 0
-            for f in os.listdir(folder):
-                if os.path.splitext(f)[1].lower() in exts:
-                    if "_processed" not in f: count += 1
-            return count
-        except Exception: return 0
+    def add_to_gallery(self, image_path, thumbnail=None):
+        if not os.path.exists(image_path): return
+        # The worker already wrote a thumbnail; the gallery loads it when it scrolls into view
+        if thumbnail is None and self.engine and self.engine.pipeline.thumbnails:
+            thumbnail = self.engine.pipeline.thumbnails.get(image_path)
+        self.gallery.add(os.path.abspath(image_path), thumbnail)
 
     def start_process(self):
         if not self.source_var.get() or not self.output_var.get(): return
@@ -387,34 +451,33 @@ class CaptureSyncApp(ctk.CTk):
         self.existing_cb.configure(state="disabled")
         
         self.processed_count = 0
-        src = self.source_var.get()
-        self.total_files = self.count_initial_files(src) if self.process_existing_var.get() else 0
+        # Grows as the watcher and the backfill report files (DETECTED events)
+        self.total_files = 0
         self.update_progress_ui()
-        self.log_box.configure(state="normal"); self.log_box.delete("0.0", "end"); self.log_box.configure(state="disabled")
+        self.activity.clear()
+        self.render_activity()
+        # Drop anything still queued from a previous run, and its counts
+        self.events.reset()
 
-        config = {
+        config = dict(self.extra_config)
+        config.update({
             "source_folder": self.source_var.get(),
             "landscape_overlay": self.landscape_var.get(),
             "portrait_overlay": self.portrait_var.get(),
             "output_folder": self.output_var.get(),
             "file_prefix": self.prefix_var.get()
-        }
+        })
         
         self.active_config = config # Save for Resume
-        self.log_cb = lambda msg: self.after(0, self.log, msg)
-
-        if self.process_existing_var.get():
-            threading.Thread(target=self.process_existing_files, args=(config, self.log_cb)).start()
 
-        self.observer = watcher.start_watcher(self.source_var.get(), config, log_callback=self.log_cb)
+        self.engine = Engine(config, log_callback=self.events.log, events=self.events).start(process_existing=self.process_existing_var.get())
+        self.refresh_stats()
 
     def toggle_pause(self):
         if not self.is_paused:
             # PAUSE
             self.is_paused = True
-            if self.observer:
-                self.observer.stop()
-                self.observer = None
+            self.engine.pause()
             self.pause_btn.configure(text="RESUME", border_color="yellow", text_color="yellow")
             self.status_label.configure(text="Paused.")
         else:
@@ -423,28 +486,20 @@ class CaptureSyncApp(ctk.CTk):
             self.pause_btn.configure(text="PAUSE", border_color="white", text_color="white")
             self.status_label.configure(text="Resumed.")
             # Restart watcher with same config
-            if self.active_config:
-                self.observer = watcher.start_watcher(self.source_var.get(), self.active_config, log_callback=self.log_cb)
-
-    def process_existing_files(self, config, log_callback):
-        source = config['source_folder']
-        try:
-            files = sorted(os.listdir(source))
-            for filename in files:
-                 if not self.running: break
-                 while self.is_paused:
-                     if not self.running: break
-                     self.update() # Keep UI alive but sleep logic
-                     threading.Event().wait(0.5)
-
-                 filepath = os.path.join(source, filename)
-                 if os.path.isfile(filepath): processor.process_file(filepath, config, log_callback)
-        except Exception as e: pass
+            self.engine.resume()
 
     def stop_process(self):
         self.running = False
         self.is_paused = False
-        if self.observer: self.observer.stop()
+        if self.stats_after_id:
+            self.after_cancel(self.stats_after_id)
+            self.stats_after_id = None
+        stats = {}
+        if self.engine:
+            stats = self.engine.pipeline.overlay_cache_stats()
+            # Don't block the UI on in-flight jobs; they finish in the background
+            self.engine.stop(wait=False)
+            self.engine = None
         
         self.start_btn.configure(state="normal", text="START PROCESS")
         self.pause_btn.configure(state="disabled", text="PAUSE", border_color="gray", text_color="gray")
@@ -452,6 +507,9 @@ class CaptureSyncApp(ctk.CTk):
         self.existing_cb.configure(state="normal")
         self.status_label.configure(text="Stopped.")
 
+        if stats:
+            self.log(f"Overlay cache: {stats['hits']} hits / {stats['misses']} misses")
+
 if __name__ == "__main__":
     app = CaptureSyncApp()
     app.mainloop()
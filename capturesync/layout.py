@@ -0,0 +1,56 @@
+import os
+import time
+
+# Where outputs go under output_folder:
+#   "flat"          everything straight in output_folder (the original layout)
+#   "session"       output_folder/<session>/
+#   "session_hour"  output_folder/<session>/<hour>/
+LAYOUTS = ("flat", "session", "session_hour")
+# Default session name: when the app (pipeline) started
+SESSION_FORMAT = "%Y-%m-%d_%H%M"
+HOUR_FORMAT = "%Hh"
+
+def layout_of(config):
+    layout = config.get("output_layout") or "flat"
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown output_layout: {layout}")
+    return layout
+
+def session_name(config, started=None):
+    """
+    config["session_name"] if set, else the start time (2026-10-18_1930).
+    """
+    name = config.get("session_name")
+    if name:
+        # A folder name, never a path
+        return name.replace(os.sep, "_").replace("/", "_").strip() or "session"
+    return time.strftime(SESSION_FORMAT, time.localtime(started or time.time()))
+
+def manifest_enabled(config):
+    """
+    The manifest is on for session layouts unless "manifest": false, and
+    off for the flat layout unless "manifest": true.
+    """
+    manifest = config.get("manifest")
+    if manifest is None:
+        return layout_of(config) != "flat"
+    return bool(manifest)
+
+def session_root(config, session):
+    """
+    Top folder of this session's outputs (output_folder itself when flat).
+    Sequence numbers are per session root.
+    """
+    output_folder = config.get("output_folder")
+    if not output_folder or layout_of(config) == "flat":
+        return output_folder
+    return os.path.join(output_folder, session)
+
+def output_folder_for(config, session, when=None):
+    """
+    Folder a job dispatched at time `when` writes its primary output to.
+    """
+    root = session_root(config, session)
+    if root and layout_of(config) == "session_hour":
+        return os.path.join(root, time.strftime(HOUR_FORMAT, time.localtime(when or time.time())))
+    return root
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Lives next to gui_config.json (working directory), not in the output folder
+LEDGER_FILE = "capturesync_ledger.db"
+
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+# Settings that change what gets written for a source, besides the overlays
+VERSION_SETTINGS = ("max_long_edge", "renditions", "file_prefix", "output_layout")
+
+def output_version(config):
+    """
+    Short fingerprint of what a source's outputs depend on: the overlays in
+    use (path + mtime), the output folder and VERSION_SETTINGS.
+    Picking or editing an overlay, or changing one of these, changes it, so
+    old ledger entries no longer match.
+    """
+    h = hashlib.sha1()
+    for path in (config.get("landscape_overlay"), config.get("portrait_overlay")):
+        if not path:
+            continue
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = 0
+        h.update(f"{os.path.abspath(path)}:{mtime};".encode("utf-8"))
+    # Jobs in session layouts carry their hour folder as output_folder;
+    # the top folder is what the user picked
+    output_folder = config.get("output_root") or config.get("output_folder")
+    if output_folder:
+        h.update(f"output_folder:{os.path.abspath(output_folder)};".encode("utf-8"))
+    for key in VERSION_SETTINGS:
+        value = config.get(key)
+        if value:
+            h.update(f"{key}:{json.dumps(value, sort_keys=True, default=str)};".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+def content_hash(file_path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+class Ledger:
+    """
+    On-disk record of source files that have already been processed.
+    Keyed by source path; an entry only counts if size, mtime, output version
+    (and content hash, when one was recorded and asked for) still match.
+    """
+    def __init__(self, path=LEDGER_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        # Several worker processes write here, so wait on locks instead of failing
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            " source_path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " content_hash TEXT,"
+            " output_path TEXT,"
+            " overlay_version TEXT,"
+            " processed_at REAL)"
+        )
+        self._conn.commit()
+
+    def lookup(self, source_path):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, content_hash, output_path, overlay_version, processed_at"
+                " FROM processed WHERE source_path = ?",
+                (os.path.abspath(source_path),)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("size", "mtime_ns", "content_hash", "output_path", "overlay_version", "processed_at")
+        return dict(zip(keys, row))
+
+    def is_processed(self, source_path, size, mtime_ns, version, file_hash=None):
+        entry = self.lookup(source_path)
+        if entry is None:
+            return False
+        if entry["size"] != size or entry["mtime_ns"] != mtime_ns or entry["overlay_version"] != version:
+            return False
+        if file_hash and entry["content_hash"] and entry["content_hash"] != file_hash:
+            return False
+        return True
+
+    def record(self, source_path, size, mtime_ns, output_path, version, file_hash=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO processed"
+                " (source_path, size, mtime_ns, content_hash, output_path, overlay_version, processed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(source_path), size, mtime_ns, file_hash, output_path, version, time.time())
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def get_ledger(path=LEDGER_FILE):
+    """
+    Returns this process's connection to the ledger at path.
+    Keyed by pid as well: worker processes must not reuse a connection
+    inherited from the parent through fork.
+    """
+    key = (os.getpid(), os.path.abspath(path))
+    with _ledgers_lock:
+        book = _ledgers.get(key)
+        if book is None:
+            book = _ledgers[key] = Ledger(path)
+        return book
@@ -1,5 +1,6 @@
 import sys
 import os
+import multiprocessing
 
 # Ensure we can import sibling modules if running as script from inside folder
 # (This adds the parent directory of 'capturesync' to sys.path)
@@ -7,11 +8,19 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, parent_dir)
 
-from capturesync.gui import CaptureSyncApp
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
 
-def main():
+    # Headless: never import the GUI (customtkinter needs a display)
+    if "--headless" in argv or "-h" in argv or "--help" in argv:
+        from capturesync import daemon
+        return daemon.main(argv)
+
+    from capturesync.gui import CaptureSyncApp
     app = CaptureSyncApp()
     app.mainloop()
 
 if __name__ == "__main__":
-    main()
+    # Needed for the worker pool in frozen (PyInstaller) Windows builds
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from PIL import Image
+from . import ledger
+
+# One JSON object per written file, so the GUI and downstream scripts can
+# follow new outputs without listing folders. Kept next to the ledger
+# (working directory), not in the Drive-synced output: the sync client
+# re-uploads a whole file on every change, and this one changes every photo.
+MANIFEST_DIR = "capturesync_manifests"
+
+def manifest_path(config, session):
+    """
+    The manifest for session's outputs to config["output_folder"]:
+    <manifest_dir>/<output folder name>_<hash of its path>/<session>.jsonl
+    """
+    output_folder = os.path.abspath(config["output_folder"])
+    digest = hashlib.sha1(output_folder.encode("utf-8")).hexdigest()[:8]
+    folder = f"{os.path.basename(output_folder) or 'output'}_{digest}"
+    return os.path.join(config.get("manifest_dir") or MANIFEST_DIR, folder, session + ".jsonl")
+
+def describe_output(path):
+    """
+    What the manifest records about a finished output: bytes, pixel size
+    (header read only) and SHA-256. Runs in the worker that wrote it.
+    """
+    with Image.open(path) as img:
+        width, height = img.size
+    return {
+        "path": path,
+        "bytes": os.path.getsize(path),
+        "width": width,
+        "height": height,
+        "sha256": ledger.content_hash(path),
+    }
+
+def describe_outputs(paths, renditions):
+    """
+    describe_output for every rendition written (outputs list, primary
+    first), tagged with the rendition name from resolved renditions.
+    Failures are left out rather than failing the job.
+    """
+    names = {os.path.abspath(r["folder"]): r["name"] for r in reversed(renditions)}
+    files = []
+    for i, path in enumerate(paths):
+        try:
+            info = describe_output(path)
+        except (OSError, ValueError) as e:
+            print(f"Could not describe {path} for the manifest: {e}")
+            continue
+        info["rendition"] = renditions[0]["name"] if i == 0 else names.get(os.path.abspath(os.path.dirname(path)), "")
+        files.append(info)
+    return files
+
+class Manifest:
+    """
+    Append-only index of a session's outputs (see manifest_path). Only the
+    parent process writes it (workers hand their file details back), so each
+    line is written whole by a single appender. Lines are never rewritten; readers remember their
+    byte offset and pick up where they left off (see read_entries).
+    """
+    def __init__(self, path, session=None):
+        self.path = path
+        self.session = session
+        self._lock = threading.Lock()
+        self._checked = False
+
+    def _needs_newline(self):
+        # A crash mid-append may have left a partial last line
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except OSError:
+            return False
+
+    def append(self, source_path, files, output_folder=None):
+        """
+        One line per file in files (see describe_outputs). "output" is the
+        path relative to output_folder ("/"-separated, like upload keys),
+        "path" the absolute one.
+        """
+        if not files:
+            return
+        lines = []
+        now = time.time()
+        for info in files:
+            relative = os.path.relpath(info["path"], output_folder) if output_folder else os.path.basename(info["path"])
+            lines.append(json.dumps({
+                "time": round(now, 3),
+                "session": self.session,
+                "source": os.path.abspath(source_path),
+                "output": relative.replace(os.sep, "/"),
+                "path": os.path.abspath(info["path"]),
+                "rendition": info["rendition"],
+                "bytes": info["bytes"],
+                "width": info["width"],
+                "height": info["height"],
+                "sha256": info["sha256"],
+            }) + "\n")
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            if not self._checked:
+                self._checked = True
+                if self._needs_newline():
+                    lines.insert(0, "\n")
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+
+def read_entries(path, offset=0):
+    """
+    Entries appended to the manifest at path since byte offset.
+    Returns (entries, next_offset); pass next_offset back in to only get
+    newer ones. A last line still being written is left for the next call.
+    """
+    entries = []
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except OSError:
+        return entries, offset
+    end = data.rfind(b"\n") + 1
+    for line in data[:end].splitlines():
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            # Torn line from a crash; the next append starts a fresh line
+            continue
+    return entries, offset + end
+
+def max_sequence_index(path, prefix):
+    """
+    Highest {prefix}_{index}.jpg number in the manifest at path (0 if none).
+    Replaces a directory scan for session folders, whose outputs are spread
+    over hour subfolders.
+    """
+    max_index = 0
+    for entry in read_entries(path)[0]:
+        filename = os.path.basename(entry.get("output", ""))
+        if filename.startswith(prefix + "_") and filename.endswith(".jpg"):
+            try:
+                max_index = max(max_index, int(filename[len(prefix) + 1:-4]))
+            except ValueError:
+                continue
+    return max_index
@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Pipeline stages we time, in the order a photo goes through them:
+#   detect    - first file event until the file is known to be complete
+#   queue     - waiting in the pipeline queue for a free worker
+#   ready     - wait_for_file_ready inside the worker
+#   decode    - open + EXIF transpose
+#   composite - overlay blend
+#   encode    - JPEG save
+#   sync      - uploader finalize (rename into the output folder)
+#   upload    - remote upload of one output, from the upload queue
+STAGES = ("detect", "queue", "ready", "decode", "composite", "encode", "sync", "upload")
+
+# Histogram bucket upper bounds, seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# images/min is measured over this trailing window
+RATE_WINDOW = 60.0
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q):
+        """
+        Bucket upper bound containing the q-quantile (coarse, but cheap).
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+class Metrics:
+    """
+    Thread-safe timing histograms and counters for one pipeline session.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.images_processed = 0
+        self.images_failed = 0
+        self.bytes_written = 0
+        self.queue_depth = 0
+        self.upload_queue_depth = 0
+        self._completions = deque()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.histograms[stage].observe(seconds)
+
+    def observe_many(self, timings):
+        with self._lock:
+            for stage, seconds in timings.items():
+                if stage in self.histograms:
+                    self.histograms[stage].observe(seconds)
+
+    def record_result(self, output_path=None, bytes_written=0):
+        now = time.monotonic()
+        with self._lock:
+            if output_path:
+                self.images_processed += 1
+                self.bytes_written += bytes_written
+                self._completions.append(now)
+            else:
+                self.images_failed += 1
+            self._trim(now)
+
+    def set_queue_depth(self, depth):
+        self.queue_depth = depth
+
+    def set_upload_queue_depth(self, depth):
+        self.upload_queue_depth = depth
+
+    def _trim(self, now):
+        while self._completions and now - self._completions[0] > RATE_WINDOW:
+            self._completions.popleft()
+
+    def images_per_minute(self):
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            window = min(RATE_WINDOW, time.time() - self.started_at)
+            return len(self._completions) * 60.0 / max(window, 1.0)
+
+    def snapshot(self):
+        rate = self.images_per_minute()
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "uptime": time.time() - self.started_at,
+                "images_processed": self.images_processed,
+                "images_failed": self.images_failed,
+                "bytes_written": self.bytes_written,
+                "queue_depth": self.queue_depth,
+                "upload_queue_depth": self.upload_queue_depth,
+                "images_per_minute": rate,
+                "stages": {stage: h.snapshot() for stage, h in self.histograms.items()},
+            }
+
+    def render_prometheus(self):
+        """
+        Prometheus text exposition format (for node_exporter's textfile collector etc).
+        """
+        rate = self.images_per_minute()
+        lines = []
+        with self._lock:
+            lines.append("# TYPE capturesync_stage_seconds histogram")
+            for stage, h in self.histograms.items():
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f'capturesync_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'capturesync_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'capturesync_stage_seconds_sum{{stage="{stage}"}} {h.total}')
+                lines.append(f'capturesync_stage_seconds_count{{stage="{stage}"}} {h.count}')
+            lines.append("# TYPE capturesync_images_processed_total counter")
+            lines.append(f"capturesync_images_processed_total {self.images_processed}")
+            lines.append("# TYPE capturesync_images_failed_total counter")
+            lines.append(f"capturesync_images_failed_total {self.images_failed}")
+            lines.append("# TYPE capturesync_bytes_written_total counter")
+            lines.append(f"capturesync_bytes_written_total {self.bytes_written}")
+            lines.append("# TYPE capturesync_queue_depth gauge")
+            lines.append(f"capturesync_queue_depth {self.queue_depth}")
+            lines.append("# TYPE capturesync_upload_queue_depth gauge")
+            lines.append(f"capturesync_upload_queue_depth {self.upload_queue_depth}")
+        lines.append("# TYPE capturesync_images_per_minute gauge")
+        lines.append(f"capturesync_images_per_minute {rate}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Writes a .json snapshot, or Prometheus text for any other extension.
+        Written to a temp file and renamed so readers never see half a file.
+        """
+        if os.path.splitext(path)[1].lower() == ".json":
+            content = json.dumps(self.snapshot(), indent=2)
+        else:
+            content = self.render_prometheus()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+class StatsFileWriter:
+    """
+    Rewrites the stats file every interval seconds until stopped.
+    """
+    def __init__(self, metrics, path, interval=10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="capturesync-stats", daemon=True)
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            self.metrics.write(self.path)
+        except OSError as e:
+            print(f"Could not write stats file {self.path}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+        # Final numbers for the session
+        self._write()
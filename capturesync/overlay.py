@@ -1,106 +1,750 @@
+import math
 import os
+import threading
+import time
+from collections import OrderedDict
 from PIL import Image, ImageOps
+from . import numpy_engine
+from . import overlay_store
+from . import sequence
+from . import thumbnails as thumbnail_cache
+from . import uploader
+
+# Memory cap for prepared overlays. A 6240x4160 RGBA overlay is ~100 MB,
+# so this holds a landscape + portrait pair for two camera bodies.
+OVERLAY_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# EXIF Orientation tag
+EXIF_ORIENTATION = 0x0112
+
+# Tile size used to find the parts of an overlay that aren't fully transparent
+REGION_TILE = 256
+
+# Photos with at least this many megapixels (after any decode cap) are
+# composited strip by strip, so a 100 MP panorama never has a full-size
+# RGBA copy or a full-size overlay in memory
+STRIP_MODE_MEGAPIXELS = 40
+# Pixels per strip; the strip height follows from the image width
+STRIP_PIXELS = 4 * 1024 * 1024
+
+# Rough peak bytes per output pixel of one job, for the pipeline's memory
+# budget (measured on a 96 MP JPEG). Full mode: decoded RGB + upright copy +
+# full-size RGBA overlay + RGBA patches. Strip mode: decoded RGB, briefly
+# twice while it is rotated upright in place; strip buffers are bounded by
+# STRIP_PIXELS. Both include the JPEG encoder, which with optimize=True
+# keeps every DCT coefficient until the file is written.
+FULL_MODE_BYTES_PER_PIXEL = 18
+STRIP_MODE_BYTES_PER_PIXEL = 8
+STRIP_MODE_FIXED_BYTES = STRIP_PIXELS * 16
+
+# What a rendition gets unless the config says otherwise. With no "renditions"
+# configured this is the only output: full size, into the output folder.
+DEFAULT_RENDITION = {
+    "name": "full",
+    "max_long_edge": None,
+    "quality": 90,
+    "subsampling": None,
+    "progressive": False,
+    "optimize": True,
+    "folder": None,
+}
+
+def find_opaque_regions(overlay, tile=REGION_TILE):
+    """
+    Boxes covering every pixel of overlay with alpha > 0.
+    Each tile row is scanned in tiles; adjacent non-empty tiles are merged
+    into one box, trimmed to the tight bounds of their content.
+    """
+    alpha = overlay.getchannel("A")
+    width, height = overlay.size
+    boxes = []
+    for top in range(0, height, tile):
+        run = None
+        for left in range(0, width, tile):
+            bbox = alpha.crop((left, top, min(left + tile, width), min(top + tile, height))).getbbox()
+            if bbox is None:
+                if run:
+                    boxes.append(run)
+                    run = None
+                continue
+            tight = (left + bbox[0], top + bbox[1], left + bbox[2], top + bbox[3])
+            if run is None:
+                run = tight
+            else:
+                run = (run[0], min(run[1], tight[1]), tight[2], max(run[3], tight[3]))
+        if run:
+            boxes.append(run)
+    return boxes
+
+class PreparedOverlay:
+    """
+    An overlay resized (RGBA) for one photo size, plus the regions where it
+    has any opacity. Branding frames and corner logos are mostly fully
+    transparent, so blending only those regions skips most of the frame.
+
+    from_regions() builds one from region crops alone (e.g. memory-mapped from
+    the overlay store); the full-size image is then only rebuilt if a non-RGB
+    photo needs it.
+    """
+    def __init__(self, image):
+        self._image = image
+        self.size = image.size
+        self.regions = [(box, image.crop(box)) for box in find_opaque_regions(image)]
+        self.nbytes = image.width * image.height * 4 + self._regions_nbytes()
+
+    @classmethod
+    def from_regions(cls, size, regions):
+        prepared = cls.__new__(cls)
+        prepared._image = None
+        prepared.size = tuple(size)
+        prepared.regions = regions
+        prepared.nbytes = prepared._regions_nbytes()
+        return prepared
+
+    def _regions_nbytes(self):
+        return sum(crop.width * crop.height * 4 for _, crop in self.regions)
+
+    @property
+    def image(self):
+        if self._image is None:
+            # Regions never overlap, so pasting them back is exact
+            image = Image.new("RGBA", self.size, (0, 0, 0, 0))
+            for box, crop in self.regions:
+                image.paste(crop, box[:2])
+            self._image = image
+        return self._image
+
+    def composite_onto(self, img):
+        """
+        Returns img with the overlay applied, as RGB.
+        RGB photos are blended region by region, in place; the result is
+        pixel-identical to converting the whole frame to RGBA, alpha_composite
+        and converting back, because alpha_composite is per pixel and leaves
+        pixels under alpha 0 untouched.
+        """
+        if img.mode != "RGB":
+            # e.g. PNG sources with their own alpha: keep the full-frame path
+            img = img.convert("RGBA")
+            img.alpha_composite(self.image)
+            return img.convert("RGB")
+
+        for box, overlay_crop in self.regions:
+            patch = img.crop(box).convert("RGBA")
+            patch.alpha_composite(overlay_crop)
+            img.paste(patch.convert("RGB"), box)
+        return img
+
+def _opaque_columns(alpha, tile=REGION_TILE):
+    """
+    (left, right) column runs of alpha (an "L" band) that have any pixel > 0.
+    """
+    runs = []
+    for left in range(0, alpha.width, tile):
+        bbox = alpha.crop((left, 0, min(left + tile, alpha.width), alpha.height)).getbbox()
+        if bbox is None:
+            continue
+        if runs and runs[-1][1] == left and bbox[0] == 0:
+            runs[-1] = (runs[-1][0], left + bbox[2])
+        else:
+            runs.append((left + bbox[0], left + bbox[2]))
+    return runs
+
+def _period(size, overlay_size):
+    """
+    Smallest run of photo pixels that maps onto whole overlay pixels
+    (size / gcd). Resize boxes that start on a multiple of it start on an
+    exact overlay coordinate, and Pillow then computes the same filter
+    weights as for the full-size resize.
+    """
+    return size // math.gcd(size, overlay_size)
+
+class StripOverlay:
+    """
+    An overlay kept at its own resolution, for strip mode. Each strip of the
+    photo gets just the overlay pixels it needs, resized on the fly with a
+    source box, and strips or columns where the overlay is fully
+    transparent are skipped.
+
+    Strip and span edges are aligned to whole overlay pixels (see _period),
+    which makes the result byte-identical to resizing the whole overlay and
+    blending it full frame. When the photo and overlay heights share no
+    small period (one period would be taller than a strip), strips are
+    not aligned and the result is within ±1 per channel instead.
+    """
+    def __init__(self, image):
+        self.image = image
+        self.alpha = image.getchannel("A")
+        self.size = image.size
+        self.nbytes = image.width * image.height * 5
+
+    def composite_onto(self, img, strip_pixels=STRIP_PIXELS):
+        """
+        Blends into img in place, strip by strip; returns the RGB result.
+        """
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+        width, height = img.size
+        overlay_width, overlay_height = self.image.size
+        scale_x = overlay_width / width
+        scale_y = overlay_height / height
+        # LANCZOS reads 3 source pixels either side (more when shrinking)
+        reach_x = 3 * max(scale_x, 1.0) + 1
+        reach_y = 3 * max(scale_y, 1.0) + 1
+        strip_height = max(16, strip_pixels // width)
+        period_y = _period(height, overlay_height)
+        if period_y <= strip_height:
+            strip_height -= strip_height % period_y
+        # Spans are widened to whole periods; a long period means one full-width span
+        period_x = _period(width, overlay_width)
+
+        for top in range(0, height, strip_height):
+            bottom = min(top + strip_height, height)
+            band = self.alpha.crop((0, max(0, int(top * scale_y - reach_y)),
+                                    overlay_width, min(overlay_height, math.ceil(bottom * scale_y + reach_y))))
+            spans = []
+            for left, right in _opaque_columns(band):
+                x0 = max(0, int((left - reach_x) / scale_x))
+                x1 = min(width, math.ceil((right + reach_x) / scale_x))
+                if period_x > REGION_TILE:
+                    x0, x1 = 0, width
+                else:
+                    x0 -= x0 % period_x
+                    x1 = min(width, x1 + (-x1) % period_x)
+                # Widened spans may meet; never blend a pixel twice
+                if spans and x0 <= spans[-1][1]:
+                    spans[-1] = (spans[-1][0], max(spans[-1][1], x1))
+                else:
+                    spans.append((x0, x1))
+
+            for x0, x1 in spans:
+                box = (x0, top, x1, bottom)
+                # Integer products first, so aligned edges are exact
+                source_box = (x0 * overlay_width / width, top * overlay_height / height,
+                              x1 * overlay_width / width, bottom * overlay_height / height)
+                overlay_part = self.image.resize((x1 - x0, bottom - top), Image.Resampling.LANCZOS, box=source_box)
+                patch = img.crop(box).convert("RGBA")
+                patch.alpha_composite(overlay_part)
+                img.paste(patch.convert(img.mode), box)
+
+        return img if img.mode == "RGB" else img.convert("RGB")
+
+def _prepare_overlay(overlay_path, size):
+    """
+    Opens the overlay PNG and resizes/converts it for a photo of the given size.
+    This is the expensive part we want to do once per (overlay, size), not per photo.
+    """
+    with Image.open(overlay_path) as overlay:
+        # Resize overlay to match image dimensions exactly
+        # Using LANCZOS for high quality downscaling/upscaling
+        overlay_resized = overlay.resize(size, Image.Resampling.LANCZOS)
+        # Ensure we are working in RGBA to handle transparency correctly
+        return PreparedOverlay(overlay_resized.convert("RGBA"))
+
+def _prepare_strip_overlay(overlay_path):
+    with Image.open(overlay_path) as overlay:
+        return StripOverlay(overlay.convert("RGBA"))
+
+class OverlayCache:
+    """
+    Process-wide LRU cache of PreparedOverlay objects.
+    Keyed by (overlay path, mtime, target size, orientation), so replacing the
+    PNG on disk naturally misses (and drops the old versions). Entries are evicted oldest-first once the
+    total pixel memory goes over max_bytes.
+
+    With a store_dir (set in each pipeline worker), misses are first looked
+    up in the on-disk overlay store (overlay_store.py), and freshly prepared
+    overlays are written there and used memory-mapped, so all workers share
+    one page-cache copy instead of each holding its own.
+    """
+    def __init__(self, max_bytes=OVERLAY_CACHE_MAX_BYTES, store_dir=None):
+        self.max_bytes = max_bytes
+        self.store_dir = store_dir
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, overlay_path, size, orientation, strips=False):
+        """
+        PreparedOverlay for photos of size, or with strips=True the
+        StripOverlay (one per overlay file, whatever the photo size).
+        """
+        size = None if strips else tuple(size)
+        key = (os.path.abspath(overlay_path), os.path.getmtime(overlay_path), size, orientation)
+
+        with self._lock:
+            prepared = self._entries.get(key)
+            if prepared is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return prepared
+            self.misses += 1
+
+        # Prepare outside the lock so one slow resize doesn't block other sizes
+        if strips:
+            prepared = _prepare_strip_overlay(overlay_path)
+        else:
+            prepared = self._from_store(overlay_path, size)
+        nbytes = prepared.nbytes
+
+        with self._lock:
+            # Versions of this overlay from before it was re-saved are never hit again
+            for old_key in [k for k in self._entries if k[0] == key[0] and k[1] != key[1]]:
+                self.current_bytes -= self._entries.pop(old_key).nbytes
+            if key not in self._entries and nbytes <= self.max_bytes:
+                self._entries[key] = prepared
+                self.current_bytes += nbytes
+                while self.current_bytes > self.max_bytes:
+                    _, old = self._entries.popitem(last=False)
+                    self.current_bytes -= old.nbytes
+                    self.evictions += 1
+        return prepared
+
+    def _from_store(self, overlay_path, size):
+        if not self.store_dir:
+            return _prepare_overlay(overlay_path, size)
+        try:
+            stored = overlay_store.load(self.store_dir, overlay_path, size)
+            if stored is None:
+                overlay_store.save(self.store_dir, overlay_path, _prepare_overlay(overlay_path, size))
+                # Use the mapped copy; the private one is dropped right away
+                stored = overlay_store.load(self.store_dir, overlay_path, size)
+            if stored is not None:
+                return PreparedOverlay.from_regions(*stored)
+        except Exception as e:
+            print(f"Overlay store unavailable: {e}")
+        return _prepare_overlay(overlay_path, size)
+
+    def charge(self, prepared, nbytes):
+        """
+        Counts nbytes kept alongside a cached overlay (the NumPy blend arrays)
+        towards its entry, evicting older entries if that goes over max_bytes.
+        Does nothing if prepared isn't cached.
+        """
+        with self._lock:
+            key = next((k for k, entry in self._entries.items() if entry is prepared), None)
+            if key is None:
+                return
+            prepared.nbytes += nbytes
+            self.current_bytes += nbytes
+            # In use right now; evict around it
+            self._entries.move_to_end(key)
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                self.current_bytes -= old.nbytes
+                self.evictions += 1
+
+    def invalidate(self, overlay_path=None):
+        """
+        Drops cached overlays for overlay_path, or everything if no path is given.
+        Not needed when an overlay is re-saved or replaced: the key has its mtime.
+        """
+        with self._lock:
+            if overlay_path is None:
+                self._entries.clear()
+                self.current_bytes = 0
+                return
+            target = os.path.abspath(overlay_path)
+            for key in [k for k in self._entries if k[0] == target]:
+                old = self._entries.pop(key)
+                self.current_bytes -= old.nbytes
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+            }
+
+overlay_cache = OverlayCache()
 
 def get_next_sequence_index(output_folder, prefix):
     """
-    Scans output_folder for files starting with {prefix}_
-    Returns the next available integer index.
+    Reserves the next {prefix}_{index}.jpg number for output_folder.
+    The folder is only scanned the first time; later calls are O(1).
     """
-    max_index = 0
-    try:
-        if not os.path.exists(output_folder):
-            return 1
-            
-        for filename in os.listdir(output_folder):
-            if filename.startswith(prefix + "_") and filename.endswith(".jpg"):
-                try:
-                    # Extract number part: PREFIX_123.jpg -> 123
-                    part = filename[len(prefix)+1:-4] 
-                    index = int(part)
-                    if index > max_index:
-                        max_index = index
-                except ValueError:
-                    continue
-    except Exception:
-        pass
+    return sequence.get_allocator(output_folder, prefix).reserve()
+
+def capped_size(size, max_long_edge):
+    """
+    Scales size down so its long edge is at most max_long_edge (never up).
+    """
+    width, height = size
+    long_edge = max(width, height)
+    if not max_long_edge or long_edge <= max_long_edge:
+        return size
+    scale = max_long_edge / long_edge
+    return (max(1, round(width * scale)), max(1, round(height * scale)))
+
+def _upright_size(img):
+    stored_size = img.size
+    # 5-8 are the orientations that swap width and height
+    rotated = img.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8)
+    return ((stored_size[1], stored_size[0]) if rotated else stored_size), rotated
+
+def output_size(img, max_long_edge=None):
+    """
+    Size open_for_output will produce for an opened (still lazy) image,
+    from the header alone.
+    """
+    return capped_size(_upright_size(img)[0], max_long_edge)
+
+def uses_strips(size, strip_megapixels=STRIP_MODE_MEGAPIXELS):
+    return bool(strip_megapixels) and size[0] * size[1] >= strip_megapixels * 1000000
+
+def open_for_strips(img, max_long_edge=None):
+    """
+    Decodes an opened image and turns it upright in place, so at most two
+    copies of the bitmap exist, and only while it is being rotated.
+    Capped to max_long_edge like open_for_output (draft mode first, so the
+    full-resolution bitmap is never decoded when the cap applies).
+    """
+    upright_size, rotated = _upright_size(img)
+    target = capped_size(upright_size, max_long_edge)
+    if target != upright_size:
+        img.draft(None, (target[1], target[0]) if rotated else target)
+    img.load()
+    ImageOps.exif_transpose(img, in_place=True)
+    if img.size != target:
+        img = img.resize(target, Image.Resampling.LANCZOS)
+    return img
+
+def estimate_memory(image_path, max_long_edge=None, renditions=None, strip_megapixels=STRIP_MODE_MEGAPIXELS):
+    """
+    Rough peak bytes process_image needs for image_path (header read only).
+    """
+    with Image.open(image_path) as img:
+        size = output_size(img, decode_long_edge(resolve_renditions(renditions, ""), max_long_edge))
+    pixels = size[0] * size[1]
+    if uses_strips(size, strip_megapixels):
+        return pixels * STRIP_MODE_BYTES_PER_PIXEL + STRIP_MODE_FIXED_BYTES
+    return pixels * FULL_MODE_BYTES_PER_PIXEL
+
+def open_for_output(img, max_long_edge=None):
+    """
+    Decodes an opened (still lazy) image, upright and capped to max_long_edge.
+    Size and EXIF orientation come from the header, so when the cap applies
+    the JPEG decoder uses DCT scaling (draft mode) and the full-resolution
+    bitmap is never materialized.
+    """
+    if max_long_edge:
+        upright_size, rotated = _upright_size(img)
+        target = capped_size(upright_size, max_long_edge)
+
+        if target != upright_size:
+            stored_target = (target[1], target[0]) if rotated else target
+            # Picks the largest 1/2, 1/4, 1/8 scale still >= stored_target (JPEG only)
+            img.draft(None, stored_target)
+            img = ImageOps.exif_transpose(img)
+            if img.size != target:
+                img = img.resize(target, Image.Resampling.LANCZOS)
+            return img
+
+    # Fix EXIF orientation (crucial for looking right)
+    return ImageOps.exif_transpose(img)
+
+def select_overlay(size, landscape_overlay_path, portrait_overlay_path):
+    """
+    Picks the overlay for an upright image of the given size.
+    Returns (orientation, overlay_path); overlay_path is None if that overlay isn't there.
+    """
+    width, height = size
     
-    return max_index + 1
+    # Logic Update v5.0: Square treated as Landscape
+    # Also relaxed requirements: one overlay might be None
+    
+    if width >= height: # Landscape or Square
+        orientation = 'landscape'
+        overlay_path = landscape_overlay_path
+    else: # Portrait
+        orientation = 'portrait'
+        overlay_path = portrait_overlay_path
+    
+    # Fallback Logic: If specific overlay missing, try the other one?
+    # User requirement: "atleast one overlay should be there"
+    # If landscape needed but missing, try using portrait if user only provided that? 
+    # (Though user said square can use landscape overlay. didn't explicitly say rotate portrait overlay).
+    # Let's strictly check if the *assigned* overlay exists.
+    
+    if not overlay_path or not os.path.exists(overlay_path):
+        # Try fallback if the other one exists?
+        # "if someone doesnt be having any vertical dimention photos... the field for both overlay not be required"
+        # This implies we just skip processing if we don't have the matching overlay?
+        # Or do we error out?
+        # "it just have a single face interface" -> implies maybe we just skip it silently or log warning.
+        # However, for 100% solidity, let's return None so caller knows we couldn't process it.
+        return orientation, None
+    return orientation, overlay_path
+
+def _numpy_arrays(prepared):
+    """
+    The NumPy blend arrays for prepared (built once, kept on it), counted
+    towards the overlay cache's memory limit when first built.
+    """
+    if getattr(prepared, "numpy_arrays", None) is None:
+        overlay_cache.charge(prepared, numpy_engine.for_prepared(prepared).nbytes)
+    return prepared.numpy_arrays
+
+def apply_overlay(img, prepared, engine="pillow"):
+    """
+    Blends prepared into img with the chosen compositing engine. Returns the RGB result.
+    """
+    if engine == "numpy" and img.mode == "RGB" and numpy_engine.available():
+        _numpy_arrays(prepared)
+        return numpy_engine.composite(img, prepared)
+    return prepared.composite_onto(img)
+
+def output_path_for(image_path, output_folder, file_prefix=None, sequence_index=None):
+    # Prepare output path
+    filename = os.path.basename(image_path)
+
+    if file_prefix:
+        # Sequential naming strategy
+        next_index = sequence_index or get_next_sequence_index(output_folder, file_prefix)
+        output_filename = f"{file_prefix}_{next_index}.jpg"
+    else:
+        # Original naming strategy
+        name, ext = os.path.splitext(filename)
+        output_filename = f"{name}_processed.jpg"
+
+    return os.path.join(output_folder, output_filename)
+
+def resolve_renditions(renditions, output_folder):
+    """
+    Fills in defaults for the "renditions" config list and resolves folders.
+    Each entry may set name, max_long_edge, quality, subsampling, progressive,
+    optimize and folder. The first rendition is the primary output (the one
+    that is logged, synced and recorded); it goes to output_folder unless it
+    names a folder. Later ones default to output_folder/<name>, and relative
+    folders are taken relative to output_folder.
+    """
+    resolved = []
+    for i, rendition in enumerate(renditions or [{}]):
+        r = dict(DEFAULT_RENDITION)
+        r.update(rendition or {})
+        if i and r["name"] == DEFAULT_RENDITION["name"]:
+            r["name"] = f"rendition{i}"
+        if r["folder"]:
+            r["folder"] = os.path.join(output_folder, r["folder"])
+        else:
+            r["folder"] = output_folder if i == 0 else os.path.join(output_folder, r["name"])
+        resolved.append(r)
+    return resolved
+
+def decode_long_edge(renditions, max_long_edge=None):
+    """
+    The long edge to decode at: max_long_edge, or the largest rendition cap
+    when every rendition is capped, so a web + thumbnail setup never
+    materializes the full-resolution bitmap.
+    """
+    caps = [r.get("max_long_edge") for r in renditions]
+    if caps and all(caps):
+        largest = max(caps)
+        return min(largest, max_long_edge) if max_long_edge else largest
+    return max_long_edge
+
+def save_staged(img, output_path, staging_root=None, **options):
+    """
+    Writes img as a JPEG into the staging folder for output_path (under
+    staging_root, see uploader.staging_folder) and fsyncs it.
+    Returns the staged path; uploader.finalize moves it into place.
+    """
+    staged_path = uploader.staging_path(output_path, staging_root)
+    with open(staged_path, "wb") as f:
+        img.save(f, "JPEG", **options)
+        f.flush()
+        os.fsync(f.fileno())
+    return staged_path
+
+def save_renditions(final_img, output_filename, renditions, timings=None, staging_root=None):
+    """
+    Encodes the composited image once per rendition. Smaller renditions are
+    resized from the composited buffer; the slow optimize pass only runs for
+    renditions that ask for it. Records the total into timings["encode"].
+    Files are written to staging under staging_root (see save_staged).
+    Returns the staged paths, primary first.
+    """
+    start = time.perf_counter()
+    paths = []
+    for r in renditions:
+        img = final_img
+        size = capped_size(final_img.size, r["max_long_edge"])
+        if size != final_img.size:
+            # reducing_gap: cheap box reduction first, LANCZOS for the last step
+            img = final_img.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
 
-def process_image(image_path, landscape_overlay_path, portrait_overlay_path, output_folder, file_prefix=None):
+        options = {"quality": r["quality"], "optimize": bool(r["optimize"]), "progressive": bool(r["progressive"])}
+        if r["subsampling"] is not None:
+            # 0/1/2 or "4:4:4" / "4:2:2" / "4:2:0"
+            options["subsampling"] = r["subsampling"]
+
+        os.makedirs(r["folder"], exist_ok=True)
+        paths.append(save_staged(img, os.path.join(r["folder"], output_filename), staging_root, **options))
+    if timings is not None:
+        timings["encode"] = time.perf_counter() - start
+    return paths
+
+def _save_thumbnail(final_img, thumbnail_dir, thumbnails, timings):
+    """
+    Gallery thumbnail from the composited buffer, so nobody has to decode
+    the output again to show it. Counted as part of encode.
+    """
+    start = time.perf_counter()
+    try:
+        path = thumbnail_cache.save_thumbnail(final_img, thumbnail_dir)
+        if thumbnails is not None:
+            thumbnails.append(path)
+    except Exception as e:
+        print(f"Could not write thumbnail: {e}")
+    timings["encode"] = timings.get("encode", 0) + time.perf_counter() - start
+
+def process_image(image_path, landscape_overlay_path, portrait_overlay_path, output_folder, file_prefix=None, sequence_index=None, timings=None, max_long_edge=None, engine="pillow", renditions=None, outputs=None, finalize=True, thumbnail_dir=None, thumbnails=None, strip_megapixels=STRIP_MODE_MEGAPIXELS, staging_root=None):
     """
     Reads image, detects orientation, applies appropriate overlay, and saves to output_folder.
-    If file_prefix is provided, saves as {file_prefix}_{index}.jpg
-    Returns the path to the saved file if successful, None otherwise.
+    If file_prefix is provided, saves as {file_prefix}_{index}.jpg, using sequence_index
+    when the caller already reserved one (the pipeline does, since workers are separate processes).
+    If max_long_edge is set, the output is capped to that long edge (decoded at reduced size).
+    engine selects the compositor: "pillow" (default) or "numpy".
+    renditions is the "renditions" config list (see resolve_renditions); the
+    image is decoded and composited once and every rendition is encoded from
+    that buffer. If an outputs list is given, all written paths are appended to it.
+    Files are written to a hidden staging folder (under staging_root, default
+    next to their folder) and renamed into place; with finalize=False they are left staged (and staged paths are returned) for
+    the uploader to finalize.
+    If thumbnail_dir is set, a gallery thumbnail is made from the composited
+    buffer and stored there (see thumbnails.py); its path is appended to the
+    thumbnails list if one is given.
+    Photos of strip_megapixels or more are blended strip by strip with the
+    Pillow compositor (see StripOverlay) to bound memory; 0/None turns that off.
+    If a timings dict is given, decode/composite/encode seconds are recorded into it.
+    Returns the path to the primary saved file if successful, None otherwise.
     """
+    if timings is None:
+        timings = {}
+    renditions = resolve_renditions(renditions, output_folder)
     try:
+        start = time.perf_counter()
         # Open the image
         with Image.open(image_path) as img:
-            # Fix EXIF orientation (crucial for looking right)
-            img = ImageOps.exif_transpose(img)
+            decode_cap = decode_long_edge(renditions, max_long_edge)
+            strips = uses_strips(output_size(img, decode_cap), strip_megapixels)
+            img = open_for_strips(img, decode_cap) if strips else open_for_output(img, decode_cap)
+            timings["decode"] = time.perf_counter() - start
             
             # Determine orientation
-            width, height = img.size
-            
-            # Logic Update v5.0: Square treated as Landscape
-            # Also relaxed requirements: one overlay might be None
-            
-            if width >= height: # Landscape or Square
-                orientation = 'landscape'
-                overlay_path = landscape_overlay_path
-            else: # Portrait
-                orientation = 'portrait'
-                overlay_path = portrait_overlay_path
-            
-            # Fallback Logic: If specific overlay missing, try the other one?
-            # User requirement: "atleast one overlay should be there"
-            # If landscape needed but missing, try using portrait if user only provided that? 
-            # (Though user said square can use landscape overlay. didn't explicitly say rotate portrait overlay).
-            # Let's strictly check if the *assigned* overlay exists.
-            
-            if not overlay_path or not os.path.exists(overlay_path):
-                # Try fallback if the other one exists?
-                # "if someone doesnt be having any vertical dimention photos... the field for both overlay not be required"
-                # This implies we just skip processing if we don't have the matching overlay?
-                # Or do we error out?
-                # "it just have a single face interface" -> implies maybe we just skip it silently or log warning.
-                # However, for 100% solidity, let's return None so caller knows we couldn't process it.
+            orientation, overlay_path = select_overlay(img.size, landscape_overlay_path, portrait_overlay_path)
+            if not overlay_path:
                 print(f"Skipping {image_path}: No overlay found for {orientation} orientation.") 
                 return None
                 
-            with Image.open(overlay_path) as overlay:
-                # Resize overlay to match image dimensions exactly
-                # Using LANCZOS for high quality downscaling/upscaling
-                overlay_resized = overlay.resize((width, height), Image.Resampling.LANCZOS)
-                
-                # Ensure we are working in RGBA to handle transparency correctly
-                img = img.convert("RGBA")
-                overlay_resized = overlay_resized.convert("RGBA")
-                
-                # Apply overlay
-                img.alpha_composite(overlay_resized)
-                
-                # Prepare output path
-                filename = os.path.basename(image_path)
-                
-                if file_prefix:
-                    # Sequential naming strategy
-                    next_index = get_next_sequence_index(output_folder, file_prefix)
-                    output_filename = f"{file_prefix}_{next_index}.jpg"
-                else:
-                    # Original naming strategy
-                    name, ext = os.path.splitext(filename)
-                    output_filename = f"{name}_processed.jpg"
+            start = time.perf_counter()
 
-                output_path = os.path.join(output_folder, output_filename)
-                
-                # Convert back to RGB for JPEG saving
-                final_img = img.convert("RGB")
-                
-                # Save
-                final_img.save(output_path, quality=90, optimize=True)
-                
-                return output_path
+            if strips:
+                # Overlay rows are resized per strip; nothing full-size but the photo
+                final_img = overlay_cache.get(overlay_path, img.size, orientation, strips=True).composite_onto(img)
+            else:
+                # Resized overlay, shared between photos of the same size
+                prepared = overlay_cache.get(overlay_path, img.size, orientation)
+
+                # Apply overlay (only where it isn't fully transparent)
+                final_img = apply_overlay(img, prepared, engine)
+
+            output_path = output_path_for(image_path, output_folder, file_prefix, sequence_index)
+
+            timings["composite"] = time.perf_counter() - start
+
+            # Save every rendition from the one composited buffer
+            paths = save_renditions(final_img, os.path.basename(output_path), renditions, timings, staging_root)
+            if thumbnail_dir:
+                _save_thumbnail(final_img, thumbnail_dir, thumbnails, timings)
+            if finalize:
+                paths = [uploader.finalize(path) for path in paths]
+            if outputs is not None:
+                outputs.extend(paths)
+
+            return paths[0]
 
     except Exception as e:
         print(f"Error processing {image_path}: {e}")
         return None
+
+def process_image_batch(image_paths, landscape_overlay_path, portrait_overlay_path, output_folder, file_prefix=None, sequence_indices=None, timings_list=None, max_long_edge=None, engine="numpy", renditions=None, outputs_list=None, finalize=True, thumbnail_dir=None, thumbnails_list=None, strip_megapixels=STRIP_MODE_MEGAPIXELS, staging_root=None):
+    """
+    process_image for a burst of files. Everything is decoded first; images of
+    the same size that use the same overlay are then blended together (one
+    vectorized operation per overlay region with the numpy engine) and saved.
+    Returns a list of primary output paths, None where an image was skipped or failed.
+    finalize, thumbnail_dir, strip_megapixels and staging_root work as in process_image;
+    strip-mode photos are handled one at a time, never held decoded together.
+    """
+    count = len(image_paths)
+    sequence_indices = sequence_indices or [None] * count
+    timings_list = timings_list or [{} for _ in range(count)]
+    outputs_list = outputs_list or [[] for _ in range(count)]
+    thumbnails_list = thumbnails_list or [[] for _ in range(count)]
+    resolved = resolve_renditions(renditions, output_folder)
+    decode_cap = decode_long_edge(resolved, max_long_edge)
+    results = [None] * count
+
+    decoded = {}
+    groups = OrderedDict()
+    for i, image_path in enumerate(image_paths):
+        try:
+            start = time.perf_counter()
+            with Image.open(image_path) as img:
+                if uses_strips(output_size(img, decode_cap), strip_megapixels):
+                    img = None
+                else:
+                    img = open_for_output(img, decode_cap)
+            if img is None:
+                results[i] = process_image(image_path, landscape_overlay_path, portrait_overlay_path, output_folder,
+                                           file_prefix, sequence_indices[i], timings_list[i], max_long_edge, engine,
+                                           renditions, outputs_list[i], finalize, thumbnail_dir, thumbnails_list[i],
+                                           strip_megapixels, staging_root)
+                continue
+            timings_list[i]["decode"] = time.perf_counter() - start
+
+            orientation, overlay_path = select_overlay(img.size, landscape_overlay_path, portrait_overlay_path)
+            if not overlay_path:
+                print(f"Skipping {image_path}: No overlay found for {orientation} orientation.")
+                continue
+            decoded[i] = img
+            groups.setdefault((overlay_path, img.size, orientation), []).append(i)
+        except Exception as e:
+            print(f"Error processing {image_path}: {e}")
+
+    for (overlay_path, size, orientation), indices in groups.items():
+        try:
+            start = time.perf_counter()
+            prepared = overlay_cache.get(overlay_path, size, orientation)
+            images = [decoded[i] for i in indices]
+            if engine == "numpy" and numpy_engine.available() and all(img.mode == "RGB" for img in images):
+                _numpy_arrays(prepared)
+                images = numpy_engine.composite_batch(images, prepared)
+            else:
+                images = [apply_overlay(img, prepared, engine) for img in images]
+            # Shared work: charge each image an equal share
+            share = (time.perf_counter() - start) / len(indices)
+        except Exception as e:
+            print(f"Error compositing batch for {overlay_path}: {e}")
+            continue
+
+        for i, final_img in zip(indices, images):
+            try:
+                timings_list[i]["composite"] = share
+                output_path = output_path_for(image_paths[i], output_folder, file_prefix, sequence_indices[i])
+                paths = save_renditions(final_img, os.path.basename(output_path), resolved, timings_list[i], staging_root)
+                if thumbnail_dir:
+                    _save_thumbnail(final_img, thumbnail_dir, thumbnails_list[i], timings_list[i])
+                if finalize:
+                    paths = [uploader.finalize(path) for path in paths]
+                outputs_list[i].extend(paths)
+                results[i] = paths[0]
+            except Exception as e:
+                print(f"Error processing {image_paths[i]}: {e}")
+    return results
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+from PIL import Image
+
+# Prepared overlays on disk, next to the ledger (working directory)
+STORE_DIR = "capturesync_overlays"
+# Entries unused for this long are deleted, and the oldest ones once the
+# store grows past STORE_MAX_BYTES
+STORE_MAX_AGE = 7 * 24 * 3600
+STORE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# Bump when the entry layout changes; old entries simply stop matching
+FORMAT_VERSION = 1
+
+_hashes = {}
+_hashes_lock = threading.Lock()
+
+def content_key(overlay_path):
+    """
+    SHA-1 of the overlay file. Remembered per (path, mtime, size), so it is
+    read once per process; a re-saved PNG with the same pixels still hits.
+    """
+    stat = os.stat(overlay_path)
+    memo_key = (os.path.abspath(overlay_path), stat.st_mtime_ns, stat.st_size)
+    with _hashes_lock:
+        digest = _hashes.get(memo_key)
+    if digest is None:
+        h = hashlib.sha1()
+        with open(overlay_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with _hashes_lock:
+            _hashes[memo_key] = digest
+    return digest
+
+def _entry_base(store_dir, key, size):
+    return os.path.join(store_dir, f"{key}_{size[0]}x{size[1]}_v{FORMAT_VERSION}")
+
+def _replace_new(tmp_path, path):
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another worker got there first and it's mapped (Windows); same bytes anyway
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def save(store_dir, overlay_path, prepared):
+    """
+    Writes prepared's opaque regions (straight-alpha RGBA, one raw block each)
+    and an index of their boxes and offsets. The index is written last, so an
+    entry only counts once its data is complete.
+    """
+    base = _entry_base(store_dir, content_key(overlay_path), prepared.size)
+    if os.path.exists(base + ".json"):
+        return
+    os.makedirs(store_dir, exist_ok=True)
+    regions = []
+    offset = 0
+    tmp_suffix = f".{os.getpid()}.tmp"
+    with open(base + ".rgba" + tmp_suffix, "wb") as f:
+        for box, crop in prepared.regions:
+            data = crop.tobytes()
+            f.write(data)
+            regions.append({"box": list(box), "offset": offset})
+            offset += len(data)
+    _replace_new(base + ".rgba" + tmp_suffix, base + ".rgba")
+    with open(base + ".json" + tmp_suffix, "w", encoding="utf-8") as f:
+        json.dump({"size": list(prepared.size), "regions": regions}, f)
+    _replace_new(base + ".json" + tmp_suffix, base + ".json")
+
+def load(store_dir, overlay_path, size):
+    """
+    Region crops for overlay_path at size, memory-mapped read-only from the
+    store (the pixels stay in the shared page cache), or None on a miss.
+    Returns (size, [(box, crop), ...]).
+    """
+    base = _entry_base(store_dir, content_key(overlay_path), size)
+    try:
+        with open(base + ".json", "r", encoding="utf-8") as f:
+            index = json.load(f)
+        regions = []
+        with open(base + ".rgba", "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # Fully transparent overlay; nothing to map
+                return tuple(index["size"]), []
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    # Used: keeps it out of the garbage collector's reach
+    try:
+        os.utime(base + ".json")
+    except OSError:
+        pass
+
+    view = memoryview(mapped)
+    for region in index["regions"]:
+        left, top, right, bottom = region["box"]
+        crop_size = (right - left, bottom - top)
+        length = crop_size[0] * crop_size[1] * 4
+        # No copy: the image reads straight from the mapping
+        crop = Image.frombuffer("RGBA", crop_size, view[region["offset"]:region["offset"] + length], "raw", "RGBA", 0, 1)
+        regions.append((tuple(region["box"]), crop))
+    return tuple(index["size"]), regions
+
+def collect_garbage(store_dir=STORE_DIR, max_age=STORE_MAX_AGE, max_bytes=STORE_MAX_BYTES):
+    """
+    Deletes entries not used for max_age seconds, then the least recently used
+    ones until the store fits in max_bytes. Also clears leftover temp files.
+    Returns the number of entries removed.
+    """
+    try:
+        names = set(os.listdir(store_dir))
+    except OSError:
+        return 0
+
+    entries = []
+    for name in names:
+        path = os.path.join(store_dir, name)
+        # Temp files of a crashed writer, and data whose index was deleted
+        # while a worker still had it mapped; an hour old, so not mid-write
+        orphan = name.endswith(".rgba") and name[:-len(".rgba")] + ".json" not in names
+        if name.endswith(".tmp") or orphan:
+            try:
+                if time.time() - os.path.getmtime(path) > 3600:
+                    os.remove(path)
+            except OSError:
+                pass
+            continue
+        if not name.endswith(".json"):
+            continue
+        base = path[:-len(".json")]
+        try:
+            used = os.path.getmtime(path)
+            nbytes = os.path.getsize(base + ".rgba")
+        except OSError:
+            used, nbytes = 0, 0
+        entries.append((used, base, nbytes))
+
+    entries.sort()
+    total = sum(nbytes for _, _, nbytes in entries)
+    now = time.time()
+    removed = 0
+    for used, base, nbytes in entries:
+        if now - used <= max_age and total <= max_bytes:
+            break
+        try:
+            # Index first, so nobody starts mapping a half-deleted entry
+            os.remove(base + ".json")
+            os.remove(base + ".rgba")
+        except OSError:
+            # Still mapped by a worker (Windows); next time
+            continue
+        total -= nbytes
+        removed += 1
+    return removed
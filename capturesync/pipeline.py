@@ -0,0 +1,526 @@
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from . import events as ev
+from .budget import MemoryBudget
+from . import layout
+from . import manifest
+from . import numpy_engine
+from . import overlay
+from . import overlay_store
+from . import processor
+from . import sequence
+from . import sources
+from . import thumbnails
+from . import uploader
+from .metrics import Metrics
+from .readiness import ReadinessTracker
+from .upload_queue import PRIORITY_BACKFILL, PRIORITY_LIVE, UPLOAD_QUEUE_FILE, UploadQueue
+
+# How many detected paths may wait for a worker before the watcher blocks
+DEFAULT_QUEUE_SIZE = 256
+# Backfill paths waiting per worker; kept small so the backlog scanner
+# streams lazily instead of racing ahead of the workers
+BACKFILL_LANE_PER_WORKER = 2
+
+def default_worker_count():
+    # Leave one core for the watcher / GUI thread
+    return max(1, (os.cpu_count() or 2) - 1)
+
+def _init_worker(overlay_store_dir=None):
+    """
+    Workers leave shutdown to the parent: Ctrl+C / service stop reaches the
+    whole process group, and we don't want workers dying mid-write or running
+    the parent's signal handlers inherited through fork.
+    Prepared overlays come from (and go to) the shared on-disk store.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    overlay.overlay_cache.store_dir = overlay_store_dir
+
+def _describe(output_path, outputs, config):
+    """
+    Manifest details of every file written (see manifest.describe_outputs),
+    worked out here in the worker so the parent only appends lines.
+    """
+    if not output_path or not layout.manifest_enabled(config):
+        return []
+    renditions = overlay.resolve_renditions(config.get("renditions"), config.get("output_folder"))
+    return manifest.describe_outputs(outputs or [output_path], renditions)
+
+def _result(file_path, output_path, messages, timings, outputs, thumbnail_paths, files=()):
+    bytes_written = 0
+    if output_path:
+        # Every rendition counts towards bytes written
+        for path in outputs or [output_path]:
+            try:
+                bytes_written += os.path.getsize(path)
+            except OSError:
+                pass
+    return {
+        "file_path": file_path,
+        "messages": messages,
+        "output_path": output_path,
+        "timings": timings,
+        "bytes_written": bytes_written,
+        # Final paths of every rendition, for the parent's upload queue
+        "outputs": list(outputs) if output_path else [],
+        "thumbnail": thumbnail_paths[0] if output_path and thumbnail_paths else None,
+        # For the manifest (empty unless it is on)
+        "files": list(files),
+        "pid": os.getpid(),
+        # Each worker has its own overlay cache; the parent sums these up
+        "overlay_cache": overlay.overlay_cache.stats(),
+    }
+
+def _run_job(file_path, config, sequence_index=None):
+    """
+    Runs inside a worker process.
+    Log callbacks can't cross the process boundary, so we collect the
+    messages here and the parent replays them through its own callback.
+    """
+    messages = []
+    timings = {}
+    outputs = []
+    thumbnail_paths = []
+    output_path = processor.process_file(file_path, config, log_callback=messages.append,
+                                         sequence_index=sequence_index, timings=timings, outputs=outputs,
+                                         thumbnails=thumbnail_paths)
+    files = _describe(output_path, outputs, config)
+    return [_result(file_path, output_path, messages, timings, outputs, thumbnail_paths, files)]
+
+def _run_batch(file_paths, config, sequence_indices):
+    """
+    Like _run_job, for a burst of files blended together (composite_batch_size > 1).
+    """
+    messages = [[] for _ in file_paths]
+    timings = [{} for _ in file_paths]
+    outputs = [[] for _ in file_paths]
+    thumbnail_paths = [[] for _ in file_paths]
+    output_paths = processor.process_files(file_paths, config, log_callbacks=[m.append for m in messages],
+                                           sequence_indices=sequence_indices, timings_list=timings,
+                                           outputs_list=outputs, thumbnails_list=thumbnail_paths)
+    files = [_describe(output_path, paths, config) for output_path, paths in zip(output_paths, outputs)]
+    return [_result(*args) for args in zip(file_paths, output_paths, messages, timings, outputs, thumbnail_paths, files)]
+
+class Pipeline:
+    """
+    Bounded job queue in front of a pool of worker processes.
+    The watcher only reports file events; the readiness tracker decides when a
+    file is complete and enqueues it. Decode/composite/encode happens in the pool.
+
+    There are two lanes: live captures (self.jobs) and backfill
+    (self.backfill_jobs). The dispatcher only takes from the backfill lane when
+    no live capture is waiting, so newly shot photos jump the backlog.
+
+    Files from every source root share the one pool; each job is run with the
+    profile (overlays, prefix, output folder...) of the source it came from.
+
+    With a session output_layout, outputs go to a folder per pipeline run
+    (and per hour) under output_folder, and every file written is appended
+    to the session's manifest (see layout.py, manifest.py).
+    """
+    def __init__(self, config, log_callback=None, max_workers=None, queue_size=None, events=None):
+        self.config = config
+        self.sources = sources.SourceRouter(config)
+        self.log_callback = log_callback or print
+        # Optional events.EventBus for front-ends that want structured updates
+        self.events = events
+        self.max_workers = max_workers or config.get("max_workers") or default_worker_count()
+        # Same-size burst frames handed to one worker together (numpy batch mode)
+        self.batch_size = max(1, int(config.get("composite_batch_size") or 1))
+        self.jobs = queue.Queue(maxsize=queue_size or config.get("queue_size") or DEFAULT_QUEUE_SIZE)
+        self.backfill_jobs = queue.Queue(maxsize=BACKFILL_LANE_PER_WORKER * self.max_workers)
+        # Counts paths waiting in either lane, so the dispatcher can wait on both
+        self._available = threading.Semaphore(0)
+
+        # At most max_workers jobs are handed to the pool; the rest wait in self.jobs
+        self._slots = threading.Semaphore(self.max_workers)
+        # Optional RAM ceiling for all jobs in flight together (memory_budget_mb)
+        budget_mb = config.get("memory_budget_mb")
+        self.budget = MemoryBudget(int(budget_mb * 1024 * 1024)) if budget_mb else None
+        # Paths queued or running (-> enqueue time), so duplicate events don't double-process
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+        # Upload priority per in-flight path (live captures vs backfill)
+        self._priorities = {}
+
+        self.metrics = Metrics()
+        self._worker_cache_stats = {}
+        self._stopping = threading.Event()
+        self._executor = None
+        self._dispatcher = None
+        self.uploads = None
+        thumbnail_dir = config.get("thumbnail_cache", thumbnails.CACHE_DIR)
+        self.thumbnails = thumbnails.ThumbnailIndex(thumbnail_dir) if thumbnail_dir else None
+        self.readiness = ReadinessTracker(self.submit, self.log_callback, metrics=self.metrics)
+
+        for profile in self.sources.profiles or [config]:
+            try:
+                layout.layout_of(profile)
+            except ValueError as e:
+                self.log_callback(f"{e}; using the flat layout.")
+                profile["output_layout"] = "flat"
+            # Every job of such a source fails with the same message; say it once up front
+            self._staging_root(profile, report=True)
+        # Names this run's session folder (session layouts)
+        self.session = layout.session_name(config)
+        # Manifest path -> manifest.Manifest
+        self._manifests = {}
+        self._made_folders = set()
+
+    def start(self):
+        if self.config.get("composite_engine") == "numpy" and not numpy_engine.available():
+            self.log_callback("NumPy is not installed; using the Pillow compositor.")
+        self._clean_staging()
+        self._start_uploads()
+        self.readiness.start()
+        store_dir = self.config.get("overlay_store", overlay_store.STORE_DIR)
+        if store_dir:
+            removed = overlay_store.collect_garbage(store_dir)
+            if removed:
+                self.log_callback(f"Removed {removed} unused prepared overlay(s).")
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                             initargs=(store_dir,))
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="capturesync-dispatch", daemon=True)
+        self._dispatcher.start()
+        return self
+
+    def _clean_staging(self):
+        """
+        Outputs still staged from a previous run never finished (crash, power
+        loss); drop them before any worker writes. Their sources aren't in the
+        ledger, so they are simply processed again.
+        """
+        # Staging root -> destination folders staged there
+        folders = {}
+        for profile in self.sources.profiles or [self.config]:
+            if not profile.get("output_folder"):
+                continue
+            bases = [profile["output_folder"]]
+            if layout.layout_of(profile) != "flat":
+                # A named session may be resumed; its hour folders too
+                root = layout.session_root(profile, self.session)
+                bases = [root]
+                if layout.layout_of(profile) == "session_hour" and os.path.isdir(root):
+                    with os.scandir(root) as entries:
+                        bases.extend(entry.path for entry in entries if entry.is_dir() and not entry.name.startswith("."))
+            staging = self._staging_root(profile)
+            if staging is None:
+                continue
+            staged = folders.setdefault(staging, set())
+            for base in bases:
+                staged.update(r["folder"] for r in overlay.resolve_renditions(profile.get("renditions"), base))
+        removed = sum(uploader.clean_staging(staged, root) for root, staged in folders.items())
+        if removed:
+            self.log_callback(f"Removed {removed} unfinished file(s) from staging.")
+
+    def _staging_root(self, profile, report=False):
+        """
+        uploader.staging_root, or None when the profile has no safe staging
+        folder (the worker then fails its jobs with the reason).
+        """
+        try:
+            return uploader.staging_root(profile)
+        except ValueError as e:
+            if report:
+                self.log_callback(str(e))
+            return None
+
+    def _start_uploads(self):
+        """
+        With a remote backend configured, outputs are uploaded from here (the
+        parent) through a persistent priority queue, not by the workers.
+        """
+        try:
+            backend = uploader.create_backend(self.config)
+        except (KeyError, ValueError) as e:
+            self.log_callback(f"Upload backend not started: {e}")
+            return
+        if backend is None:
+            return
+        self.uploads = UploadQueue(backend, self.config.get("upload_queue_path", UPLOAD_QUEUE_FILE),
+                                   log_callback=self.log_callback, metrics=self.metrics).start()
+
+    def submit(self, file_path, timeout=None, priority=PRIORITY_LIVE):
+        """
+        Queues a path for processing.
+        Blocks while the queue is full (backpressure on the watcher / backfill).
+        priority picks the lane (PRIORITY_BACKFILL waits behind live captures)
+        and is used for the upload of its outputs (upload_queue.PRIORITY_*).
+        Returns False if the pipeline is stopping, the path is already queued
+        or running, or the timeout expired.
+        """
+        with self._in_flight_lock:
+            if file_path in self._in_flight:
+                return False
+            self._in_flight[file_path] = time.monotonic()
+            self._priorities[file_path] = priority
+
+        lane = self.backfill_jobs if priority == PRIORITY_BACKFILL else self.jobs
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stopping.is_set():
+            try:
+                lane.put(file_path, timeout=0.25)
+                self._available.release()
+                self.metrics.set_queue_depth(self.queue_depth())
+                self._publish(ev.DETECTED, file_path)
+                return True
+            except queue.Full:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+        self._finished(file_path)
+        return False
+
+    def _finished(self, file_path):
+        with self._in_flight_lock:
+            self._in_flight.pop(file_path, None)
+            return self._priorities.pop(file_path, PRIORITY_LIVE)
+
+    def is_pending(self, file_path):
+        """
+        True while file_path is queued or being processed.
+        """
+        with self._in_flight_lock:
+            return file_path in self._in_flight
+
+    def is_stopping(self):
+        return self._stopping.is_set()
+
+    def profile_for(self, file_path):
+        """
+        Config to process file_path with: its source's profile, or the shared config.
+        """
+        return self.sources.profile_for(file_path) or self.config
+
+    def queue_depth(self):
+        return self.jobs.qsize() + self.backfill_jobs.qsize()
+
+    def _take(self, timeout=None):
+        """
+        Next waiting path, live lane first. None if nothing came within timeout
+        (timeout=0: don't wait at all).
+        """
+        if timeout:
+            acquired = self._available.acquire(timeout=timeout)
+        else:
+            acquired = self._available.acquire(blocking=False)
+        if not acquired:
+            return None
+        # One path per release, so one of the lanes has it
+        for lane in (self.jobs, self.backfill_jobs):
+            try:
+                return lane.get_nowait()
+            except queue.Empty:
+                pass
+        return None
+
+    def _dispatch_loop(self):
+        # A path taken for a batch that turned out to need another profile
+        carried = None
+        while not self._stopping.is_set():
+            # Wait for a free worker first, and only then pick the lane, so a
+            # live capture that arrives meanwhile still beats the backfill
+            while not self._slots.acquire(timeout=0.25):
+                if self._stopping.is_set():
+                    if carried:
+                        self._finished(carried)
+                    return
+            file_path, carried = carried, None
+            while file_path is None and not self._stopping.is_set():
+                file_path = self._take(timeout=0.25)
+            if file_path is None:
+                self._slots.release()
+                return
+
+            # Batch mode: take whatever else is already waiting, without blocking
+            profile = self.profile_for(file_path)
+            file_paths = [file_path]
+            while len(file_paths) < self.batch_size:
+                next_path = self._take()
+                if next_path is None:
+                    break
+                if self.profile_for(next_path) is not profile:
+                    # Different overlays; it starts the next job instead
+                    carried = next_path
+                    break
+                file_paths.append(next_path)
+
+            self.metrics.set_queue_depth(self.queue_depth())
+            now = time.monotonic()
+            with self._in_flight_lock:
+                queued_at = [self._in_flight.get(path) for path in file_paths]
+            for t in queued_at:
+                if t is not None:
+                    self.metrics.observe("queue", now - t)
+
+            # Reserve the job's memory before a worker gets it; a big one
+            # waits here (and holds up the line) until enough is free
+            cost = 0
+            if self.budget:
+                cost = sum(processor.estimate_memory(path, profile) for path in file_paths)
+                while not self.budget.reserve(cost, timeout=0.25):
+                    if self._stopping.is_set():
+                        self._slots.release()
+                        for path in file_paths:
+                            self._finished(path)
+                        return
+
+            # Numbers are handed out here, in the parent, so concurrent
+            # workers can never pick the same {prefix}_{index}.jpg
+            # (after the job's folder exists, so a new session folder gets numbers too)
+            job_profile = self._job_profile(profile)
+            sequence_indices = [self._reserve_index(path, profile) for path in file_paths]
+
+            try:
+                if len(file_paths) == 1:
+                    future = self._executor.submit(_run_job, file_path, job_profile, sequence_indices[0])
+                else:
+                    future = self._executor.submit(_run_batch, file_paths, job_profile, sequence_indices)
+            except RuntimeError:
+                # Executor already shut down
+                self._slots.release()
+                if self.budget:
+                    self.budget.release(cost)
+                return
+            for path in file_paths:
+                self._publish(ev.STARTED, path)
+            future.add_done_callback(lambda f, paths=file_paths, cost=cost, profile=profile:
+                                     self._on_done(paths, f, cost, profile))
+
+    def _publish(self, kind, path=None, **fields):
+        if self.events:
+            self.events.publish(kind, path, **fields)
+
+    def _job_profile(self, profile):
+        """
+        profile with output_folder pointed at where a job dispatched now
+        writes (its session / hour folder, or output_folder itself for the
+        flat layout), created here in the parent.
+        """
+        if not profile.get("output_folder"):
+            return profile
+        folder = layout.output_folder_for(profile, self.session)
+        if folder not in self._made_folders:
+            try:
+                os.makedirs(folder, exist_ok=True)
+                self._made_folders.add(folder)
+            except OSError as e:
+                self.log_callback(f"Could not create {folder}: {e}")
+        # Numbers come from _reserve_index; workers must never pick their own
+        job_profile = dict(profile, sequence_reserved=True)
+        if layout.layout_of(profile) == "flat":
+            return job_profile
+        # Staged next to the top output folder, outside the synced tree.
+        # output_root keeps the ledger version the same for every hour folder
+        return dict(job_profile, output_folder=folder, output_root=profile["output_folder"],
+                    staging_root=self._staging_root(profile))
+
+    def _reserve_index(self, file_path, profile):
+        # Numbered per session root, across its hour folders
+        output_folder = layout.session_root(profile, self.session)
+        prefix = profile.get("file_prefix")
+        if not prefix or not output_folder or not processor.is_image(file_path):
+            return None
+        # The worker will skip it; don't burn a number
+        if processor.already_processed(file_path, profile):
+            return None
+        manifest_path = None
+        if layout.layout_of(profile) != "flat" and layout.manifest_enabled(profile):
+            manifest_path = manifest.manifest_path(profile, self.session)
+        return sequence.get_allocator(output_folder, prefix, manifest_path).reserve()
+
+    def _record_manifest(self, result, profile):
+        path = manifest.manifest_path(profile, self.session)
+        book = self._manifests.get(path)
+        if book is None:
+            book = self._manifests[path] = manifest.Manifest(path, self.session)
+        try:
+            book.append(result["file_path"], result["files"], profile.get("output_folder"))
+        except OSError as e:
+            self.log_callback(f"Could not update manifest {book.path}: {e}")
+
+    def _on_done(self, file_paths, future, cost=0, profile=None):
+        if self.budget:
+            self.budget.release(cost)
+        self._slots.release()
+        priorities = {file_path: self._finished(file_path) for file_path in file_paths}
+        try:
+            results = future.result()
+        except Exception as e:
+            for file_path in file_paths:
+                self.metrics.record_result(None)
+                self.log_callback(f"Worker error for {file_path}: {e}")
+                self._publish(ev.FAILED, file_path, message=str(e))
+            return
+
+        for result in results:
+            self._worker_cache_stats[result["pid"]] = result["overlay_cache"]
+            self.metrics.observe_many(result["timings"])
+            # "ready" is only timed once a file is actually attempted; the rest were skipped
+            attempted = result["output_path"] or "ready" in result["timings"]
+            if attempted:
+                self.metrics.record_result(result["output_path"], result["bytes_written"])
+            thumbnail = os.path.abspath(result["thumbnail"]) if result["thumbnail"] else None
+            if self.thumbnails and thumbnail:
+                self.thumbnails.add(result["output_path"], thumbnail)
+            for message in result["messages"]:
+                self.log_callback(message)
+            if result["output_path"] and result["files"]:
+                self._record_manifest(result, profile or self.profile_for(result["file_path"]))
+            if result["output_path"]:
+                self._publish(ev.FINISHED, result["file_path"], output_path=result["output_path"],
+                              thumbnail=thumbnail, timings=result["timings"])
+            else:
+                self._publish(ev.FAILED if attempted else ev.SKIPPED, result["file_path"], timings=result["timings"])
+            if self.uploads and result["outputs"]:
+                self._queue_uploads(result, priorities.get(result["file_path"], PRIORITY_LIVE))
+
+    def _queue_uploads(self, result, priority):
+        try:
+            captured = os.path.getmtime(result["file_path"])
+        except OSError:
+            captured = None
+        output_folder = self.profile_for(result["file_path"]).get("output_folder")
+        for path in result["outputs"]:
+            self.uploads.put(path, uploader.upload_key(path, output_folder), priority=priority, captured=captured)
+
+    def overlay_cache_stats(self):
+        """
+        Overlay cache counters summed over all worker processes.
+        """
+        totals = {}
+        for stats in list(self._worker_cache_stats.values()):
+            for key, value in stats.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def stop(self, wait=True):
+        """
+        Drops queued (not yet started) jobs and shuts the pool down.
+        Jobs already running in a worker are allowed to finish.
+        """
+        self._stopping.set()
+        self.readiness.stop()
+        for lane in (self.jobs, self.backfill_jobs):
+            while True:
+                try:
+                    self._finished(lane.get_nowait())
+                except queue.Empty:
+                    break
+
+        if self._dispatcher:
+            self._dispatcher.join(timeout=1)
+        if self._executor:
+            self._executor.shutdown(wait=wait)
+        # After the pool, so outputs of the last jobs are queued (and persisted) first
+        if self.uploads:
+            self.uploads.stop(wait=wait)
+
+        for profile in self.sources.profiles or [self.config]:
+            if profile.get("file_prefix") and profile.get("output_folder"):
+                sequence.close_allocator(layout.session_root(profile, self.session), profile["file_prefix"])
@@ -0,0 +1,218 @@
+import functools
+import os
+import time
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent
+from watchdog.observers.api import BaseObserver, EventEmitter
+
+# Poll interval bounds, seconds: back at the minimum as soon as anything
+# changes, stretched towards the maximum while the share is quiet
+MIN_INTERVAL = 0.5
+MAX_INTERVAL = 5.0
+BACKOFF = 1.5
+
+# A directory whose mtime is this close to when we listed it may have
+# changed again within the same timestamp tick (SMB/FAT have 1-2 s
+# resolution), so it is listed again rather than trusted
+RACY_WINDOW_NS = 2 * 10**9
+
+# New or changed files are re-stat'd every poll until they stop changing;
+# writing into an existing file doesn't touch the directory's mtime
+HOT_POLLS = 3
+
+# Safety net for servers whose directory mtimes can't be trusted at all
+FULL_RESCAN_INTERVAL = 60.0
+
+class _DirState:
+    __slots__ = ("mtime_ns", "listed_at_ns", "files", "dirs")
+
+    def __init__(self, mtime_ns, listed_at_ns, files, dirs):
+        self.mtime_ns = mtime_ns
+        self.listed_at_ns = listed_at_ns
+        # name -> (size, mtime_ns, inode)
+        self.files = files
+        self.dirs = dirs
+
+class SnapshotEmitter(EventEmitter):
+    """
+    Watchdog emitter for network shares (SMB/NFS) where the native observer
+    never hears about changes.
+
+    Keeps an in-memory snapshot of every directory (its mtime, and each file's
+    size and mtime). A poll costs one stat per directory: only directories whose
+    mtime moved are listed again with os.scandir and diffed, plus a re-stat of
+    the few files that changed recently. A re-list only stats names it hasn't
+    seen before; known ones keep their snapshot (writes into an existing file
+    are caught by the recent-files re-stat and the periodic full rescan). Differences are queued as ordinary
+    watchdog events, so the usual handler and readiness tracker take it from there.
+    The poll interval shrinks to MIN_INTERVAL on activity and grows while idle.
+    """
+    def __init__(self, event_queue, watch, timeout=MIN_INTERVAL, prune=None,
+                 min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL, **kwargs):
+        super().__init__(event_queue, watch, timeout=timeout, **kwargs)
+        # prune(dir_path) -> True to never look inside that directory
+        self.prune = prune
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self._dirs = {}
+        self._hot = {}
+        self._baseline = True
+        self._last_full_scan = 0.0
+
+    def queue_events(self, timeout):
+        # timeout is the observer's; our own adaptive interval applies instead
+        if not self._baseline and self.stopped_event.wait(self.interval):
+            return
+        if not self.should_keep_running():
+            return
+
+        full = time.monotonic() - self._last_full_scan >= FULL_RESCAN_INTERVAL
+        if full:
+            self._last_full_scan = time.monotonic()
+        changes = self._poll(full)
+        self._baseline = False
+
+        if changes or self._hot:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * BACKOFF)
+
+    def _emit(self, event_class, path):
+        if not self._baseline:
+            self.queue_event(event_class(path))
+
+    def _poll(self, full=False):
+        changes = 0
+        started_ns = time.time_ns()
+        stack = [self.watch.path]
+        while stack:
+            path = stack.pop()
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                # Gone; the parent's diff reports its files
+                continue
+            old = self._dirs.get(path)
+            if (old is not None and not full and old.mtime_ns == mtime_ns
+                    and old.listed_at_ns - mtime_ns >= RACY_WINDOW_NS):
+                # Same entries as last time
+                state = old
+            else:
+                state = self._list(path, mtime_ns, None if full else old)
+                if state is None:
+                    continue
+                changes += self._diff(path, old, state, started_ns)
+                self._dirs[path] = state
+            if self.watch.is_recursive:
+                stack.extend(os.path.join(path, name) for name in state.dirs)
+        return changes + self._check_hot()
+
+    def _list(self, path, mtime_ns, old=None):
+        """
+        Lists path. Files already in old (same name and inode) keep their
+        signature; only new ones are stat'd, each a round trip on SMB/NFS.
+        """
+        listed_at_ns = time.time_ns()
+        known = old.files if old else {}
+        files = {}
+        dirs = set()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not (self.prune and self.prune(entry.path)):
+                                dirs.add(entry.name)
+                        elif entry.is_file():
+                            # inode() comes with the listing on POSIX; a file
+                            # renamed over a known name gets a new one
+                            inode = entry.inode()
+                            previous = known.get(entry.name)
+                            if previous is not None and previous[2] == inode:
+                                files[entry.name] = previous
+                            else:
+                                stat = entry.stat()
+                                files[entry.name] = (stat.st_size, stat.st_mtime_ns, inode)
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        return _DirState(mtime_ns, listed_at_ns, files, dirs)
+
+    def _diff(self, path, old, state, started_ns):
+        changes = 0
+        old_files = old.files if old else {}
+        for name, signature in state.files.items():
+            file_path = os.path.join(path, name)
+            previous = old_files.get(name)
+            if previous is None:
+                if self._baseline:
+                    # Already there when we started, unless written since
+                    if signature[1] < started_ns:
+                        continue
+                self.queue_event(FileCreatedEvent(file_path))
+            elif previous != signature:
+                self.queue_event(FileModifiedEvent(file_path))
+            else:
+                continue
+            self._hot[file_path] = 0
+            changes += 1
+        for name in old_files.keys() - state.files.keys():
+            file_path = os.path.join(path, name)
+            self._hot.pop(file_path, None)
+            self.queue_event(FileDeletedEvent(file_path))
+            changes += 1
+        if old:
+            for name in old.dirs - state.dirs:
+                changes += self._forget(os.path.join(path, name))
+        return changes
+
+    def _forget(self, path):
+        """
+        A directory disappeared: report its files as deleted, drop its snapshot.
+        """
+        changes = 0
+        state = self._dirs.pop(path, None)
+        if state is None:
+            return 0
+        for name in state.files:
+            file_path = os.path.join(path, name)
+            self._hot.pop(file_path, None)
+            self._emit(FileDeletedEvent, file_path)
+            changes += 1
+        for name in state.dirs:
+            changes += self._forget(os.path.join(path, name))
+        return changes
+
+    def _check_hot(self):
+        changes = 0
+        for file_path, quiet in list(self._hot.items()):
+            folder, name = os.path.split(file_path)
+            state = self._dirs.get(folder)
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                # Deleted or renamed; the directory diff reports it
+                self._hot.pop(file_path, None)
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+            if state is not None and state.files.get(name) != signature:
+                state.files[name] = signature
+                self._emit(FileModifiedEvent, file_path)
+                self._hot[file_path] = 0
+                changes += 1
+            elif quiet + 1 >= HOT_POLLS:
+                del self._hot[file_path]
+            else:
+                self._hot[file_path] = quiet + 1
+        return changes
+
+class SnapshotObserver(BaseObserver):
+    """
+    Observer running a SnapshotEmitter per scheduled folder. Drop-in for
+    watchdog's Observer where native change notifications don't work.
+    """
+    def __init__(self, prune=None, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        emitter_class = functools.partial(SnapshotEmitter, prune=prune,
+                                          min_interval=min_interval, max_interval=max_interval)
+        super().__init__(emitter_class, timeout=min_interval)
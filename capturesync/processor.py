@@ -2,6 +2,9 @@ import os
 import time
 from . import overlay
 from . import uploader
+from . import readiness
+from . import ledger
+from . import thumbnails as thumbnail_cache
 
 # Supported extensions
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
@@ -9,89 +12,256 @@ IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png'}
 def is_image(file_path):
     return os.path.splitext(file_path)[1].lower() in IMAGE_EXTENSIONS
 
-def wait_for_file_ready(file_path, timeout=5):
+def wait_for_file_ready(file_path, timeout=5, poll_interval=0.05):
     """
     Waits until the file is fully written and accessible.
     Cameras/Lightroom might write files in chunks.
+    JPEG/PNG files that already end with their end marker return immediately;
+    without it they must settle and then decode completely (motion photos
+    carry a video after the EOI), never taken on size alone.
+    Other formats fall back to waiting for the size to settle; the timeout
+    counts from the last time the file grew, so slow card readers aren't dropped.
     """
-    start_time = time.time()
     last_size = -1
+    last_growth = time.monotonic()
     
-    while time.time() - start_time < timeout:
+    while time.monotonic() - last_growth < timeout:
         try:
             if not os.path.exists(file_path):
                 return False
+
+            complete = readiness.has_end_marker(file_path)
+            if complete:
+                return True
                 
             current_size = os.path.getsize(file_path)
+            now = time.monotonic()
             
-            # If size hasn't changed and is > 0, and we can open it, it's likely ready
-            if current_size == last_size and current_size > 0:
+            if current_size != last_size:
+                last_size = current_size
+                last_growth = now
+            elif complete is False and current_size > 0 and now - last_growth >= readiness.SETTLE_TIME:
+                # Data after the end marker is fine if the image itself decodes
+                if readiness.decodes_completely(file_path):
+                    return True
+            elif complete is None and current_size > 0 and now - last_growth >= readiness.SETTLE_TIME:
+                # Size held long enough, and we can open it: it's likely ready
                 try:
                     with open(file_path, 'rb'):
                         return True
                 except IOError:
                     pass
             
-            last_size = current_size
-            time.sleep(1)
+            time.sleep(poll_interval)
         except Exception:
             pass
             
     return False
 
-def process_file(file_path, config, log_callback=None):
+def _ledger_entry(file_path, config):
     """
-    Main processing function called when a new file is detected.
+    Collects what the ledger keys on for file_path.
+    Returns None when the ledger is switched off (ledger_path set to "").
     """
-    if log_callback is None:
-        log_callback = print
+    ledger_path = config.get("ledger_path", ledger.LEDGER_FILE)
+    if not ledger_path:
+        return None
+    stat = os.stat(file_path)
+    version = ledger.output_version(config)
+    file_hash = ledger.content_hash(file_path) if config.get("ledger_content_hash") else None
+    return ledger.get_ledger(ledger_path), stat.st_size, stat.st_mtime_ns, version, file_hash
+
+def already_processed(file_path, config):
+    """
+    True if the ledger says this exact file was already processed with the
+    current overlays and output settings. Costs one stat (plus a hash read if ledger_content_hash is on).
+    """
+    try:
+        entry = _ledger_entry(file_path, config)
+        if entry is None:
+            return False
+        book, size, mtime_ns, version, file_hash = entry
+        return book.is_processed(file_path, size, mtime_ns, version, file_hash)
+    except Exception:
+        return False
+
+def estimate_memory(file_path, config):
+    """
+    Peak bytes processing file_path is expected to take (see overlay.estimate_memory).
+    0 if the header can't be read; the worker will report the real problem.
+    """
+    try:
+        return overlay.estimate_memory(file_path, config.get("max_long_edge"), config.get("renditions"),
+                                       config.get("strip_megapixels", overlay.STRIP_MODE_MEGAPIXELS))
+    except Exception:
+        return 0
 
+def _check_file(file_path, config, log_callback, timings, sequence_index=None):
+    """
+    Everything process_file does before decoding: filters, ledger, readiness, config.
+    Returns True if the file should be processed.
+    """
     if not is_image(file_path):
         # Ignore non-images (Safeguard)
-        return
+        return False
 
     # Ignore processed files if they somehow end up in the source folder
     # (though user instruction implies source -> output separation)
     if "_processed" in file_path:
-        return
+        return False
 
     log_callback(f"Detected new file: {file_path}")
 
+    # Skip finished work before any decode (restarts, duplicate events)
+    if already_processed(file_path, config):
+        log_callback(f"Already processed, skipping: {file_path}")
+        return False
+
     # Wait for write to complete
-    if not wait_for_file_ready(file_path):
+    start = time.perf_counter()
+    file_ready = wait_for_file_ready(file_path)
+    timings["ready"] = time.perf_counter() - start
+    if not file_ready:
         log_callback(f"Timeout waiting for file to be ready: {file_path}")
-        return
+        return False
 
-    output_folder = config.get("output_folder")
-    landscape_overlay = config.get("landscape_overlay")
-    portrait_overlay = config.get("portrait_overlay")
-
-    if not output_folder:
+    if not config.get("output_folder"):
         log_callback("Configuration missing output folder. Skipping.")
-        return
+        return False
 
-    if not landscape_overlay and not portrait_overlay:
+    if not config.get("landscape_overlay") and not config.get("portrait_overlay"):
          log_callback("Configuration missing overlay. Please provide at least one.")
-         return
+         return False
+
+    # In the pipeline the parent hands out the numbers; a worker falling back
+    # to its own allocator could pick one another worker already used
+    if config.get("file_prefix") and config.get("sequence_reserved") and sequence_index is None:
+        log_callback(f"No output number was reserved for {file_path}, skipping.")
+        return False
 
     log_callback(f"Processing {os.path.basename(file_path)}...")
+    return True
+
+def _finish_file(file_path, processed_path, config, log_callback, timings, outputs=()):
+    """
+    Everything after the overlay step: sync and ledger.
+    processed_path / outputs are the staged primary and all staged renditions
+    (primary first); outputs is updated in place to the final paths.
+    Returns the final primary path.
+    """
+    if not processed_path:
+        log_callback("Failed to process image.")
+        return None
+
+    # Step 2: Sync
+    # Outputs were written and fsynced in a hidden staging folder outside the
+    # synced tree; this renames them into the Drive-synced folders, so the
+    # sync client never sees a partial file.
+    # Remote uploads (if configured) are queued by the pipeline in the parent.
+    start = time.perf_counter()
+    staged = list(outputs) or [processed_path]
+    final_paths = [uploader.sync_file(path, os.path.dirname(uploader.final_path(path))) for path in staged]
+    timings["sync"] = time.perf_counter() - start
+    if isinstance(outputs, list):
+        outputs[:] = [path for path in final_paths if path]
+
+    processed_path = final_paths[0]
+    if not processed_path:
+        log_callback("Failed to process image.")
+        return None
+    log_callback(f"Successfully processed: {processed_path}")
+
+    try:
+        entry = _ledger_entry(file_path, config)
+        if entry:
+            book, size, mtime_ns, version, file_hash = entry
+            book.record(file_path, size, mtime_ns, processed_path, version, file_hash)
+    except Exception as e:
+        log_callback(f"Could not update ledger for {file_path}: {e}")
+
+    return processed_path
+
+def process_file(file_path, config, log_callback=None, sequence_index=None, timings=None, outputs=None, thumbnails=None):
+    """
+    Main processing function called when a new file is detected.
+    sequence_index is the output number reserved by the pipeline (prefix naming only).
+    If a timings dict is given, per-stage seconds are recorded into it
+    (see metrics.STAGES); "ready" is only present once the file was actually attempted.
+    If an outputs list is given, every rendition written is appended to it;
+    a thumbnails list gets the gallery thumbnail path.
+    Returns the output path, or None if the file was skipped or failed.
+    """
+    if log_callback is None:
+        log_callback = print
+    if timings is None:
+        timings = {}
+    if outputs is None:
+        outputs = []
+
+    if not _check_file(file_path, config, log_callback, timings, sequence_index):
+        return None
 
     # Step 1: Overlay
-    # For MVP, we write directly to output folder or a temp name in output folder?
     # overlay.process_image handles writing to the output folder.
     processed_path = overlay.process_image(
         file_path, 
-        landscape_overlay, 
-        portrait_overlay, 
-        output_folder,
-        file_prefix=config.get('file_prefix')
+        config.get("landscape_overlay"), 
+        config.get("portrait_overlay"), 
+        config.get("output_folder"),
+        file_prefix=config.get('file_prefix'),
+        sequence_index=sequence_index,
+        timings=timings,
+        max_long_edge=config.get('max_long_edge'),
+        engine=config.get('composite_engine', 'pillow'),
+        renditions=config.get('renditions'),
+        outputs=outputs,
+        finalize=False,
+        thumbnail_dir=config.get('thumbnail_cache', thumbnail_cache.CACHE_DIR),
+        thumbnails=thumbnails,
+        strip_megapixels=config.get('strip_megapixels', overlay.STRIP_MODE_MEGAPIXELS),
+        staging_root=uploader.staging_root(config)
     )
 
-    if processed_path:
-        log_callback(f"Successfully processed: {processed_path}")
-        # Step 2: Sync (if needed)
-        # In our MVP Option 1, the file is already in the Drive-synced output folder.
-        # But we call sync_file just in case we change strategy later or need to move it.
-        uploader.sync_file(processed_path, output_folder)
-    else:
-        log_callback("Failed to process image.")
+    return _finish_file(file_path, processed_path, config, log_callback, timings, outputs)
+
+def process_files(file_paths, config, log_callbacks=None, sequence_indices=None, timings_list=None, outputs_list=None, thumbnails_list=None):
+    """
+    process_file for a burst: files that pass the checks go through
+    overlay.process_image_batch together, so same-size frames are blended in
+    one vectorized operation. log_callbacks / sequence_indices / timings_list /
+    outputs_list / thumbnails_list are per file. Returns a list of output paths (None where skipped/failed).
+    """
+    count = len(file_paths)
+    log_callbacks = log_callbacks or [print] * count
+    sequence_indices = sequence_indices or [None] * count
+    timings_list = timings_list or [{} for _ in range(count)]
+    outputs_list = outputs_list or [[] for _ in range(count)]
+    thumbnails_list = thumbnails_list or [[] for _ in range(count)]
+
+    ready = [i for i in range(count) if _check_file(file_paths[i], config, log_callbacks[i], timings_list[i], sequence_indices[i])]
+    results = [None] * count
+    if not ready:
+        return results
+
+    processed_paths = overlay.process_image_batch(
+        [file_paths[i] for i in ready],
+        config.get("landscape_overlay"),
+        config.get("portrait_overlay"),
+        config.get("output_folder"),
+        file_prefix=config.get('file_prefix'),
+        sequence_indices=[sequence_indices[i] for i in ready],
+        timings_list=[timings_list[i] for i in ready],
+        max_long_edge=config.get('max_long_edge'),
+        engine=config.get('composite_engine', 'pillow'),
+        renditions=config.get('renditions'),
+        outputs_list=[outputs_list[i] for i in ready],
+        finalize=False,
+        thumbnail_dir=config.get('thumbnail_cache', thumbnail_cache.CACHE_DIR),
+        thumbnails_list=[thumbnails_list[i] for i in ready],
+        strip_megapixels=config.get('strip_megapixels', overlay.STRIP_MODE_MEGAPIXELS),
+        staging_root=uploader.staging_root(config)
+    )
+
+    for i, processed_path in zip(ready, processed_paths):
+        results[i] = _finish_file(file_paths[i], processed_path, config, log_callbacks[i], timings_list[i], outputs_list[i])
+    return results
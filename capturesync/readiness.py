@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+# Wait this long after the last event for a path before looking at it.
+# Bursts of created/modified events collapse into a single check.
+QUIET_PERIOD = 0.05
+
+# Formats without an end marker are ready once their size holds this long
+SETTLE_TIME = 1.0
+
+# Only give up on a file once it has stopped growing for this long
+STALL_TIMEOUT = 30.0
+
+# How many handed-off files we remember to suppress duplicate events
+SUBMITTED_HISTORY = 1024
+
+def has_end_marker(file_path):
+    """
+    Fast completeness check for formats that end with a fixed trailer.
+    JPEG ends with the EOI marker (FF D9), PNG with the IEND chunk.
+    Returns None for formats we can't check this way.
+    """
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext in ('.jpg', '.jpeg'):
+        trailer = b'\xff\xd9'
+    elif ext == '.png':
+        trailer = b'IEND\xaeB`\x82'
+    else:
+        return None
+
+    try:
+        with open(file_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size < 16:
+                return False
+            f.seek(max(0, size - 64))
+            tail = f.read()
+    except OSError:
+        return False
+
+    # Some writers pad the file with zeros after the trailer
+    return tail.rstrip(b'\x00').endswith(trailer)
+
+def decodes_completely(file_path):
+    """
+    Slow completeness check for JPEG/PNG files that don't end with their marker.
+    Phone motion photos and some vendor trailers put data after the EOI, so we
+    decode the image instead (JPEGs at 1/8 scale). A truncated file raises.
+    """
+    try:
+        with Image.open(file_path) as img:
+            img.draft("RGB", (max(1, img.width // 8), max(1, img.height // 8)))
+            img.load()
+        return True
+    except Exception:
+        return False
+
+class _PendingFile:
+    __slots__ = ("size", "first_seen", "changed_at", "deadline", "closed", "backoff")
+
+    def __init__(self, now):
+        self.size = -1
+        self.first_seen = now
+        self.changed_at = now
+        self.deadline = now + QUIET_PERIOD
+        self.closed = False
+        self.backoff = QUIET_PERIOD
+
+class ReadinessTracker:
+    """
+    Coalesces the created/modified/moved/closed event stream per path and
+    calls on_ready(path) once the file is completely written.
+
+    A file is ready when:
+      - it ends with its format's end marker (JPEG EOI / PNG IEND), or
+      - the format has no marker, and the OS reported close-after-write or
+        its size has not changed for SETTLE_TIME, or
+      - it is a JPEG/PNG without the marker at the end (data after the EOI),
+        has been closed or settled, and decodes completely.
+    A JPEG/PNG that doesn't decode is never handed over on size alone;
+    like empty files, it is dropped after STALL_TIMEOUT without growing.
+    """
+    def __init__(self, on_ready, log_callback=None, quiet_period=QUIET_PERIOD,
+                 settle_time=SETTLE_TIME, stall_timeout=STALL_TIMEOUT, metrics=None):
+        self.on_ready = on_ready
+        self.log_callback = log_callback or print
+        self.metrics = metrics
+        self.quiet_period = quiet_period
+        self.settle_time = settle_time
+        self.stall_timeout = stall_timeout
+
+        self._pending = {}
+        self._submitted = OrderedDict()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="capturesync-readiness", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._pending.clear()
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    def touch(self, file_path):
+        """
+        Something happened to file_path (created / modified / moved into place).
+        Restarts its quiet-period timer.
+        """
+        now = time.monotonic()
+        with self._cond:
+            entry = self._pending.get(file_path)
+            if entry is None:
+                entry = self._pending[file_path] = _PendingFile(now)
+            entry.backoff = self.quiet_period
+            entry.deadline = now + self.quiet_period
+            self._cond.notify()
+
+    def closed(self, file_path):
+        """
+        The writer closed the file (inotify IN_CLOSE_WRITE). Check it right away.
+        """
+        now = time.monotonic()
+        with self._cond:
+            entry = self._pending.get(file_path)
+            if entry is None:
+                entry = self._pending[file_path] = _PendingFile(now)
+            entry.closed = True
+            entry.deadline = now
+            self._cond.notify()
+
+    def discard(self, file_path):
+        with self._cond:
+            self._pending.pop(file_path, None)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                now = time.monotonic()
+                due = [p for p, e in self._pending.items() if e.deadline <= now]
+                if not due:
+                    timeout = None
+                    if self._pending:
+                        timeout = min(e.deadline for e in self._pending.values()) - now
+                    self._cond.wait(timeout)
+                    continue
+
+            # Stat / read outside the lock so the watcher thread never waits on disk
+            for file_path in due:
+                self._check(file_path)
+
+    def _settled(self, file_path, size):
+        """
+        True if file_path was closed, or held this size for the settle window.
+        """
+        with self._cond:
+            entry = self._pending.get(file_path)
+            if entry is None or entry.size != size or size <= 0:
+                return False
+            return entry.closed or time.monotonic() - entry.changed_at >= self.settle_time
+
+    def _check(self, file_path):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            # Deleted or renamed away before it settled
+            self.discard(file_path)
+            return
+
+        complete = has_end_marker(file_path)
+        if complete is False and self._settled(file_path, stat.st_size):
+            # No marker at the end, but the writer looks done: trailers after
+            # the EOI are fine as long as the image itself is all there
+            complete = decodes_completely(file_path)
+        now = time.monotonic()
+        ready = False
+
+        with self._cond:
+            entry = self._pending.get(file_path)
+            if entry is None or entry.deadline > now:
+                # Discarded, or touched again while we were reading it
+                return
+
+            if stat.st_size != entry.size:
+                entry.size = stat.st_size
+                entry.changed_at = now
+
+            settled = now - entry.changed_at >= self.settle_time
+            if entry.size > 0 and (complete or (complete is None and (entry.closed or settled))):
+                ready = True
+            elif now - entry.changed_at >= self.stall_timeout:
+                del self._pending[file_path]
+                self.log_callback(f"File never finished writing, skipping: {file_path}")
+                return
+            else:
+                # Still being written: check again, backing off up to a second
+                entry.backoff = min(entry.backoff * 2, 1.0)
+                entry.deadline = now + entry.backoff
+
+            if not ready:
+                return
+            del self._pending[file_path]
+
+            # Writers often send one more modified event after the data is
+            # complete; don't hand the same version of a file over twice.
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._submitted.get(file_path) == signature:
+                return
+            self._submitted[file_path] = signature
+            self._submitted.move_to_end(file_path)
+            while len(self._submitted) > SUBMITTED_HISTORY:
+                self._submitted.popitem(last=False)
+
+        if self.metrics:
+            self.metrics.observe("detect", now - entry.first_seen)
+
+        self.on_ready(file_path)
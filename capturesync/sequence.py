@@ -0,0 +1,134 @@
+import json
+import os
+import tempfile
+import threading
+from . import manifest
+
+# High-water marks live next to gui_config.json, not in the Drive-synced output
+STATE_FILE = "sequence_state.json"
+
+_state_lock = threading.Lock()
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+def scan_max_index(output_folder, prefix):
+    """
+    Scans output_folder for files named {prefix}_{index}.jpg
+    Returns the highest index found (0 if none).
+    """
+    max_index = 0
+    try:
+        with os.scandir(output_folder) as entries:
+            for entry in entries:
+                filename = entry.name
+                if filename.startswith(prefix + "_") and filename.endswith(".jpg"):
+                    try:
+                        # Extract number part: PREFIX_123.jpg -> 123
+                        index = int(filename[len(prefix)+1:-4])
+                    except ValueError:
+                        continue
+                    if index > max_index:
+                        max_index = index
+    except OSError:
+        pass
+    return max_index
+
+def _folder_mtime(output_folder):
+    try:
+        return os.stat(output_folder).st_mtime_ns
+    except OSError:
+        return None
+
+def _load_state(state_file):
+    try:
+        with open(state_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_state(state_file, key, value):
+    # Read-modify-write so several output folders can share one state file
+    with _state_lock:
+        state = _load_state(state_file)
+        state[key] = value
+        # Every writer gets its own temp file; other processes save here too
+        folder = os.path.dirname(os.path.abspath(state_file))
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=os.path.basename(state_file) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, state_file)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+class SequenceAllocator:
+    """
+    Hands out {prefix}_{index}.jpg numbers from memory.
+    The output folder is scanned once at startup; after that reserve() is O(1)
+    and safe to call from several threads. Numbers may have gaps (a reserved
+    index whose image fails is never reused) but never collide.
+
+    The high-water mark is persisted on every reservation. On a clean close we
+    also record the folder's mtime, so if nothing else touched the folder since,
+    the next start skips the scan entirely.
+
+    With a manifest_path (session layouts) the highest number is read from the
+    session's manifest (see manifest.py) instead of listing the folder.
+    """
+    def __init__(self, output_folder, prefix, state_file=STATE_FILE, manifest_path=None):
+        self.output_folder = output_folder
+        self.prefix = prefix
+        self.state_file = state_file
+        self.key = f"{os.path.abspath(output_folder)}|{prefix}"
+        self._lock = threading.Lock()
+
+        saved = _load_state(state_file).get(self.key, {})
+        high_water = saved.get("high_water", 0)
+        if manifest_path:
+            high_water = max(high_water, manifest.max_sequence_index(manifest_path, prefix))
+        elif saved.get("folder_mtime") is None or saved.get("folder_mtime") != _folder_mtime(output_folder):
+            high_water = max(high_water, scan_max_index(output_folder, prefix))
+        self.high_water = high_water
+
+    def reserve(self):
+        with self._lock:
+            self.high_water += 1
+            index = self.high_water
+            self._persist(folder_mtime=None)
+        return index
+
+    def close(self):
+        with self._lock:
+            self._persist(folder_mtime=_folder_mtime(self.output_folder))
+
+    def _persist(self, folder_mtime):
+        try:
+            _save_state(self.state_file, self.key, {"high_water": self.high_water, "folder_mtime": folder_mtime})
+        except OSError as e:
+            print(f"Could not save sequence state: {e}")
+
+def get_allocator(output_folder, prefix, manifest_path=None):
+    """
+    Returns the process-wide allocator for (output_folder, prefix).
+    manifest_path is only used when the allocator is first created.
+    """
+    key = (os.path.abspath(output_folder), prefix)
+    with _allocators_lock:
+        allocator = _allocators.get(key)
+        if allocator is None:
+            allocator = _allocators[key] = SequenceAllocator(output_folder, prefix, manifest_path=manifest_path)
+        return allocator
+
+def close_allocator(output_folder, prefix):
+    """
+    Saves and forgets the allocator, so the next session re-checks the folder.
+    """
+    key = (os.path.abspath(output_folder), prefix)
+    with _allocators_lock:
+        allocator = _allocators.pop(key, None)
+    if allocator:
+        allocator.close()
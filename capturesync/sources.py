@@ -0,0 +1,131 @@
+import fnmatch
+import os
+from . import processor
+
+# Hidden files and folders (".capturesync_staging", macOS "._" sidecars, ...)
+DEFAULT_IGNORE = (".*",)
+
+def source_profiles(config):
+    """
+    One config dict per watched source root.
+
+    With a "sources" list, each entry is laid over the shared config, so a
+    source can bring its own overlays, file_prefix, output_folder, renditions
+    and so on. Entries are watched recursively unless they say
+    "recursive": false. Without "sources" the single source_folder is used,
+    non-recursive unless config["recursive"] is set.
+    Extra keys: "extensions" (default: processor.IMAGE_EXTENSIONS),
+    "ignore" (fnmatch patterns, matched against every path component) and
+    "watch_mode" ("native", or "polling" for network shares).
+    """
+    shared = {key: value for key, value in config.items() if key != "sources"}
+    entries = config.get("sources")
+    if entries:
+        shared.setdefault("recursive", True)
+    else:
+        entries = [{}]
+
+    profiles = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"source_folder": entry}
+        profile = dict(shared)
+        profile.update(entry)
+        if not profile.get("source_folder"):
+            continue
+        profile["source_folder"] = os.path.abspath(profile["source_folder"])
+        profile["recursive"] = bool(profile.get("recursive", False))
+        profile["extensions"] = {ext.lower() if ext.startswith(".") else "." + ext.lower()
+                                 for ext in profile.get("extensions") or processor.IMAGE_EXTENSIONS}
+        profile["ignore"] = list(profile.get("ignore") or DEFAULT_IGNORE)
+        profile["watch_mode"] = profile.get("watch_mode") or "native"
+        profiles.append(profile)
+    return profiles
+
+def _is_under(path, folder):
+    return path == folder or path.startswith(os.path.join(folder, ""))
+
+class SourceRouter:
+    """
+    Maps a path seen by the watcher (or the backfill) to the profile of the
+    source it belongs to, and decides whether it is worth queueing at all.
+    Pure string work, so it is cheap enough for the observer thread.
+    """
+    def __init__(self, config):
+        self.profiles = source_profiles(config)
+        # Deepest root first, so a source nested in another one wins
+        self._by_depth = sorted(self.profiles, key=lambda p: len(p["source_folder"]), reverse=True)
+        # Never pick up our own outputs, even when they land inside a source
+        self._output_folders = {os.path.abspath(p["output_folder"]) for p in self.profiles if p.get("output_folder")}
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def profile_for(self, path, is_dir=False):
+        path = os.path.abspath(path)
+        for profile in self._by_depth:
+            root = profile["source_folder"]
+            if not _is_under(path, root):
+                continue
+            if not profile["recursive"] and (path if is_dir else os.path.dirname(path)) != root:
+                # In a subfolder of a flat source; a shallower recursive root may still own it
+                continue
+            return profile
+        return None
+
+    def is_ignored_dir(self, path, profile):
+        """
+        True if nothing under directory path can be wanted (used to prune scans).
+        """
+        path = os.path.abspath(path)
+        if self._in_output(path, profile):
+            return True
+        return self._matches_ignore(os.path.relpath(path, profile["source_folder"]), profile)
+
+    def wants_dir(self, path):
+        """
+        False for a directory no source needs to look into.
+        """
+        profile = self.profile_for(path, is_dir=True)
+        return profile is not None and not self.is_ignored_dir(path, profile)
+
+    def _in_output(self, path, profile):
+        # Only output folders below the source root; one that *is* the root
+        # (or contains it) would otherwise hide the whole source
+        root = profile["source_folder"]
+        return any(_is_under(path, folder) and not _is_under(root, folder) for folder in self._output_folders)
+
+    def _matches_ignore(self, relative_path, profile):
+        parts = [part for part in relative_path.split(os.sep) if part and part != "."]
+        return any(fnmatch.fnmatch(part, pattern) for part in parts for pattern in profile["ignore"])
+
+    def accepts(self, path):
+        """
+        The profile to process path with, or None if it should be left alone
+        (outside every source, wrong extension, ignored, or one of our outputs).
+        """
+        profile = self.profile_for(path)
+        if profile is None:
+            return None
+        path = os.path.abspath(path)
+        if os.path.splitext(path)[1].lower() not in profile["extensions"]:
+            return None
+        if self._in_output(path, profile):
+            return None
+        if self._matches_ignore(os.path.relpath(path, profile["source_folder"]), profile):
+            return None
+        return profile
+
+    def watch_roots(self):
+        """
+        (root, recursive, polling) to schedule on the observers; roots already
+        covered by a recursive parent are left out so events aren't doubled.
+        """
+        wanted = {}
+        for profile in self.profiles:
+            root = profile["source_folder"]
+            recursive, polling = wanted.get(root, (False, False))
+            wanted[root] = (recursive or profile["recursive"], polling or profile["watch_mode"] == "polling")
+        return [(root, recursive, polling) for root, (recursive, polling) in sorted(wanted.items())
+                if not any(parent_recursive and parent != root and _is_under(root, parent)
+                           for parent, (parent_recursive, _) in wanted.items())]
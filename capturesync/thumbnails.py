@@ -0,0 +1,153 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from PIL import Image
+
+# Content-addressed thumbnail store, next to the ledger (working directory)
+CACHE_DIR = "capturesync_thumbnails"
+# Which output each thumbnail belongs to, one JSON object per line, oldest first
+INDEX_FILE = "index.jsonl"
+# Outputs remembered (and restored into the Gallery); older ones are dropped
+# along with their thumbnail files
+MAX_ENTRIES = 5000
+# Matches the Gallery cell
+THUMB_SIZE = 250
+THUMB_QUALITY = 80
+
+def thumbnail_size(size, box=THUMB_SIZE):
+    width, height = size
+    scale = min(box / width, box / height, 1.0)
+    return (max(1, round(width * scale)), max(1, round(height * scale)))
+
+def save_thumbnail(img, cache_dir=CACHE_DIR, box=THUMB_SIZE):
+    """
+    Writes a gallery thumbnail of img (the composited output, still in memory)
+    into cache_dir, named by the SHA-1 of its JPEG bytes. Identical thumbnails
+    are stored once. Returns the thumbnail path.
+    """
+    # reducing_gap: box-reduce the full frame first, then a cheap final resample
+    thumb = img.resize(thumbnail_size(img.size, box), Image.Resampling.BICUBIC, reducing_gap=2.0)
+    buf = io.BytesIO()
+    thumb.save(buf, "JPEG", quality=THUMB_QUALITY)
+    data = buf.getvalue()
+
+    digest = hashlib.sha1(data).hexdigest()
+    folder = os.path.join(cache_dir, digest[:2])
+    path = os.path.join(folder, digest + ".jpg")
+    if not os.path.exists(path):
+        os.makedirs(folder, exist_ok=True)
+        # Several workers may write the same digest; each renames a complete file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return path
+
+class ThumbnailIndex:
+    """
+    Maps (absolute) output paths to their cached thumbnails. Only the parent
+    process writes it (workers hand their thumbnail paths back), so the index
+    file has a single appender.
+
+    Only the newest max_entries outputs are kept; thumbnails no longer
+    referenced are deleted, and the index file is rewritten once it holds
+    twice as many lines as entries.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.path = os.path.join(cache_dir, INDEX_FILE)
+        self._entries = {}
+        # Thumbnail path -> number of outputs using it (identical thumbnails are shared)
+        self._refs = {}
+        self._lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn last line from a crash
+                        continue
+                    # Re-added outputs move to the end (dicts keep insertion order)
+                    self._put(entry["output"], entry["thumbnail"])
+        except OSError:
+            pass
+        with self._lock:
+            self._prune()
+
+    def _put(self, output_path, thumbnail_path, delete=False):
+        self._refs[thumbnail_path] = self._refs.get(thumbnail_path, 0) + 1
+        old = self._entries.pop(output_path, None)
+        if old is not None:
+            # A re-processed output's previous thumbnail (kept while loading:
+            # a later line may still use it)
+            self._release(old, delete)
+        self._entries[output_path] = thumbnail_path
+
+    def _release(self, thumbnail_path, delete=False):
+        count = self._refs.get(thumbnail_path, 0) - 1
+        if count > 0:
+            self._refs[thumbnail_path] = count
+            return
+        self._refs.pop(thumbnail_path, None)
+        if delete:
+            try:
+                os.remove(thumbnail_path)
+            except OSError:
+                pass
+
+    def _prune(self):
+        """
+        Drops the oldest entries over max_entries, and compacts the index file.
+        """
+        while len(self._entries) > self.max_entries:
+            output_path = next(iter(self._entries))
+            self._release(self._entries.pop(output_path), delete=True)
+        if self._lines > 2 * max(self.max_entries, 1):
+            self._rewrite()
+
+    def _rewrite(self):
+        # Written aside and renamed, so a crash never leaves half an index
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for output_path, thumbnail_path in self._entries.items():
+                    f.write(json.dumps({"output": output_path, "thumbnail": thumbnail_path}) + "\n")
+            os.replace(tmp_path, self.path)
+            self._lines = len(self._entries)
+        except OSError as e:
+            print(f"Could not compact thumbnail index: {e}")
+
+    def add(self, output_path, thumbnail_path):
+        output_path = os.path.abspath(output_path)
+        with self._lock:
+            self._put(output_path, thumbnail_path, delete=True)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"output": output_path, "thumbnail": thumbnail_path}) + "\n")
+            self._lines += 1
+            self._prune()
+
+    def get(self, output_path):
+        with self._lock:
+            return self._entries.get(os.path.abspath(output_path))
+
+    def entries(self, output_folder=None):
+        """
+        (output_path, thumbnail_path) pairs, oldest first, whose thumbnail is
+        still on disk; only outputs under output_folder if one is given.
+        """
+        with self._lock:
+            items = list(self._entries.items())
+        if output_folder:
+            prefix = os.path.join(os.path.abspath(output_folder), "")
+            items = [(o, t) for o, t in items if os.path.abspath(o).startswith(prefix)]
+        return [(o, t) for o, t in items if os.path.exists(t)]
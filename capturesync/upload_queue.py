@@ -0,0 +1,215 @@
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+# Pending uploads survive restarts here; next to the ledger, not in the output folder
+UPLOAD_QUEUE_FILE = "capturesync_uploads.db"
+
+# Lower goes first: photos coming off the camera now beat the backfill
+PRIORITY_LIVE = 0
+PRIORITY_BACKFILL = 1
+
+# Files up to this size are sent back to back by one sender, a few at a time
+SMALL_FILE_BYTES = 512 * 1024
+BATCH_MAX_FILES = 8
+
+# Backend already retried; wait this long (doubling per failure) before trying a file again
+RETRY_DELAY = 5.0
+MAX_RETRY_DELAY = 300.0
+
+class UploadQueue:
+    """
+    Uploads finished outputs through a remote backend, decoupled from processing.
+
+    Order is priority first (live before backfill), then newest capture first,
+    so guests get the photo taken ten seconds ago before the backlog.
+    Small files (thumbnails, web renditions) are taken in batches so one sender
+    pushes several over the same keep-alive connection. Every entry is kept in
+    SQLite until its upload succeeds, so nothing is lost on restart.
+    """
+    def __init__(self, backend, path=UPLOAD_QUEUE_FILE, log_callback=None, metrics=None, concurrency=None):
+        self.backend = backend
+        self.path = path
+        self.log_callback = log_callback or print
+        self.metrics = metrics
+        self.concurrency = concurrency or getattr(backend, "max_concurrency", 1)
+
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._threads = []
+
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " local_path TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " priority INTEGER NOT NULL,"
+            " captured REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " queued_at REAL)"
+        )
+        self._conn.commit()
+
+    def start(self):
+        """
+        Reloads whatever was still pending from the last run and starts the senders.
+        """
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT id, local_path, key, priority, captured, size, attempts FROM pending"
+            ).fetchall()
+        with self._cond:
+            for row in rows:
+                self._push(*row)
+        if rows:
+            self.log_callback(f"Resuming {len(rows)} pending upload(s).")
+        self._set_depth()
+
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._sender, name=f"capturesync-upload-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _push(self, row_id, local_path, key, priority, captured, size, attempts, not_before=0.0):
+        # Caller holds self._cond
+        heapq.heappush(self._heap, (priority, -captured, next(self._counter),
+                                    row_id, local_path, key, size, attempts, not_before))
+
+    def put(self, local_path, key, priority=PRIORITY_LIVE, captured=None):
+        """
+        Queues one file. captured is the photo's capture time (source mtime);
+        newer photos of the same priority go first.
+        """
+        try:
+            size = os.path.getsize(local_path)
+        except OSError:
+            return False
+        captured = captured if captured is not None else time.time()
+        with self._db_lock:
+            cursor = self._conn.execute(
+                "INSERT INTO pending (local_path, key, priority, captured, size, queued_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (local_path, key, priority, captured, size, time.time())
+            )
+            self._conn.commit()
+            row_id = cursor.lastrowid
+        with self._cond:
+            self._push(row_id, local_path, key, priority, captured, size, 0)
+            self._cond.notify()
+        self._set_depth()
+        return True
+
+    def pending(self):
+        with self._cond:
+            return len(self._heap)
+
+    def _set_depth(self):
+        if self.metrics:
+            self.metrics.set_upload_queue_depth(self.pending())
+
+    def _next_batch(self):
+        """
+        Blocks until something is due. Returns the best entry, plus more small
+        files of the same priority when it is small itself; None on stop.
+        """
+        with self._cond:
+            while not self._stopping:
+                now = time.monotonic()
+                batch = []
+                deferred = []
+                while self._heap and len(batch) < BATCH_MAX_FILES:
+                    entry = heapq.heappop(self._heap)
+                    if entry[-1] > now:
+                        # Retry backoff not over yet
+                        deferred.append(entry)
+                        continue
+                    if batch and (entry[0] != batch[0][0] or entry[6] > SMALL_FILE_BYTES):
+                        deferred.append(entry)
+                        break
+                    batch.append(entry)
+                    if entry[6] > SMALL_FILE_BYTES:
+                        break
+                for entry in deferred:
+                    heapq.heappush(self._heap, entry)
+                if batch:
+                    return batch
+
+                timeout = None
+                if deferred:
+                    timeout = max(0.05, min(entry[-1] for entry in deferred) - now)
+                self._cond.wait(timeout)
+            return None
+
+    def _sender(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._set_depth()
+
+            done = []
+            for entry in batch:
+                if self._stopping:
+                    # Not sent yet; it is still in the database for next time
+                    break
+                _, _, _, row_id, local_path, key, size, attempts, _ = entry
+                if not os.path.exists(local_path):
+                    self.log_callback(f"Upload skipped, file is gone: {local_path}")
+                    done.append(row_id)
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    self.backend.upload(local_path, key)
+                except Exception as e:
+                    self._retry_later(entry)
+                    self.log_callback(f"Upload failed for {key} (will retry): {e}")
+                    continue
+                if self.metrics:
+                    self.metrics.observe("upload", time.perf_counter() - start)
+                done.append(row_id)
+                self.log_callback(f"Uploaded {key}")
+
+            # One commit for the whole batch
+            if done:
+                with self._db_lock:
+                    self._conn.executemany("DELETE FROM pending WHERE id = ?", [(row_id,) for row_id in done])
+                    self._conn.commit()
+
+    def _retry_later(self, entry):
+        priority, neg_captured, _, row_id, local_path, key, size, attempts, _ = entry
+        attempts += 1
+        delay = min(MAX_RETRY_DELAY, RETRY_DELAY * (2 ** (attempts - 1)))
+        with self._db_lock:
+            self._conn.execute("UPDATE pending SET attempts = ? WHERE id = ?", (attempts, row_id))
+            self._conn.commit()
+        with self._cond:
+            self._push(row_id, local_path, key, priority, -neg_captured, size, attempts, time.monotonic() + delay)
+            self._cond.notify()
+        self._set_depth()
+
+    def stop(self, wait=True):
+        """
+        Stops the senders. Uploads already on the wire finish when wait is
+        True; anything not yet sent stays queued on disk for the next start.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if not wait:
+            # Senders may still be mid-upload and will record it when done
+            return
+        for thread in self._threads:
+            thread.join()
+        self.backend.close()
+        with self._db_lock:
+            self._conn.close()
@@ -1,50 +1,566 @@
+import abc
+import hashlib
+import http.client
+import queue
+import random
 import shutil
 import os
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
 
-def sync_file(processed_file_path, destination_folder):
+# Folder where outputs are written before being renamed into place. It lives
+# next to the ledger (working directory), not next to the output folder: the
+# output folder usually sits inside "My Drive" or Dropbox, so its parent is
+# synced too and the client would upload every half-written file. The final
+# os.replace is only atomic on one filesystem, so the default is only used
+# when the working directory is on the output folder's drive; otherwise
+# "staging_root" has to name a folder there, outside the synced tree.
+STAGING_DIR = "capturesync_staging"
+# Older versions staged in a hidden folder inside each destination folder
+LEGACY_STAGING_DIR = ".capturesync_staging"
+# In each staging subfolder: the destination folder its files are renamed into
+DESTINATION_FILE = "destination.txt"
+
+# Windows refuses to replace a file another process (e.g. the Drive client)
+# has open; retry a few times before giving up.
+REPLACE_RETRIES = 5
+REPLACE_RETRY_DELAY = 0.1
+
+_destinations = {}
+
+def _device(path):
     """
-    Simulates "uploading" by moving/copying the file to the Google Drive Sync folder.
-    For MVP Option 1: The destination_folder IS the Google Drive synced folder.
-    
-    Since overlay.py already writes to the output folder, this function might be redundant
-    if we passed the final destination to overlay.py. 
-    
-    HOWEVER, to handle 'partial writes' safely and 'smart safeguards':
-    It is better if overlay.py writes to a temporary location or a hidden temp file,
-    and this uploader 'finalizes' it strictly when ready.
+    st_dev of path, or of its nearest existing parent (the output folder may
+    not have been created yet).
     """
-    if not processed_file_path or not os.path.exists(processed_file_path):
-        return False
-        
+    path = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except OSError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None
+            path = parent
+
+def default_staging_root(output_folder):
+    """
+    The staging root for output_folder: STAGING_DIR in the working
+    directory, or None if that is on another drive (no atomic rename).
+    """
+    root = os.path.abspath(STAGING_DIR)
+    if _device(root) != _device(output_folder):
+        return None
+    return root
+
+def staging_root(config):
+    """
+    config["staging_root"], or the default for config["output_folder"].
+    Raises ValueError when there is no safe default.
+    """
+    if config.get("staging_root"):
+        return os.path.abspath(config["staging_root"])
+    if not config.get("output_folder"):
+        return None
+    root = default_staging_root(config["output_folder"])
+    if root is None:
+        raise ValueError(f"{config['output_folder']} is on another drive than {os.path.abspath(STAGING_DIR)}; "
+                         "set staging_root to a folder on its drive, outside the synced folder.")
+    return root
+
+def _hide(folder):
+    if sys.platform == "win32":
+        # Dot-folders aren't hidden on Windows; set the attribute so
+        # Explorer skips it
+        try:
+            import ctypes
+            FILE_ATTRIBUTE_HIDDEN = 0x02
+            ctypes.windll.kernel32.SetFileAttributesW(folder, FILE_ATTRIBUTE_HIDDEN)
+        except Exception:
+            pass
+
+def _staging_subfolder(destination_folder, root=None):
+    destination_folder = os.path.abspath(destination_folder)
+    root = root or staging_root({"output_folder": destination_folder})
+    key = hashlib.sha1(destination_folder.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(root, key)
+
+def staging_folder(destination_folder, root=None):
+    """
+    The staging folder for destination_folder under root (default: see
+    default_staging_root), created (and hidden) if needed. Each destination
+    gets its own subfolder, which records where its files go.
+    """
+    folder = _staging_subfolder(destination_folder, root)
+    if not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok=True)
+        _hide(os.path.dirname(folder))
+    marker = os.path.join(folder, DESTINATION_FILE)
+    if not os.path.exists(marker):
+        # Written aside and renamed: several workers may get here at once
+        tmp_path = f"{marker}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(os.path.abspath(destination_folder))
+        os.replace(tmp_path, marker)
+    return folder
+
+def staging_path(final_path, root=None):
+    """
+    Where final_path is written before finalize() moves it into place.
+    """
+    return os.path.join(staging_folder(os.path.dirname(final_path), root), os.path.basename(final_path))
+
+def _destination_of(folder):
+    destination = _destinations.get(folder)
+    if destination is None:
+        try:
+            with open(os.path.join(folder, DESTINATION_FILE), "r", encoding="utf-8") as f:
+                destination = _destinations[folder] = f.read().strip()
+        except OSError:
+            return None
+    return destination
+
+def is_staged(path):
+    return _destination_of(os.path.dirname(os.path.abspath(path))) is not None
+
+def final_path(staged_path):
+    destination = _destination_of(os.path.dirname(os.path.abspath(staged_path)))
+    if destination is None:
+        raise ValueError(f"Not a staged file: {staged_path}")
+    return os.path.join(destination, os.path.basename(staged_path))
+
+def _fsync_dir(folder):
+    # Makes the rename itself durable; not possible (or needed) on Windows
+    if sys.platform == "win32":
+        return
     try:
-        # In this architecture, if overlay.py wrote directly to the output folder 
-        # (as written in the previous step for simplicity), then we are already done.
-        # But per the requirements: "Output folder syncs to Drive... Handle partial writes"
-        
-        # If we want to be very safe, overlay.py should have written to a temp file.
-        # Let's assume for this MVP that overlay.py writes to the final folder but maybe with a temp name?
-        # Actually my overlay.py implementation writes directly to `_processed.jpg`.
-        # Pillow's `save` is generally atomic enough for an MVP, but let's adhere to the architecture.
-        
-        # We will assume for now this function is a placeholder for future API uploads.
-        # Or, if we want to support the "Watcher -> Process -> Upload" flow strictly:
-        # The Processor could save to a 'temp' folder, then call this to 'move' to Drive folder.
-        
-        # Let's support that 'move' workflow:
-        filename = os.path.basename(processed_file_path)
-        destination_path = os.path.join(destination_folder, filename)
-        
-        # If the file is already in the destination (because overlay.py put it there), just return.
-        if os.path.abspath(os.path.dirname(processed_file_path)) == os.path.abspath(destination_folder):
+        fd = os.open(folder, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+def finalize(staged_path):
+    """
+    Atomically renames a staged file into its destination folder.
+    The file was fsynced when it was written, so sync clients only ever
+    see complete JPEGs. Returns the final path, or None on failure.
+    """
+    destination = final_path(staged_path)
+    for attempt in range(REPLACE_RETRIES):
+        try:
+            os.replace(staged_path, destination)
+            _fsync_dir(os.path.dirname(destination))
+            return destination
+        except PermissionError:
+            if attempt == REPLACE_RETRIES - 1:
+                raise
+            time.sleep(REPLACE_RETRY_DELAY * (attempt + 1))
+
+def clean_staging(destination_folders, root=None):
+    """
+    Removes staging leftovers (files half-written when the app was killed)
+    for destination_folders, including any from the older in-folder staging.
+    Called on startup, before any worker writes. Returns the number removed.
+    """
+    removed = 0
+    for destination_folder in destination_folders:
+        for folder in (_staging_subfolder(destination_folder, root), os.path.join(destination_folder, LEGACY_STAGING_DIR)):
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if name == DESTINATION_FILE:
+                    continue
+                try:
+                    os.remove(os.path.join(folder, name))
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
+
+class UploadBackend(abc.ABC):
+    """
+    Where finished outputs go. upload(local_path, key) pushes one file and
+    returns where it ended up; key is the path relative to the output folder
+    (e.g. "web/ev_12.jpg"). Raises on failure.
+    """
+    @abc.abstractmethod
+    def upload(self, local_path, key):
+        pass
+
+    def upload_many(self, items):
+        """
+        Uploads (local_path, key) pairs. Returns a list of (location, error).
+        """
+        results = []
+        for local_path, key in items:
+            try:
+                results.append((self.upload(local_path, key), None))
+            except Exception as e:
+                results.append((None, e))
+        return results
+
+    def close(self):
+        pass
+
+class LocalBackend(UploadBackend):
+    """
+    The original behaviour: the destination is a folder (typically one a
+    desktop sync client watches). Staged files are finalized with an atomic
+    rename; files from anywhere else are moved over.
+    """
+    def __init__(self, destination_folder):
+        self.destination_folder = destination_folder
+
+    def upload(self, local_path, key=None):
+        destination_folder = self.destination_folder
+        if key:
+            destination_folder = os.path.join(destination_folder, os.path.dirname(key))
+
+        if is_staged(local_path) and \
+                os.path.dirname(final_path(local_path)) == os.path.abspath(destination_folder):
+            return finalize(local_path)
+        if os.path.abspath(os.path.dirname(local_path)) == os.path.abspath(destination_folder):
             # Already there
-            pass
+            return local_path
+        destination_path = os.path.join(destination_folder, os.path.basename(local_path))
+        shutil.move(local_path, destination_path)
+        return destination_path
+
+class UploadError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+# 408/429 and server errors are worth retrying; other 4xx won't get better
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# Status an upload server returns for an incomplete resumable upload
+RESUME_INCOMPLETE = 308
+
+class TokenBucket:
+    """
+    Bandwidth cap shared by all uploads: consume(n) blocks until n bytes
+    may be sent. Allows bursts of up to one second's worth.
+    clock and sleep default to time.monotonic and time.sleep (tests pass fakes).
+    """
+    def __init__(self, bytes_per_second, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(bytes_per_second)
+        self.capacity = float(burst or bytes_per_second)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def consume(self, n):
+        while True:
+            with self._lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Requests bigger than the bucket go through once it is full
+                needed = min(n, self.capacity)
+                if self.tokens >= needed:
+                    self.tokens -= n
+                    return
+                wait = (needed - self.tokens) / self.rate
+            self.sleep(wait)
+
+class _ChunkReader:
+    """
+    File-like view of length bytes of f starting at offset, so http.client
+    streams the request body instead of us reading it into memory.
+    Reads are paced by rate_limiter (a TokenBucket) if one is given.
+    """
+    def __init__(self, f, offset, length, rate_limiter=None):
+        f.seek(offset)
+        self.f = f
+        self.remaining = length
+        self.rate_limiter = rate_limiter
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        if self.rate_limiter:
+            self.rate_limiter.consume(size)
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections to one host, reused across uploads.
+    Connections are handed out one per request and returned once the
+    response has been read completely; broken ones are discarded.
+    """
+    def __init__(self, scheme, host, port=None, size=4, timeout=30):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.created = 0
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _new_connection(self):
+        self.created += 1
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._new_connection()
+
+    def put(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class HttpBackend(UploadBackend):
+    """
+    Uploads with HTTP PUT to base_url + key. Works with plain upload
+    endpoints that accept PUT with the configured headers (e.g. a bearer
+    token, or a gateway in front of a bucket). There is no S3 request
+    signing (SigV4), and the chunked resume is Content-Range, not S3
+    multipart, so a bare S3 bucket needs such a gateway.
+
+    Files up to chunk_size go up in one streamed PUT. Larger files use
+    resumable chunked PUTs: each chunk carries "Content-Range: bytes a-b/total"
+    and the server answers 308 until the last one. After a failure the
+    backend asks where to continue ("Content-Range: bytes */total", the server
+    answers 308 with "Range: bytes=0-n") instead of starting over. A server
+    that ignores Content-Range answers the first chunk with 200/201 as if it
+    were the whole file; the file is then sent again in one streamed PUT.
+
+    Failed requests (connection errors, 408/429/5xx) are retried with
+    exponential backoff and jitter. At most max_concurrency uploads run at
+    once, over a pool of keep-alive connections. A rate_limiter (TokenBucket)
+    caps the total upload bandwidth.
+    """
+    def __init__(self, base_url, headers=None, max_concurrency=4, retries=5, backoff=0.5, max_backoff=30,
+                 chunk_size=8 * 1024 * 1024, timeout=30, rate_limiter=None):
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported upload URL: {base_url}")
+        self.base_path = parts.path.rstrip("/")
+        self.headers = dict(headers or {})
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.chunk_size = chunk_size
+        self.rate_limiter = rate_limiter
+        self.pool = ConnectionPool(parts.scheme, parts.hostname, parts.port, size=self.max_concurrency, timeout=timeout)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    def url_path(self, key):
+        return f"{self.base_path}/{quote(key.replace(os.sep, '/'))}"
+
+    def _request(self, method, path, body=None, headers=None):
+        """
+        One request on a pooled connection. Returns (status, headers).
+        The response is always read to the end so the connection can be reused.
+        """
+        conn = self.pool.get()
+        try:
+            all_headers = dict(self.headers)
+            all_headers.update(headers or {})
+            conn.request(method, path, body=body, headers=all_headers)
+            response = conn.getresponse()
+            response.read()
+        except Exception:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
         else:
-            shutil.move(processed_file_path, destination_path)
-            
-        print(f"Synced {filename} to {destination_folder}")
-        return True
-        
+            self.pool.put(conn)
+        return response.status, response.headers
+
+    def _sleep_before_retry(self, attempt):
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def _with_retry(self, send):
+        """
+        Calls send() until it returns a non-retryable status.
+        """
+        attempt = 0
+        while True:
+            try:
+                status, headers = send()
+                if status not in RETRYABLE_STATUS:
+                    return status, headers
+                error = UploadError(f"HTTP {status}", status)
+            except (OSError, http.client.HTTPException) as e:
+                error = e
+            if attempt >= self.retries:
+                raise error
+            self._sleep_before_retry(attempt)
+            attempt += 1
+
+    def upload(self, local_path, key):
+        with self._slots:
+            size = os.path.getsize(local_path)
+            path = self.url_path(key)
+            if size <= self.chunk_size:
+                self._upload_single(local_path, path, size)
+            else:
+                self._upload_chunked(local_path, path, size)
+        return path
+
+    def _upload_single(self, local_path, path, size):
+        def send():
+            with open(local_path, "rb") as f:
+                return self._request("PUT", path, body=_ChunkReader(f, 0, size, self.rate_limiter), headers={
+                    "Content-Type": "image/jpeg",
+                    "Content-Length": str(size),
+                })
+        status, _ = self._with_retry(send)
+        if status not in (200, 201, 204):
+            raise UploadError(f"Upload of {local_path} failed: HTTP {status}", status)
+
+    def _committed_offset(self, status, headers, size, end=None):
+        """
+        How many bytes the server holds after a chunk ending at end / a status
+        query (end None). None if the server doesn't do resumable uploads:
+        it said "done" before the last byte was sent.
+        """
+        if status in (200, 201, 204):
+            return size if end == size else None
+        if status == RESUME_INCOMPLETE:
+            # "Range: bytes=0-n"; no Range header means nothing stored yet
+            received = headers.get("Range")
+            if received and "-" in received:
+                return int(received.rsplit("-", 1)[1]) + 1
+            return 0
+        raise UploadError(f"HTTP {status}", status)
+
+    def _upload_chunked(self, local_path, path, size):
+        offset = 0
+        failures = 0
+        with open(local_path, "rb") as f:
+            while offset < size:
+                end = min(offset + self.chunk_size, size)
+                try:
+                    status, headers = self._request("PUT", path, body=_ChunkReader(f, offset, end - offset, self.rate_limiter), headers={
+                        "Content-Type": "image/jpeg",
+                        "Content-Length": str(end - offset),
+                        "Content-Range": f"bytes {offset}-{end - 1}/{size}",
+                    })
+                    if status in RETRYABLE_STATUS:
+                        raise UploadError(f"HTTP {status}", status)
+                    offset = self._committed_offset(status, headers, size, end)
+                    failures = 0
+                except (OSError, http.client.HTTPException, UploadError) as e:
+                    if isinstance(e, UploadError) and e.status not in RETRYABLE_STATUS:
+                        raise UploadError(f"Upload of {local_path} failed: {e}", e.status)
+                    if failures >= self.retries:
+                        raise
+                    self._sleep_before_retry(failures)
+                    failures += 1
+                    # Ask the server how much it kept, and carry on from there
+                    status, headers = self._with_retry(lambda: self._request("PUT", path, headers={
+                        "Content-Length": "0",
+                        "Content-Range": f"bytes */{size}",
+                    }))
+                    offset = self._committed_offset(status, headers, size)
+                if offset is None:
+                    # Plain PUT endpoint: it kept one chunk as the whole file
+                    self._upload_single(local_path, path, size)
+                    return
+
+    def upload_many(self, items):
+        """
+        Uploads (local_path, key) pairs concurrently, up to max_concurrency at once.
+        """
+        def one(item):
+            try:
+                return self.upload(*item), None
+            except Exception as e:
+                return None, e
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(one, items))
+
+    def close(self):
+        self.pool.close()
+
+def create_backend(config):
+    """
+    The remote upload backend selected by config, or None for "local"
+    (outputs stay in the output folder for a desktop sync client).
+
+        "upload_backend": "http",
+        "upload_url": "https://uploads.example.com/event-42/",
+        "upload_headers": {"Authorization": "Bearer ..."},
+        "upload_concurrency": 4, "upload_retries": 5,
+        "upload_chunk_size": 8388608, "upload_timeout": 30,
+        "upload_bandwidth_mbps": 20
+    """
+    kind = config.get("upload_backend") or "local"
+    if kind == "local":
+        return None
+    rate_limiter = None
+    if config.get("upload_bandwidth_mbps"):
+        # Megabits per second -> bytes per second
+        rate_limiter = TokenBucket(float(config["upload_bandwidth_mbps"]) * 125000)
+    if kind == "http":
+        return HttpBackend(
+            config["upload_url"],
+            headers=config.get("upload_headers"),
+            max_concurrency=config.get("upload_concurrency", 4),
+            retries=config.get("upload_retries", 5),
+            chunk_size=config.get("upload_chunk_size", 8 * 1024 * 1024),
+            timeout=config.get("upload_timeout", 30),
+            rate_limiter=rate_limiter,
+        )
+    raise ValueError(f"Unknown upload backend: {kind}")
+
+def upload_key(path, output_folder):
+    """
+    Remote name for an output: its path under the output folder
+    (e.g. "web/ev_12.jpg"), or just the file name for folders outside it.
+    """
+    key = os.path.relpath(path, output_folder) if output_folder else os.path.basename(path)
+    if key.startswith(os.pardir):
+        key = os.path.basename(path)
+    return key.replace(os.sep, "/")
+
+def sync_file(processed_file_path, destination_folder):
+    """
+    Finalizes an output into destination_folder (the Google Drive synced folder).
+
+    overlay.py writes every output into a hidden staging folder outside the
+    synced tree (same filesystem) and fsyncs it; this is the step that makes it visible, with an
+    atomic rename, so Drive for Desktop never picks up a partial JPEG.
+    Files that are somewhere else entirely are moved over as before.
+    Returns the final path, or None on failure.
+    """
+    if not processed_file_path or not os.path.exists(processed_file_path):
+        return None
+
+    try:
+        destination_path = LocalBackend(destination_folder).upload(processed_file_path)
+        print(f"Synced {os.path.basename(processed_file_path)} to {destination_folder}")
+        return destination_path
+
     except Exception as e:
         print(f"Error syncing {processed_file_path}: {e}")
-        return False
+        return None
@@ -1,38 +1,103 @@
-import time
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from . import processor
+from . import polling
 
 class ImageHandler(FileSystemEventHandler):
-    def __init__(self, config, log_callback=None):
-        self.config = config
+    """
+    Runs on the watchdog observer thread, so it only reports events to the
+    pipeline's readiness tracker. Once a file is complete it gets queued and
+    all the actual work happens in the pipeline's worker pool.
+    Paths no source wants (extension, ignore patterns, our own outputs) are
+    dropped right here, before the tracker ever sees them.
+    """
+    def __init__(self, sources, pipeline, log_callback=None):
+        self.sources = sources
+        self.pipeline = pipeline
         self.log_callback = log_callback
 
+    def _wanted(self, event, path=None):
+        return not event.is_directory and self.sources.accepts(path or event.src_path) is not None
+
     def on_created(self, event):
-        if not event.is_directory:
-            processor.process_file(event.src_path, self.config, self.log_callback)
+        if self._wanted(event):
+            self.pipeline.readiness.touch(event.src_path)
+
+    def on_modified(self, event):
+        if self._wanted(event):
+            self.pipeline.readiness.touch(event.src_path)
+
+    def on_closed(self, event):
+        # Close-after-write (inotify); not reported on every platform
+        if self._wanted(event):
+            self.pipeline.readiness.closed(event.src_path)
 
     def on_moved(self, event):
-        # Handle case where file is moved INTO the folder
+        # Handle case where file is moved INTO the folder (or renamed from a temp name)
+        if not event.is_directory:
+             self.pipeline.readiness.discard(event.src_path)
+             if self._wanted(event, event.dest_path):
+                 self.pipeline.readiness.touch(event.dest_path)
+
+    def on_deleted(self, event):
         if not event.is_directory:
-             processor.process_file(event.dest_path, self.config, self.log_callback)
+            self.pipeline.readiness.discard(event.src_path)
+
+class ObserverGroup:
+    """
+    The native and the polling observer behind one start()/stop(), for
+    setups that mix local folders with network shares.
+    """
+    def __init__(self, observers):
+        self.observers = observers
+
+    def start(self):
+        for observer in self.observers:
+            observer.start()
+
+    def stop(self):
+        for observer in self.observers:
+            observer.stop()
+
+    def join(self, timeout=None):
+        for observer in self.observers:
+            observer.join(timeout)
 
-def start_watcher(source_folder, config, log_callback=None):
+def start_watcher(sources, pipeline, log_callback=None):
     """
     Non-blocking start for the GUI.
+    Watches every root of sources (a sources.SourceRouter): local folders from
+    one native observer, "watch_mode": "polling" roots (SMB/NFS shares) from
+    one snapshot-polling observer; both feed the same handler.
+    New files are queued on the given (already started) pipeline.
     Returns the observer object.
     """
-    if not source_folder:
+    roots = sources.watch_roots()
+    if not roots:
         if log_callback: log_callback("No source folder configured.")
         return None
 
-    event_handler = ImageHandler(config, log_callback)
-    observer = Observer()
-    observer.schedule(event_handler, source_folder, recursive=False)
+    event_handler = ImageHandler(sources, pipeline, log_callback)
+    native = None
+    poller = None
+    for root, recursive, use_polling in roots:
+        if use_polling:
+            if poller is None:
+                poller = polling.SnapshotObserver(prune=lambda path: not sources.wants_dir(path),
+                                          min_interval=pipeline.config.get("poll_interval", polling.MIN_INTERVAL),
+                                          max_interval=pipeline.config.get("poll_max_interval", polling.MAX_INTERVAL))
+            poller.schedule(event_handler, root, recursive=recursive)
+        else:
+            if native is None:
+                native = Observer()
+            native.schedule(event_handler, root, recursive=recursive)
+    observers = [o for o in (native, poller) if o is not None]
+    observer = observers[0] if len(observers) == 1 else ObserverGroup(observers)
     observer.start()
     
     if log_callback:
-        log_callback(f"Watching {source_folder} for new images...")
+        for root, recursive, use_polling in roots:
+            log_callback(f"Watching {root}{' (and subfolders)' if recursive else ''}"
+                         f"{' by polling' if use_polling else ''} for new images...")
     
     return observer
 
@@ -40,24 +105,10 @@ def start_to_watch(config):
     """
     Blocking start for CLI usage.
     """
-    source_folder = config.get("source_folder")
-    if not source_folder:
+    from . import daemon
+    if not config.get("source_folder") and not config.get("sources"):
         print("No source folder configured.")
         return
 
-    # Use default print for CLI
-    event_handler = ImageHandler(config, log_callback=print)
-    observer = Observer()
-    observer.schedule(event_handler, source_folder, recursive=False)
-    observer.start()
-    
-    print(f"Watching {source_folder} for new images...")
     print("Press Ctrl+C to stop.")
-    
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        observer.stop()
-    
-    observer.join()
+    daemon.run(config)
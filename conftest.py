@@ -0,0 +1,51 @@
+import pytest
+from PIL import Image, ImageDraw
+
+@pytest.fixture(autouse=True)
+def _state_in_tmp_path(tmp_path, monkeypatch):
+    """
+    Runs every test in its tmp_path: state files and the default staging
+    folder are relative to the working directory.
+    """
+    monkeypatch.chdir(tmp_path)
+
+@pytest.fixture
+def frame_overlay():
+    """
+    600x400 RGBA overlay: a translucent bar along the top, a solid dot
+    bottom right, transparent everywhere else.
+    """
+    img = Image.new("RGBA", (600, 400), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, 0, 599, 30), fill=(255, 255, 255, 200))
+    draw.ellipse((450, 300, 550, 390), fill=(255, 0, 0, 255))
+    return img
+
+@pytest.fixture
+def frame_overlay_path(frame_overlay, tmp_path):
+    path = str(tmp_path / "overlay.png")
+    frame_overlay.save(path)
+    return path
+
+@pytest.fixture
+def noise_photo():
+    return Image.effect_noise((1500, 1000), 60).convert("RGB")
+
+@pytest.fixture
+def pipeline_config(tmp_path, frame_overlay_path):
+    """
+    Config for a pipeline working in tmp_path: an empty source folder and
+    an output folder that doesn't exist yet.
+    """
+    source = tmp_path / "src"
+    source.mkdir()
+    return {
+        "source_folder": str(source),
+        "output_folder": str(tmp_path / "out"),
+        "landscape_overlay": frame_overlay_path,
+        "portrait_overlay": frame_overlay_path,
+        "ledger_path": str(tmp_path / "ledger.db"),
+        "thumbnail_cache": "",
+        "overlay_store": "",
+        "backfill_checkpoint": "",
+    }
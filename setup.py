@@ -15,6 +15,7 @@ setup(
     entry_points={
         "console_scripts": [
             "capturesync=capturesync.main:main",
+            "capturesync-daemon=capturesync.daemon:main",
         ],
     },
     python_requires=">=3.8",
@@ -0,0 +1,76 @@
+import os
+import threading
+from capturesync import sources
+from capturesync.engine import Engine
+from capturesync.backfill import BackfillScanner
+
+class _StubPipeline:
+    """
+    Accepts everything except the paths in busy, as if the watcher had
+    already queued them.
+    """
+    def __init__(self, config, busy=()):
+        self.sources = sources.SourceRouter(config)
+        self.busy = set(busy)
+        self.submitted = []
+
+    def submit(self, file_path, timeout=None, priority=None):
+        if file_path in self.busy:
+            return False
+        self.submitted.append(file_path)
+        return True
+
+    def is_pending(self, file_path):
+        return False
+
+    def is_stopping(self):
+        return False
+
+def _source(tmp_path, count, name="src"):
+    folder = tmp_path / name
+    folder.mkdir()
+    for i in range(count):
+        path = folder / f"img{i}.jpg"
+        path.write_bytes(b"\xff\xd8 not really a photo \xff\xd9")
+        # Oldest first: img0, img1, ...
+        os.utime(path, (1000 + i, 1000 + i))
+    return str(folder)
+
+def test_duplicate_does_not_end_the_scan(tmp_path):
+    config = {"source_folder": _source(tmp_path, 5), "ledger_path": "", "backfill_checkpoint": ""}
+    busy = os.path.join(config["source_folder"], "img2.jpg")
+    pipeline = _StubPipeline(config, busy=[busy])
+    scanner = BackfillScanner(pipeline.sources.profiles[0], pipeline, log_callback=lambda message: None)
+    scanner.run()
+    assert [os.path.basename(p) for p in pipeline.submitted] == ["img0.jpg", "img1.jpg", "img3.jpg", "img4.jpg"]
+
+def test_scan_stops_when_not_running(tmp_path):
+    config = {"source_folder": _source(tmp_path, 3), "ledger_path": "", "backfill_checkpoint": ""}
+    pipeline = _StubPipeline(config, busy=[os.path.join(config["source_folder"], "img0.jpg")])
+    running = iter([True, False])
+    scanner = BackfillScanner(pipeline.sources.profiles[0], pipeline, log_callback=lambda message: None,
+                              is_running=lambda: next(running, False))
+    scanner.run()
+    assert pipeline.submitted == []
+
+def test_sources_are_scanned_concurrently(tmp_path):
+    config = {"sources": [{"source_folder": _source(tmp_path, 2, "cam1")}, {"source_folder": _source(tmp_path, 2, "cam2")}],
+              "ledger_path": "", "backfill_checkpoint": ""}
+    pipeline = _StubPipeline(config)
+    second_started = threading.Event()
+    waited = []
+
+    def submit(file_path, timeout=None, priority=None):
+        # The first source's lane stays "full" until the second one submits
+        if os.sep + "cam2" + os.sep in file_path:
+            second_started.set()
+        else:
+            waited.append(second_started.wait(timeout=5))
+        return True
+
+    pipeline.submit = submit
+    engine = Engine(config, log_callback=lambda message: None)
+    engine.pipeline = pipeline
+    engine.running = True
+    engine.process_existing_files()
+    assert waited == [True, True]
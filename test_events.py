@@ -0,0 +1,41 @@
+import threading
+from capturesync import events as ev
+
+def test_events_come_out_in_order():
+    bus = ev.EventBus()
+    bus.publish(ev.DETECTED, "a.jpg")
+    bus.log("working")
+    bus.publish(ev.FINISHED, "a.jpg", output_path="out/a.jpg")
+    assert [(e.kind, e.path) for e in bus.drain(2)] == [(ev.DETECTED, "a.jpg"), (ev.LOG, None)]
+    finished, = bus.drain()
+    assert finished.output_path == "out/a.jpg" and finished.time is not None
+    assert bus.drain() == []
+
+def test_full_queue_drops_the_oldest_but_counts_everything():
+    bus = ev.EventBus(max_events=3)
+    for i in range(5):
+        bus.publish(ev.DETECTED, f"{i}.jpg")
+    bus.publish(ev.FINISHED, "0.jpg")
+    assert [e.path for e in bus.drain()] == ["3.jpg", "4.jpg", "0.jpg"]
+    assert bus.counts() == {ev.DETECTED: 5, ev.FINISHED: 1}
+    assert bus.dropped() == {ev.DETECTED: 3}
+
+    bus.reset()
+    assert (bus.drain(), bus.counts(), bus.dropped()) == ([], {}, {})
+
+def test_concurrent_publishers_keep_per_thread_order():
+    bus = ev.EventBus()
+
+    def produce(name):
+        for i in range(500):
+            bus.publish(ev.DETECTED, f"{name}_{i}")
+
+    threads = [threading.Thread(target=produce, args=(name,)) for name in "abcd"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    paths = [e.path for e in bus.drain()]
+    assert len(paths) == 2000 and bus.counts()[ev.DETECTED] == 2000
+    for name in "abcd":
+        assert [p for p in paths if p.startswith(name)] == [f"{name}_{i}" for i in range(500)]
@@ -0,0 +1,13 @@
+from capturesync import ledger
+
+def test_output_settings_change_the_version(tmp_path):
+    config = {"output_folder": str(tmp_path / "out"), "landscape_overlay": str(tmp_path / "frame.png")}
+    version = ledger.output_version(config)
+    assert ledger.output_version(dict(config)) == version
+    for change in ({"max_long_edge": 2048}, {"renditions": [{}, {"name": "web", "max_long_edge": 1080}]},
+                   {"file_prefix": "EV"}, {"output_folder": str(tmp_path / "other")}):
+        assert ledger.output_version(dict(config, **change)) != version
+
+    # A job in an hour folder keeps the version of its top output folder
+    job = dict(config, output_folder=str(tmp_path / "out" / "Gala" / "21h"), output_root=config["output_folder"])
+    assert ledger.output_version(job) == version
@@ -0,0 +1,77 @@
+import os
+import time
+from PIL import Image
+from capturesync import layout, manifest, sequence
+
+def _output(folder, name, size=(64, 48)):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, name)
+    Image.new("RGB", size, (200, 10, 10)).save(path, "JPEG")
+    return path
+
+def test_session_hour_folders(tmp_path):
+    config = {"output_folder": str(tmp_path), "output_layout": "session_hour", "session_name": "Gala"}
+    when = time.mktime((2026, 10, 18, 21, 15, 0, 0, 0, -1))
+    assert layout.session_root(config, layout.session_name(config)) == os.path.join(str(tmp_path), "Gala")
+    assert layout.output_folder_for(config, "Gala", when) == os.path.join(str(tmp_path), "Gala", "21h")
+    assert layout.manifest_enabled(config)
+    assert not layout.manifest_enabled({"output_folder": str(tmp_path)})
+
+def test_manifest_lives_outside_the_output_folder(tmp_path):
+    config = {"output_folder": str(tmp_path / "Drive" / "Event"), "manifest_dir": str(tmp_path / "manifests")}
+    path = manifest.manifest_path(config, "Gala")
+    assert path.startswith(str(tmp_path / "manifests") + os.sep)
+    assert os.path.basename(path) == "Gala.jsonl"
+    # Another output folder with the same name gets its own
+    assert manifest.manifest_path(dict(config, output_folder=str(tmp_path / "Event")), "Gala") != path
+
+def test_manifest_is_read_incrementally(tmp_path):
+    root = str(tmp_path / "Gala")
+    book = manifest.Manifest(str(tmp_path / "manifests" / "Gala.jsonl"), "Gala")
+    renditions = [{"name": "full", "folder": os.path.join(root, "21h")},
+                  {"name": "web", "folder": os.path.join(root, "21h", "web")}]
+    files = manifest.describe_outputs([_output(os.path.join(root, "21h"), "EV_1.jpg"),
+                                       _output(os.path.join(root, "21h", "web"), "EV_1.jpg", (32, 24))], renditions)
+    book.append("/cam/DSC_1.jpg", files, str(tmp_path))
+
+    entries, offset = manifest.read_entries(book.path)
+    assert [(e["output"], e["rendition"], e["width"]) for e in entries] == [
+        ("Gala/21h/EV_1.jpg", "full", 64), ("Gala/21h/web/EV_1.jpg", "web", 32)]
+    assert entries[0]["bytes"] == os.path.getsize(entries[0]["path"])
+    assert len(entries[0]["sha256"]) == 64
+
+    # A torn line from a crash is skipped, and the next append starts a fresh line
+    with open(book.path, "a") as f:
+        f.write('{"output": "Gala/21h/EV_')
+    assert manifest.read_entries(book.path, offset) == ([], offset)
+    later = manifest.Manifest(book.path, "Gala")
+    later.append("/cam/DSC_7.jpg", manifest.describe_outputs([_output(os.path.join(root, "22h"), "EV_7.jpg")], renditions), str(tmp_path))
+    entries, _ = manifest.read_entries(book.path, offset)
+    assert [e["output"] for e in entries] == ["Gala/22h/EV_7.jpg"]
+
+def test_sequence_resumes_from_manifest(tmp_path):
+    root = str(tmp_path / "Gala")
+    renditions = [{"name": "full", "folder": root}]
+    book = manifest.Manifest(str(tmp_path / "Gala.jsonl"), "Gala")
+    book.append("/cam/a.jpg", manifest.describe_outputs([_output(os.path.join(root, "20h"), "EV_41.jpg")], renditions), str(tmp_path))
+
+    # The hour folder isn't listed, the manifest knows about it
+    allocator = sequence.SequenceAllocator(root, "EV", state_file=str(tmp_path / "state.json"),
+                                           manifest_path=book.path)
+    assert allocator.reserve() == 42
+
+def _save_many(state_file, writer):
+    for i in range(50):
+        sequence._save_state(state_file, f"{writer}-{i}", i)
+
+def test_state_saves_from_several_processes(tmp_path):
+    import multiprocessing
+    state_file = str(tmp_path / "state.json")
+    writers = [multiprocessing.Process(target=_save_many, args=(state_file, w)) for w in range(4)]
+    for p in writers:
+        p.start()
+    for p in writers:
+        p.join(30)
+    assert [p.exitcode for p in writers] == [0, 0, 0, 0]
+    assert sequence._load_state(state_file)
+    assert os.listdir(tmp_path) == ["state.json"]
@@ -0,0 +1,60 @@
+import random
+import pytest
+from PIL import Image
+from capturesync import numpy_engine, overlay
+
+np = pytest.importorskip("numpy")
+
+def _random_overlay(size, seed=0):
+    rng = random.Random(seed)
+    width, height = size
+    data = rng.getrandbits(width * height * 32).to_bytes(width * height * 4, "little")
+    ov = Image.frombytes("RGBA", size, data)
+    # Plenty of fully transparent pixels, like a real frame overlay
+    ov.putalpha(ov.getchannel("A").point(lambda a: 0 if a < 128 else a))
+    return ov
+
+def _random_photo(size, seed=1):
+    rng = random.Random(seed)
+    width, height = size
+    return Image.frombytes("RGB", size, rng.getrandbits(width * height * 24).to_bytes(width * height * 3, "little"))
+
+def _pillow_reference(photo, ov):
+    ref = photo.convert("RGBA")
+    ref.alpha_composite(ov)
+    return ref.convert("RGB")
+
+def test_numpy_composite_matches_pillow_within_one():
+    ov = _random_overlay((300, 200))
+    photo = _random_photo((300, 200))
+    prepared = overlay.PreparedOverlay(ov)
+
+    out = numpy_engine.composite(photo.copy(), prepared)
+    diff = np.abs(np.asarray(out, dtype=np.int16) - np.asarray(_pillow_reference(photo, ov), dtype=np.int16))
+    assert diff.max() <= 1
+
+def test_numpy_batch_matches_single():
+    ov = _random_overlay((300, 200))
+    prepared = overlay.PreparedOverlay(ov)
+    photos = [_random_photo((300, 200), seed=s) for s in range(3)]
+
+    batch = numpy_engine.composite_batch([p.copy() for p in photos], prepared)
+    for photo, out in zip(photos, batch):
+        single = numpy_engine.composite(photo.copy(), prepared)
+        assert np.array_equal(np.asarray(out), np.asarray(single))
+
+def test_numpy_arrays_count_towards_the_cache_limit(tmp_path):
+    overlay_path = str(tmp_path / "overlay.png")
+    _random_overlay((300, 200)).save(overlay_path)
+    cache = overlay.overlay_cache
+    cache.invalidate()
+    try:
+        prepared = cache.get(overlay_path, (300, 200), "landscape")
+        before = cache.stats()["bytes"]
+        overlay.apply_overlay(_random_photo((300, 200)), prepared, engine="numpy")
+        assert cache.stats()["bytes"] == before + prepared.numpy_arrays.nbytes
+        # Evicting the entry gives the arrays back too
+        cache.invalidate(overlay_path)
+        assert cache.stats()["bytes"] == 0
+    finally:
+        cache.invalidate()
@@ -0,0 +1,63 @@
+import os
+from PIL import Image
+from capturesync import overlay
+
+def test_hits_and_misses(frame_overlay_path):
+    cache = overlay.OverlayCache()
+    first = cache.get(frame_overlay_path, (300, 200), "landscape")
+    assert cache.get(frame_overlay_path, (300, 200), "landscape") is first
+    # Another size or orientation is another entry
+    cache.get(frame_overlay_path, (150, 100), "landscape")
+    cache.get(frame_overlay_path, (300, 200), "square")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 3, 3)
+    assert stats["bytes"] == sum(entry.nbytes for entry in cache._entries.values())
+
+def test_least_recently_used_is_evicted(frame_overlay_path):
+    one = overlay.OverlayCache().get(frame_overlay_path, (300, 200), "landscape").nbytes
+    cache = overlay.OverlayCache(max_bytes=2 * one)
+    cache.get(frame_overlay_path, (300, 200), "landscape")
+    cache.get(frame_overlay_path, (300, 200), "portrait")
+    # Touch the first so the second is the oldest
+    cache.get(frame_overlay_path, (300, 200), "landscape")
+    cache.get(frame_overlay_path, (300, 200), "square")
+
+    assert cache.stats()["evictions"] == 1
+    assert [key[3] for key in cache._entries] == ["landscape", "square"]
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+def test_charge_counts_towards_the_budget(frame_overlay_path):
+    one = overlay.OverlayCache().get(frame_overlay_path, (300, 200), "landscape").nbytes
+    cache = overlay.OverlayCache(max_bytes=3 * one)
+    cache.get(frame_overlay_path, (300, 200), "portrait")
+    charged = cache.get(frame_overlay_path, (300, 200), "landscape")
+    cache.charge(charged, 2 * one)
+
+    # The charged entry is in use and stays; the older one makes room
+    assert [key[3] for key in cache._entries] == ["landscape"]
+    assert cache.stats()["bytes"] == 3 * one
+    # Not cached: nothing to charge
+    cache.charge(overlay.OverlayCache().get(frame_overlay_path, (150, 100), "landscape"), one)
+    assert cache.stats()["bytes"] == 3 * one
+
+def test_resaved_overlay_replaces_the_cached_one(frame_overlay, frame_overlay_path):
+    cache = overlay.OverlayCache()
+    old = cache.get(frame_overlay_path, (300, 200), "landscape")
+
+    frame_overlay.transpose(Image.Transpose.FLIP_TOP_BOTTOM).save(frame_overlay_path)
+    stat = os.stat(frame_overlay_path)
+    os.utime(frame_overlay_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    new = cache.get(frame_overlay_path, (300, 200), "landscape")
+
+    assert new is not old
+    assert new.image.tobytes() != old.image.tobytes()
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["bytes"] == new.nbytes
+
+def test_invalidate(frame_overlay_path):
+    cache = overlay.OverlayCache()
+    cache.get(frame_overlay_path, (300, 200), "landscape")
+    cache.invalidate(frame_overlay_path)
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+    cache.get(frame_overlay_path, (300, 200), "landscape")
+    assert cache.stats()["misses"] == 2
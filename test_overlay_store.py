@@ -0,0 +1,24 @@
+import os
+from capturesync import overlay, overlay_store
+
+def test_stored_overlay_blends_like_a_fresh_one(tmp_path, frame_overlay_path, noise_photo):
+    overlay_path, photo = frame_overlay_path, noise_photo
+    store = str(tmp_path / "store")
+    expected = overlay.OverlayCache().get(overlay_path, photo.size, "landscape").composite_onto(photo.copy())
+
+    # First worker prepares and writes it, the second only maps it
+    overlay.OverlayCache(store_dir=store).get(overlay_path, photo.size, "landscape")
+    mapped = overlay.OverlayCache(store_dir=store).get(overlay_path, photo.size, "landscape")
+    assert mapped._image is None
+    assert mapped.composite_onto(photo.copy()).tobytes() == expected.tobytes()
+
+def test_garbage_collection_drops_unused_entries(tmp_path, frame_overlay_path):
+    overlay_path = frame_overlay_path
+    store = str(tmp_path / "store")
+    overlay.OverlayCache(store_dir=store).get(overlay_path, (300, 200), "landscape")
+    assert overlay_store.collect_garbage(store) == 0
+
+    for name in os.listdir(store):
+        os.utime(os.path.join(store, name), (0, 0))
+    assert overlay_store.collect_garbage(store) == 1
+    assert os.listdir(store) == []
@@ -0,0 +1,88 @@
+import os
+import time
+from PIL import Image
+from capturesync import events as ev
+from capturesync.pipeline import BACKFILL_LANE_PER_WORKER, Pipeline
+from capturesync.upload_queue import PRIORITY_BACKFILL
+
+def _photos(folder, count, size=(400, 300)):
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"DSC_{i}.jpg")
+        Image.effect_noise(size, 60).convert("RGB").save(path, quality=85)
+        paths.append(path)
+    return paths
+
+def _wait_for(bus, count, kinds=(ev.FINISHED, ev.FAILED, ev.SKIPPED), timeout=30):
+    """
+    Events of the given kinds (default: files that left the pipeline),
+    in order, until count of them arrived.
+    """
+    seen = []
+    deadline = time.monotonic() + timeout
+    while len(seen) < count and time.monotonic() < deadline:
+        seen += [e for e in bus.drain() if e.kind in kinds]
+        time.sleep(0.01)
+    return seen
+
+def test_workers_get_unique_numbers_in_a_new_output_folder(pipeline_config):
+    config = dict(pipeline_config, file_prefix="EV", max_workers=4)
+    bus = ev.EventBus()
+    pipeline = Pipeline(config, log_callback=lambda message: None, events=bus).start()
+    try:
+        for path in _photos(config["source_folder"], 8):
+            assert pipeline.submit(path)
+        done = _wait_for(bus, 8)
+    finally:
+        pipeline.stop()
+    assert [e.kind for e in done] == [ev.FINISHED] * 8
+    assert sorted(os.listdir(config["output_folder"]), key=lambda n: int(n[3:-4])) == [f"EV_{i}.jpg" for i in range(1, 9)]
+
+def test_live_captures_go_before_the_backfill(pipeline_config):
+    config = dict(pipeline_config, max_workers=1)
+    # As much backlog as the lane holds, so queueing it never blocks
+    busy, *backlog, live = _photos(config["source_folder"], BACKFILL_LANE_PER_WORKER + 2, size=(3000, 2000))
+    bus = ev.EventBus()
+    pipeline = Pipeline(config, log_callback=lambda message: None, events=bus).start()
+    try:
+        # The only worker is busy while the backlog and then a live capture queue up
+        pipeline.submit(busy)
+        _wait_for(bus, 1, kinds=(ev.STARTED,))
+        for path in backlog:
+            assert pipeline.submit(path, priority=PRIORITY_BACKFILL)
+        assert pipeline.submit(live)
+        done = _wait_for(bus, len(backlog) + 2)
+    finally:
+        pipeline.stop()
+    assert [e.path for e in done] == [busy, live] + backlog
+
+def test_full_backfill_lane_blocks_only_the_backfill(pipeline_config):
+    # Not started: nothing takes jobs off the lanes
+    pipeline = Pipeline(dict(pipeline_config, max_workers=1), log_callback=lambda message: None)
+    paths = _photos(pipeline_config["source_folder"], BACKFILL_LANE_PER_WORKER + 2)
+    for path in paths[:BACKFILL_LANE_PER_WORKER]:
+        assert pipeline.submit(path, priority=PRIORITY_BACKFILL)
+    assert not pipeline.submit(paths[-2], timeout=0.1, priority=PRIORITY_BACKFILL)
+    assert not pipeline.is_pending(paths[-2])
+    assert pipeline.submit(paths[-1], timeout=0.1)
+    assert pipeline.queue_depth() == BACKFILL_LANE_PER_WORKER + 1
+
+def test_stop_finishes_running_jobs_and_drops_queued_ones(pipeline_config):
+    config = dict(pipeline_config, max_workers=1)
+    paths = _photos(config["source_folder"], 6, size=(3000, 2000))
+    bus = ev.EventBus()
+    pipeline = Pipeline(config, log_callback=lambda message: None, events=bus).start()
+    for path in paths:
+        assert pipeline.submit(path)
+    _wait_for(bus, 1, kinds=(ev.STARTED,))
+    pipeline.stop(wait=True)
+
+    finished = [e.path for e in bus.drain() if e.kind == ev.FINISHED]
+    assert 1 <= len(finished) < len(paths)
+    assert not any(pipeline.is_pending(path) for path in paths)
+    # Whatever was written is complete and in place
+    outputs = os.listdir(config["output_folder"])
+    assert len(outputs) == len(finished)
+    for name in outputs:
+        with Image.open(os.path.join(config["output_folder"], name)) as img:
+            img.verify()
@@ -0,0 +1,87 @@
+import os
+import queue
+import shutil
+from watchdog.events import FileCreatedEvent, FileDeletedEvent, FileModifiedEvent
+from watchdog.observers.api import ObservedWatch
+from capturesync import polling
+
+def _emitter(folder, recursive=False, prune=None):
+    events = queue.Queue()
+    emitter = polling.SnapshotEmitter(events, ObservedWatch(str(folder), recursive=recursive), prune=prune,
+                                      min_interval=0.01, max_interval=0.05)
+    return emitter, events
+
+def _poll(emitter, events):
+    """
+    One poll; returns the (event type, file name) pairs it queued.
+    """
+    emitter.queue_events(emitter.timeout)
+    seen = []
+    while not events.empty():
+        event, _ = events.get_nowait()
+        seen.append((type(event), os.path.basename(event.src_path)))
+    return seen
+
+def test_files_present_at_start_are_not_reported(tmp_path):
+    (tmp_path / "old.jpg").write_bytes(b"x")
+    os.utime(tmp_path / "old.jpg", (1000, 1000))
+    emitter, events = _emitter(tmp_path)
+    assert _poll(emitter, events) == []
+    assert _poll(emitter, events) == []
+
+def test_create_modify_delete(tmp_path):
+    emitter, events = _emitter(tmp_path)
+    _poll(emitter, events)
+
+    photo = tmp_path / "a.jpg"
+    photo.write_bytes(b"first chunk")
+    assert _poll(emitter, events) == [(FileCreatedEvent, "a.jpg")]
+    # Written into in place: the directory doesn't change, the hot re-stat sees it
+    with open(photo, "ab") as f:
+        f.write(b" and the rest")
+    assert _poll(emitter, events) == [(FileModifiedEvent, "a.jpg")]
+    photo.unlink()
+    assert _poll(emitter, events) == [(FileDeletedEvent, "a.jpg")]
+
+def test_rename_from_part(tmp_path):
+    emitter, events = _emitter(tmp_path)
+    _poll(emitter, events)
+    (tmp_path / "b.jpg.part").write_bytes(b"whole file")
+    assert _poll(emitter, events) == [(FileCreatedEvent, "b.jpg.part")]
+    os.replace(tmp_path / "b.jpg.part", tmp_path / "b.jpg")
+    assert sorted(_poll(emitter, events), key=lambda e: e[1]) == [
+        (FileCreatedEvent, "b.jpg"), (FileDeletedEvent, "b.jpg.part")]
+
+def test_rename_over_a_known_file_is_seen(tmp_path):
+    (tmp_path / "c.jpg").write_bytes(b"old version")
+    emitter, events = _emitter(tmp_path)
+    _poll(emitter, events)
+    (tmp_path / "c.jpg.part").write_bytes(b"new version!")
+    os.replace(tmp_path / "c.jpg.part", tmp_path / "c.jpg")
+    assert (FileModifiedEvent, "c.jpg") in _poll(emitter, events)
+
+def test_pruned_and_removed_subfolders(tmp_path):
+    (tmp_path / "DCIM").mkdir()
+    (tmp_path / ".cache").mkdir()
+    emitter, events = _emitter(tmp_path, recursive=True,
+                               prune=lambda path: os.path.basename(path).startswith("."))
+    _poll(emitter, events)
+
+    (tmp_path / "DCIM" / "d.jpg").write_bytes(b"x")
+    (tmp_path / ".cache" / "e.jpg").write_bytes(b"x")
+    assert _poll(emitter, events) == [(FileCreatedEvent, "d.jpg")]
+    shutil.rmtree(tmp_path / "DCIM")
+    assert _poll(emitter, events) == [(FileDeletedEvent, "d.jpg")]
+
+def test_interval_backs_off_while_idle(tmp_path):
+    emitter, events = _emitter(tmp_path)
+    _poll(emitter, events)
+    intervals = []
+    for _ in range(6):
+        _poll(emitter, events)
+        intervals.append(emitter.interval)
+    assert intervals == sorted(intervals) and intervals[-1] == 0.05
+
+    (tmp_path / "f.jpg").write_bytes(b"x")
+    _poll(emitter, events)
+    assert emitter.interval == 0.01
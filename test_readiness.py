@@ -0,0 +1,69 @@
+import io
+import time
+from PIL import Image
+from capturesync import processor
+from capturesync.readiness import ReadinessTracker
+
+def _tracker(ready, dropped):
+    return ReadinessTracker(ready.append, dropped.append, quiet_period=0, settle_time=0.05, stall_timeout=0.3)
+
+def _check_until(tracker, path, seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline and path in tracker._pending:
+        tracker._check(path)
+        time.sleep(0.02)
+
+def test_jpeg_without_end_marker_is_never_ready(tmp_path):
+    path = str(tmp_path / "half.jpg")
+    with open(path, "wb") as f:
+        f.write(b"\xff\xd8" + b"\x10" * 4096)
+    ready, dropped = [], []
+    tracker = _tracker(ready, dropped)
+    tracker.touch(path)
+    _check_until(tracker, path, 2)
+    assert ready == []
+    assert dropped and "never finished" in dropped[0]
+
+def test_complete_jpeg_and_settled_unknown_format(tmp_path):
+    jpeg = str(tmp_path / "whole.jpg")
+    with open(jpeg, "wb") as f:
+        f.write(b"\xff\xd8" + b"\x10" * 4096 + b"\xff\xd9")
+    other = str(tmp_path / "raw.cr3")
+    with open(other, "wb") as f:
+        f.write(b"\x10" * 4096)
+    ready, dropped = [], []
+    tracker = _tracker(ready, dropped)
+    for path in (jpeg, other):
+        tracker.touch(path)
+        _check_until(tracker, path, 2)
+    assert ready == [jpeg, other]
+
+def _jpeg_bytes():
+    buf = io.BytesIO()
+    Image.effect_noise((800, 600), 60).convert("RGB").save(buf, "JPEG")
+    return buf.getvalue()
+
+def test_jpeg_with_data_after_eoi_is_ready_once_settled(tmp_path):
+    # Motion photos append the video after the JPEG's EOI
+    path = str(tmp_path / "motion.jpg")
+    with open(path, "wb") as f:
+        f.write(_jpeg_bytes() + b"\x00\x00\x00\x18ftypmp42" + b"\x10" * 4096)
+    ready, dropped = [], []
+    tracker = _tracker(ready, dropped)
+    tracker.touch(path)
+    _check_until(tracker, path, 2)
+    assert ready == [path]
+    assert dropped == []
+    assert processor.wait_for_file_ready(path, timeout=3)
+
+def test_truncated_jpeg_is_still_dropped(tmp_path):
+    data = _jpeg_bytes()
+    path = str(tmp_path / "cut.jpg")
+    with open(path, "wb") as f:
+        f.write(data[:len(data) // 2])
+    ready, dropped = [], []
+    tracker = _tracker(ready, dropped)
+    tracker.touch(path)
+    _check_until(tracker, path, 2)
+    assert ready == []
+    assert dropped and "never finished" in dropped[0]
@@ -0,0 +1,63 @@
+import os
+from PIL import Image, JpegImagePlugin
+from capturesync import overlay
+
+def test_resolve_renditions_defaults_and_folders(tmp_path):
+    output = str(tmp_path / "out")
+    resolved = overlay.resolve_renditions([{}, {"name": "web", "max_long_edge": 2048}, {"quality": 70},
+                                           {"name": "social", "folder": "social"}, {"name": "print", "folder": str(tmp_path / "print")}],
+                                          output)
+    assert [r["name"] for r in resolved] == ["full", "web", "rendition2", "social", "print"]
+    assert [r["folder"] for r in resolved] == [output, os.path.join(output, "web"), os.path.join(output, "rendition2"),
+                                               os.path.join(output, "social"), str(tmp_path / "print")]
+    assert resolved[0] == dict(overlay.DEFAULT_RENDITION, folder=output)
+    assert resolved[2]["quality"] == 70 and resolved[2]["max_long_edge"] is None
+    # No renditions configured: one full-size output
+    assert overlay.resolve_renditions(None, output) == [dict(overlay.DEFAULT_RENDITION, folder=output)]
+
+def test_decode_size_follows_the_largest_rendition():
+    assert overlay.decode_long_edge([{"max_long_edge": 2048}, {"max_long_edge": 1080}]) == 2048
+    assert overlay.decode_long_edge([{"max_long_edge": 2048}, {"max_long_edge": 1080}], 1600) == 1600
+    # One uncapped rendition needs the full decode
+    assert overlay.decode_long_edge([{"max_long_edge": None}, {"max_long_edge": 1080}]) is None
+
+def test_renditions_are_written_with_their_settings(tmp_path, frame_overlay_path, noise_photo, monkeypatch):
+    photo_path = str(tmp_path / "photo.jpg")
+    noise_photo.save(photo_path, quality=95)
+    output = str(tmp_path / "out")
+    renditions = [
+        {},
+        {"name": "web", "max_long_edge": 800, "quality": 70, "progressive": True, "optimize": False, "subsampling": "4:2:0"},
+        {"name": "social", "max_long_edge": 300, "quality": 60, "optimize": False, "folder": "social_out"},
+    ]
+    saved = []
+    save_staged = overlay.save_staged
+    def recording_save_staged(img, output_path, staging_root=None, **options):
+        saved.append(options)
+        return save_staged(img, output_path, staging_root, **options)
+    monkeypatch.setattr(overlay, "save_staged", recording_save_staged)
+
+    outputs = []
+    result = overlay.process_image(photo_path, frame_overlay_path, frame_overlay_path, output,
+                                   renditions=renditions, outputs=outputs)
+    assert result == outputs[0] == os.path.join(output, "photo_processed.jpg")
+    assert outputs[1:] == [os.path.join(output, "web", "photo_processed.jpg"),
+                           os.path.join(output, "social_out", "photo_processed.jpg")]
+
+    opened = [Image.open(path) for path in outputs]
+    try:
+        assert [img.size for img in opened] == [(1500, 1000), (800, 533), (300, 200)]
+        assert [bool(img.info.get("progressive")) for img in opened] == [False, True, False]
+        # 2 is 4:2:0
+        assert JpegImagePlugin.get_sampling(opened[1]) == 2
+        # Quantization tables are those of the asked-for quality
+        for img, quality in zip(opened, (90, 70, 60)):
+            reference = tmp_path / f"q{quality}.jpg"
+            Image.new("RGB", (16, 16)).save(reference, quality=quality)
+            with Image.open(reference) as ref:
+                assert img.quantization[0] == ref.quantization[0]
+    finally:
+        for img in opened:
+            img.close()
+    # The slow optimize pass only where it is set
+    assert [options["optimize"] for options in saved] == [True, False, False]
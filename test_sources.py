@@ -0,0 +1,32 @@
+import os
+from capturesync.sources import SourceRouter
+
+def test_router_picks_profile_and_filters(tmp_path):
+    a = str(tmp_path / "camA")
+    b = str(tmp_path / "camB")
+    out = str(tmp_path / "camA" / "out")
+    router = SourceRouter({
+        "output_folder": out,
+        "file_prefix": "shared",
+        "sources": [
+            {"source_folder": a},
+            {"source_folder": b, "file_prefix": "B", "recursive": False, "ignore": ["*_tmp*"]},
+        ],
+    })
+
+    profile = router.accepts(os.path.join(a, "DCIM", "100_FUJI", "DSCF0001.JPG"))
+    assert profile["file_prefix"] == "shared"
+    assert router.accepts(os.path.join(b, "x.jpg"))["file_prefix"] == "B"
+
+    # Wrong extension, hidden, ignored, flat source's subfolder, our own outputs
+    assert router.accepts(os.path.join(a, "notes.txt")) is None
+    assert router.accepts(os.path.join(a, ".staging", "x.jpg")) is None
+    assert router.accepts(os.path.join(b, "x_tmp.jpg")) is None
+    assert router.accepts(os.path.join(b, "sub", "x.jpg")) is None
+    assert router.accepts(os.path.join(out, "shared_1.jpg")) is None
+
+def test_single_source_folder_stays_flat(tmp_path):
+    router = SourceRouter({"source_folder": str(tmp_path)})
+    assert router.watch_roots() == [(str(tmp_path), False, False)]
+    assert router.accepts(str(tmp_path / "a.jpg")) is not None
+    assert router.accepts(str(tmp_path / "sub" / "a.jpg")) is None
@@ -0,0 +1,90 @@
+import threading
+import pytest
+from PIL import Image, ImageChops, JpegImagePlugin
+from capturesync import overlay
+from capturesync.budget import MemoryBudget
+
+def _full_frame(photo, ov):
+    """
+    The original full-frame blend: whole photo to RGBA, alpha_composite, back to RGB.
+    """
+    frame = photo.convert("RGBA")
+    frame.alpha_composite(ov.resize(photo.size, Image.Resampling.LANCZOS))
+    return frame.convert("RGB")
+
+@pytest.mark.parametrize("portrait", [False, True])
+def test_region_composite_is_identical_to_full_frame(frame_overlay, noise_photo, portrait):
+    photo, ov = noise_photo, frame_overlay
+    if portrait:
+        photo, ov = photo.transpose(Image.Transpose.ROTATE_90), ov.transpose(Image.Transpose.ROTATE_90)
+    prepared = overlay.PreparedOverlay(ov.resize(photo.size, Image.Resampling.LANCZOS))
+    assert prepared.composite_onto(photo.copy()).tobytes() == _full_frame(photo, ov).tobytes()
+
+# 33 rows a strip, aligned down to 30; 1000 rows leave a last strip of 10
+# (portrait: 47 -> 45 rows, 1500 rows leave 15)
+@pytest.mark.parametrize("portrait, strip_pixels", [(False, 50000), (True, 47000)])
+def test_strip_composite_is_identical_to_full_frame(frame_overlay, noise_photo, portrait, strip_pixels):
+    photo, ov = noise_photo, frame_overlay
+    if portrait:
+        photo, ov = photo.transpose(Image.Transpose.ROTATE_90), ov.transpose(Image.Transpose.ROTATE_90)
+    strips = overlay.StripOverlay(ov).composite_onto(photo.copy(), strip_pixels=strip_pixels)
+    assert strips.tobytes() == _full_frame(photo, ov).tobytes()
+
+def test_unaligned_strips_stay_within_one_level(frame_overlay):
+    # 1333 and 400 share no period shorter than the photo: strips can't be aligned
+    photo = Image.effect_noise((1500, 1333), 60).convert("RGB")
+    strips = overlay.StripOverlay(frame_overlay).composite_onto(photo.copy(), strip_pixels=50000)
+    assert max(high for _, high in ImageChops.difference(_full_frame(photo, frame_overlay), strips).getextrema()) <= 1
+
+def test_budget_holds_jobs_back_until_released():
+    budget = MemoryBudget(100)
+    assert budget.reserve(60)
+    assert not budget.reserve(60, timeout=0.05)
+    threading.Timer(0.05, budget.release, (60,)).start()
+    assert budget.reserve(60, timeout=2)
+    budget.release(60)
+    # Bigger than the whole budget: runs, but only alone
+    assert budget.reserve(500, timeout=0.05)
+
+def test_strip_mode_honours_max_long_edge(tmp_path, frame_overlay_path):
+    photo_path = str(tmp_path / "photo.jpg")
+    Image.effect_noise((3000, 2000), 60).convert("RGB").save(photo_path, quality=90)
+    overlay_path = frame_overlay_path
+
+    sizes = []
+    for strip_megapixels in (0, 1):
+        out = tmp_path / f"out{strip_megapixels}"
+        result = overlay.process_image(photo_path, overlay_path, overlay_path, str(out), max_long_edge=2000,
+                                       strip_megapixels=strip_megapixels)
+        with Image.open(result) as img:
+            sizes.append(img.size)
+    assert sizes == [(2000, 1333), (2000, 1333)]
+
+@pytest.mark.parametrize("strip_megapixels", [0, 1])
+def test_draft_decode_keeps_exif_orientation(tmp_path, frame_overlay_path, strip_megapixels, monkeypatch):
+    # Stored sideways (EXIF orientation 6: rotate 90° clockwise to view),
+    # with a red block in the stored top-left corner
+    stored = Image.new("RGB", (3000, 2000), (128, 128, 128))
+    stored.paste((255, 0, 0), (0, 0, 600, 400))
+    exif = stored.getexif()
+    exif[overlay.EXIF_ORIENTATION] = 6
+    photo_path = str(tmp_path / "photo.jpg")
+    stored.save(photo_path, quality=90, exif=exif)
+
+    drafts = []
+    draft = JpegImagePlugin.JpegImageFile.draft
+    def recording_draft(img, mode, size):
+        result = draft(img, mode, size)
+        drafts.append(result)
+        return result
+    monkeypatch.setattr(JpegImagePlugin.JpegImageFile, "draft", recording_draft)
+
+    result = overlay.process_image(photo_path, frame_overlay_path, frame_overlay_path, str(tmp_path / "out"),
+                                   max_long_edge=1500, strip_megapixels=strip_megapixels)
+    # Decoded at half size by the JPEG decoder (draft returns the mode and box it chose)
+    assert any(drafts)
+    with Image.open(result) as img:
+        # Upright portrait, capped; the block is now top right
+        assert img.size == (1000, 1500)
+        assert img.getpixel((900, 225))[0] > 200 and img.getpixel((900, 225))[1] < 60
+        assert img.getpixel((100, 225))[0] < 160
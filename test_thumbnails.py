@@ -0,0 +1,55 @@
+import os
+from PIL import Image
+from capturesync import thumbnails
+
+def _thumbnail(cache_dir, color, size=(600, 400)):
+    return thumbnails.save_thumbnail(Image.new("RGB", size, color), str(cache_dir))
+
+def test_save_thumbnail_fits_the_cell_and_is_stored_once(tmp_path):
+    path = _thumbnail(tmp_path, (200, 30, 30))
+    with Image.open(path) as img:
+        assert img.size == (250, 167)
+    # Same pixels, same file
+    assert _thumbnail(tmp_path, (200, 30, 30)) == path
+    with Image.open(_thumbnail(tmp_path, (0, 0, 0), size=(100, 80))) as img:
+        # Never upscaled
+        assert img.size == (100, 80)
+
+def test_index_survives_a_restart(tmp_path):
+    index = thumbnails.ThumbnailIndex(str(tmp_path))
+    first, second = _thumbnail(tmp_path, (255, 0, 0)), _thumbnail(tmp_path, (0, 255, 0))
+    index.add("out/a.jpg", first)
+    index.add("out/b.jpg", second)
+    # Re-added: moves to the end
+    index.add("out/a.jpg", first)
+    with open(index.path, "a", encoding="utf-8") as f:
+        f.write('{"output": "out/c.j')
+
+    reloaded = thumbnails.ThumbnailIndex(str(tmp_path))
+    assert reloaded.get("out/a.jpg") == first
+    assert reloaded.entries() == [(os.path.abspath("out/b.jpg"), second), (os.path.abspath("out/a.jpg"), first)]
+    assert reloaded.entries(str(tmp_path / "elsewhere")) == []
+
+def test_index_keeps_only_the_newest_entries(tmp_path):
+    index = thumbnails.ThumbnailIndex(str(tmp_path), max_entries=3)
+    paths = [_thumbnail(tmp_path, (i * 40, 0, 0)) for i in range(5)]
+    shared = paths[0]
+    index.add("out/shared_old.jpg", shared)
+    index.add("out/0.jpg", paths[1])
+    # Same thumbnail as shared_old: the file stays when that entry is dropped
+    index.add("out/shared_new.jpg", shared)
+    index.add("out/1.jpg", paths[2])
+    index.add("out/2.jpg", paths[3])
+
+    assert [os.path.basename(o) for o, _ in index.entries()] == ["shared_new.jpg", "1.jpg", "2.jpg"]
+    assert os.path.exists(shared)
+    assert not os.path.exists(paths[1])
+
+    # The index file is compacted instead of growing forever
+    for _ in range(10):
+        index.add("out/2.jpg", paths[4])
+    # Replaced by a new thumbnail
+    assert not os.path.exists(paths[3])
+    with open(index.path, encoding="utf-8") as f:
+        assert len(f.readlines()) <= 6
+    assert thumbnails.ThumbnailIndex(str(tmp_path), max_entries=3).entries() == index.entries()
@@ -0,0 +1,86 @@
+import threading
+import time
+from capturesync import uploader
+from capturesync.upload_queue import PRIORITY_BACKFILL, PRIORITY_LIVE, UploadQueue
+
+class RecordingBackend(uploader.UploadBackend):
+    """
+    Records upload order. The first upload blocks until release is set,
+    so everything queued meanwhile is ordered by the scheduler.
+    """
+    max_concurrency = 1
+
+    def __init__(self):
+        self.keys = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def upload(self, local_path, key):
+        self.started.set()
+        self.release.wait(5)
+        self.keys.append(key)
+        return key
+
+def _file(tmp_path, name, size=100):
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_live_before_backfill_newest_first(tmp_path):
+    backend = RecordingBackend()
+    uploads = UploadQueue(backend, str(tmp_path / "uploads.db"), log_callback=lambda m: None).start()
+
+    uploads.put(_file(tmp_path, "first.jpg", 600 * 1024), "first.jpg", captured=0)
+    backend.started.wait(5)
+    uploads.put(_file(tmp_path, "backfill.jpg"), "backfill.jpg", priority=PRIORITY_BACKFILL, captured=1)
+    uploads.put(_file(tmp_path, "older.jpg"), "older.jpg", priority=PRIORITY_LIVE, captured=2)
+    uploads.put(_file(tmp_path, "newest.jpg"), "newest.jpg", priority=PRIORITY_LIVE, captured=3)
+    backend.release.set()
+
+    _wait_for(lambda: len(backend.keys) == 4)
+    uploads.stop()
+    assert backend.keys == ["first.jpg", "newest.jpg", "older.jpg", "backfill.jpg"]
+
+def test_pending_uploads_survive_restart(tmp_path):
+    db = str(tmp_path / "uploads.db")
+    backend = RecordingBackend()
+    # Never started: as if the app was closed before anything was sent
+    UploadQueue(backend, db).put(_file(tmp_path, "ev_1.jpg"), "ev_1.jpg")
+
+    backend.release.set()
+    uploads = UploadQueue(backend, db, log_callback=lambda m: None).start()
+    _wait_for(lambda: backend.keys)
+    _wait_for(lambda: uploads.pending() == 0)
+    uploads.stop()
+    assert backend.keys == ["ev_1.jpg"]
+
+    # Done uploads are gone from disk too
+    backend.keys.clear()
+    UploadQueue(backend, db, log_callback=lambda m: None).start().stop()
+    assert backend.keys == []
+
+def test_token_bucket_caps_rate():
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    bucket = uploader.TokenBucket(100000, clock=lambda: now[0], sleep=sleep)
+    # One second of burst is free, the next 50 KB wait for half a second of refill
+    for _ in range(3):
+        bucket.consume(50000)
+    assert waits == [0.5]
+    # A request bigger than the bucket waits until it is full, then overdraws it
+    bucket.consume(250000)
+    assert waits == [0.5, 1.0]
+    # 150 KB in debt, a second passes: 1.5 s more until it is full again
+    now[0] += 1.0
+    bucket.consume(100000)
+    assert waits == [0.5, 1.0, 1.5]
@@ -0,0 +1,176 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from capturesync import uploader
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Minimal upload server: single PUTs, and resumable PUTs with Content-Range
+    (308 + Range header until complete, "bytes */total" status queries).
+    fail_next makes that many upcoming requests answer 503;
+    drop_after_chunk stores half of that chunk number and then drops the connection;
+    ignore_range stores every PUT body as the whole file (a plain PUT endpoint).
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.files = {}
+        self.connections = 0
+        self.requests = 0
+        self.fail_next = 0
+        self.drop_after_chunk = None
+        self.ignore_range = False
+        self.chunks = 0
+        self.lock = threading.Lock()
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_PUT(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.requests += 1
+            if server.fail_next:
+                server.fail_next -= 1
+                return self._reply(503)
+
+            content_range = self.headers.get("Content-Range")
+            if not content_range or server.ignore_range:
+                server.files[self.path] = body
+                return self._reply(201)
+
+            stored = server.files.setdefault(self.path, b"")
+            spec, total = content_range[len("bytes "):].split("/")
+            total = int(total)
+            if spec != "*":
+                start = int(spec.split("-")[0])
+                server.chunks += 1
+                if server.chunks == server.drop_after_chunk:
+                    server.files[self.path] = stored[:start] + body[:len(body) // 2]
+                    self.close_connection = True
+                    self.connection.close()
+                    return
+                server.files[self.path] = stored = stored[:start] + body
+            if len(stored) >= total:
+                return self._reply(200)
+            headers = {"Range": f"bytes=0-{len(stored) - 1}"} if stored else {}
+            return self._reply(308, headers)
+
+@pytest.fixture
+def server():
+    srv = StandInServer()
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+def _backend(server, **kwargs):
+    kwargs.setdefault("backoff", 0.01)
+    return uploader.HttpBackend(f"http://127.0.0.1:{server.server_address[1]}/event/", **kwargs)
+
+def _file(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(os.urandom(size))
+    return str(path)
+
+def test_uploads_reuse_pooled_connections(server, tmp_path):
+    backend = _backend(server, max_concurrency=1)
+    paths = [_file(tmp_path, f"ev_{i}.jpg", 1000) for i in range(5)]
+    for path in paths:
+        backend.upload(path, os.path.basename(path))
+    backend.close()
+
+    assert server.connections == 1
+    for path in paths:
+        with open(path, "rb") as f:
+            assert server.files[f"/event/{os.path.basename(path)}"] == f.read()
+
+def test_retries_server_errors(server, tmp_path):
+    server.fail_next = 2
+    backend = _backend(server)
+    path = _file(tmp_path, "ev_1.jpg", 1000)
+    backend.upload(path, "web/ev_1.jpg")
+
+    assert server.requests == 3
+    with open(path, "rb") as f:
+        assert server.files["/event/web/ev_1.jpg"] == f.read()
+
+def test_chunked_upload_resumes_after_dropped_connection(server, tmp_path):
+    server.drop_after_chunk = 2
+    backend = _backend(server, chunk_size=1000)
+    path = _file(tmp_path, "big.jpg", 4500)
+    backend.upload(path, "big.jpg")
+
+    with open(path, "rb") as f:
+        assert server.files["/event/big.jpg"] == f.read()
+    # 2 chunks, then resumed from the 1500 bytes the server kept: 1500-2500, 2500-3500, 3500-4500
+    assert server.chunks == 5
+
+def test_server_ignoring_content_range_gets_the_whole_file(server, tmp_path):
+    server.ignore_range = True
+    backend = _backend(server, chunk_size=1000)
+    path = _file(tmp_path, "big.jpg", 5000)
+    backend.upload(path, "big.jpg")
+
+    # The first chunk was taken as the whole file, so it is sent again in one go
+    with open(path, "rb") as f:
+        assert server.files["/event/big.jpg"] == f.read()
+    assert server.requests == 2
+
+def test_concurrent_uploads(server, tmp_path):
+    backend = _backend(server, max_concurrency=3)
+    paths = [_file(tmp_path, f"ev_{i}.jpg", 2000) for i in range(9)]
+    results = backend.upload_many([(path, os.path.basename(path)) for path in paths])
+
+    assert all(error is None for _, error in results)
+    assert len(server.files) == 9
+    assert server.connections <= 3
+
+def test_staging_is_outside_the_sync_root(tmp_path, monkeypatch):
+    # The output folder is nested in the sync root, so its parent is synced too
+    sync_root = tmp_path / "My Drive"
+    output = sync_root / "Events" / "Gala"
+    output.mkdir(parents=True)
+    (tmp_path / "app").mkdir()
+    monkeypatch.chdir(tmp_path / "app")
+    root = uploader.staging_root({"output_folder": str(output)})
+    staged = uploader.staging_path(str(output / "web" / "ev_1.jpg"), root)
+    assert not os.path.abspath(staged).startswith(str(sync_root) + os.sep)
+    with open(staged, "wb") as f:
+        f.write(b"jpeg")
+    os.makedirs(output / "web")
+    assert uploader.finalize(staged) == str(output / "web" / "ev_1.jpg")
+
+    # Leftovers of a killed run are cleaned; the folder still knows its destination
+    leftover = uploader.staging_path(str(output / "ev_2.jpg"), root)
+    open(leftover, "wb").close()
+    assert uploader.clean_staging([str(output)], root) == 1
+    assert uploader.final_path(uploader.staging_path(str(output / "ev_3.jpg"), root)) == str(output / "ev_3.jpg")
+
+def test_staging_on_another_drive_needs_a_staging_root(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    output = str(tmp_path / "Drive" / "Event")
+    # Working directory and output folder on different devices: no atomic rename
+    monkeypatch.setattr(uploader, "_device", lambda path: 1 if path.startswith(output) else 2)
+    with pytest.raises(ValueError):
+        uploader.staging_root({"output_folder": output})
+    assert uploader.staging_root({"output_folder": output, "staging_root": str(tmp_path / "stage")}) == str(tmp_path / "stage")